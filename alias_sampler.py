@@ -0,0 +1,106 @@
+import random
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Sequence, Tuple
+
+
+class AliasSampler:
+    """Взвешенный случайный выбор за O(1) (alias method, Vose).
+
+    Built once in O(n) from items and their weights; every sample() then takes
+    two random numbers instead of expanding the items into a weighted list.
+    Items with a weight <= 0 are never returned.
+    """
+
+    def __init__(self, items: Sequence, weights: Sequence[float]):
+        pairs = [(item, float(weight)) for item, weight in zip(items, weights) if weight > 0]
+        if not pairs:
+            raise ValueError("AliasSampler needs at least one item with a positive weight")
+        self.items = [item for item, _ in pairs]
+        self.total_weight = sum(weight for _, weight in pairs)
+        n = len(pairs)
+        scaled = [weight * n / self.total_weight for _, weight in pairs]
+        self.prob = [0.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Остатки равны 1 с точностью до ошибки округления
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def sample(self, rng=random):
+        i = int(rng.random() * len(self.items))
+        return self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
+
+
+class DropTables:
+    """LRU готовых alias-таблиц выпадения рыбы.
+
+    The key identifies everything the weights depend on, e.g.
+    (database path, catalog version, mode, rare_fish_chance level); versions
+    are counted per catalog, so the path keeps two databases apart. Players
+    with the same upgrade level share one table and a cast does no per-fish
+    work. build() is
+    called only on a miss and returns (items, weights); a table whose weights
+    are all <= 0 is cached as None. Sampled items are shared, copy them before
+    modifying.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, build: Callable[[], Tuple[Sequence, Sequence[float]]]) -> Optional[AliasSampler]:
+        with self._lock:
+            if key in self._tables:
+                self._tables.move_to_end(key)
+                self.hits += 1
+                return self._tables[key]
+            self.misses += 1
+        items, weights = build()
+        sampler = AliasSampler(items, weights) if any(weight > 0 for weight in weights) else None
+        with self._lock:
+            self._tables[key] = sampler
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.max_size:
+                self._tables.popitem(last=False)
+                self.evictions += 1
+        return sampler
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._tables),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        return (f"drop tables: {s['size']}/{s['max_size']}, hit rate {s['hit_rate']:.0%} "
+                f"({s['hits']} hits, {s['misses']} misses, {s['evictions']} evicted)")
+
+
+drop_tables = DropTables()
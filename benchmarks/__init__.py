@@ -0,0 +1,9 @@
+"""Микробенчмарки команд Twitch и Telegram ботов.
+
+Builds a synthetic bot_database.db in a temporary directory, runs every chat
+command against it with fake twitchio contexts and a fake TeleBot, and writes
+the timings as JSON:
+
+    python -m benchmarks --players 2000 --inventory 100000 --out results.json
+    python -m benchmarks --compare old.json new.json
+"""
@@ -0,0 +1,43 @@
+import os
+import argparse
+
+from benchmarks.runner import BenchmarkRunner, write_results, compare
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк команд Twitch и Telegram ботов")
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--inventory", type=int, default=100000)
+    parser.add_argument("--trades", type=int, default=1000)
+    parser.add_argument("--pastes", type=int, default=500)
+    parser.add_argument("--queue", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", help="where to build the synthetic database (default: temp dir)")
+    parser.add_argument("--only", nargs="*", help="case names to run, e.g. fishing tg_catch cb_view_fish")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compare(*args.compare))
+        return
+
+    out = os.path.abspath(args.out)
+    runner = BenchmarkRunner(
+        workdir=args.workdir, iterations=args.iterations, seed=args.seed,
+        players=args.players, inventory=args.inventory, trades=args.trades,
+        pastes=args.pastes, queue=args.queue
+    )
+    runner.prepare()
+    results = runner.run(args.only)
+    write_results(out, runner.metadata(), results)
+    for result in results:
+        print(f"{result['kind'][:2]}:{result['name']:<28} p50 {result['p50_ms']:8.2f} ms  "
+              f"p95 {result['p95_ms']:8.2f} ms  {result['queries_per_call']:5.1f} q/call"
+              + (f"  errors: {result['errors']}" if result['errors'] else ""))
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
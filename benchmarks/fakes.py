@@ -0,0 +1,90 @@
+import itertools
+from types import SimpleNamespace
+
+
+class FakeAuthor:
+    def __init__(self, name: str, is_mod: bool = False):
+        self.name = name
+        self.display_name = name
+        self.is_mod = is_mod
+
+
+class FakeChannel:
+    def __init__(self, name: str, sent: list):
+        self.name = name
+        self.sent = sent
+
+    async def send(self, content):
+        self.sent.append(content)
+
+
+class FakeContext:
+    """Заменяет twitchio Context: хранит всё, что команда отправила в чат"""
+
+    def __init__(self, username: str, content: str, channel: str = "perolya", is_mod: bool = False):
+        self.sent = []
+        self.author = FakeAuthor(username, is_mod)
+        self.channel = FakeChannel(channel, self.sent)
+        self.message = SimpleNamespace(content=content, author=self.author, channel=self.channel)
+        self.content = content
+        self.command = SimpleNamespace(name=content.split()[0].lstrip('!') if content else '')
+
+    async def send(self, content):
+        self.sent.append(content)
+
+    async def reply(self, content):
+        self.sent.append(content)
+
+
+class FakeTeleBot:
+    """Заменяет telebot.TeleBot: записывает исходящие вызовы вместо запросов к API.
+
+    Handler registration works like the real decorators, every other method
+    (send_message, edit_message_text, answer_callback_query, ...) is recorded
+    in calls and returns a message-like object.
+    """
+
+    _message_ids = itertools.count(1)
+
+    def __init__(self, token: str = "", *args, **kwargs):
+        self.token = token
+        self.calls = []
+        self.handlers = []
+
+    def _register(self, kind, kwargs):
+        def decorator(handler):
+            self.handlers.append((kind, kwargs, handler))
+            return handler
+        return decorator
+
+    def message_handler(self, **kwargs):
+        return self._register('message', kwargs)
+
+    def callback_query_handler(self, **kwargs):
+        return self._register('callback_query', kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            chat_id = kwargs.get('chat_id', args[0] if args else 0)
+            return fake_message(chat_id, kwargs.get('text', ''), message_id=next(self._message_ids))
+        return call
+
+
+def fake_message(chat_id: int, text: str, message_id: int = 1, username: str = "bench_user"):
+    """Объект с полями telebot.types.Message, которые читают обработчики"""
+    chat = SimpleNamespace(id=chat_id, type='private', username=username, first_name=username)
+    user = SimpleNamespace(id=chat_id, username=username, first_name=username, is_bot=False)
+    return SimpleNamespace(
+        chat=chat, from_user=user, message_id=message_id, text=text,
+        content_type='text', reply_to_message=None
+    )
+
+
+def fake_callback(chat_id: int, data: str, message_id: int = 1):
+    """Объект с полями telebot.types.CallbackQuery"""
+    message = fake_message(chat_id, "", message_id=message_id)
+    return SimpleNamespace(id=str(message_id), data=data, message=message, from_user=message.from_user)
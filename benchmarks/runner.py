@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import sqlite3
+import platform
+import tempfile
+import importlib
+import subprocess
+from datetime import datetime
+
+from benchmarks.fakes import FakeContext, FakeTeleBot, fake_message, fake_callback
+from benchmarks.synthetic import populate, player_name
+from db_stats import stats, percentile
+from write_behind import flush_all_queues
+from fish_catalog import get_fish_catalog
+from alias_sampler import drop_tables
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (имя, текст сообщения, вызов функции команды из optimized_bot)
+TWITCH_CASES = [
+    ("check_balance", "!баланс", lambda bot, ctx: bot.check_balance(ctx)),
+    ("fishing", "!рыбалка", lambda bot, ctx: bot.fishing(ctx)),
+    ("show_inventory", "!рыба", lambda bot, ctx: bot.show_inventory(ctx)),
+    ("show_inventory_page", "!рыба 3", lambda bot, ctx: bot.show_inventory(ctx, "3")),
+    ("sell_fish", "!продать 1", lambda bot, ctx: bot.sell_fish(ctx, "1")),
+    ("show_shop", "!магазин", lambda bot, ctx: bot.show_shop(ctx)),
+    ("buy_item", "!купить 1", lambda bot, ctx: bot.buy_item(ctx, "1")),
+    ("slot_machine", "!слоты 10", lambda bot, ctx: bot.slot_machine(ctx)),
+    ("daily_reward", "!ежедневка", lambda bot, ctx: bot.daily_reward(ctx)),
+    ("top_rich", "!топ", lambda bot, ctx: bot.top_rich(ctx)),
+    ("show_queue", "!очередь", lambda bot, ctx: bot.show_queue(ctx)),
+    ("join_queue", "!хочу", lambda bot, ctx: bot.join_queue(ctx)),
+    ("transfer_coins", "!перевод {other} 1", lambda bot, ctx: bot.transfer_coins(ctx)),
+    ("check_passes", "!пропуски", lambda bot, ctx: bot.check_passes(ctx)),
+    ("show_other_inventory", "!рыбка {other}", lambda bot, ctx: bot.show_other_inventory(ctx, ctx.other)),
+    ("help", "!помогите", lambda bot, ctx: bot.help_command(ctx)),
+]
+
+# Обработчики команд Telegram: (имя, метод TelegramBot, текст)
+TELEGRAM_COMMANDS = [
+    ("start", "start_command", "/start"),
+    ("fish", "fish_command", "/fish"),
+    ("catch", "fish_telegram", "/catch"),
+    ("duplicates", "duplicates_command", "/duplicates"),
+    ("balance", "balance_command", "/balance"),
+    ("info", "info_command", "/info"),
+    ("help", "help_command", "/help"),
+    ("trade", "trade_command", "/trade"),
+    ("upgrades", "upgrades_command", "/upgrades"),
+    ("pm_menu", "show_pm_menu", "/pm_menu"),
+]
+
+# Нажатия кнопок, идут через handle_callback_query
+TELEGRAM_CALLBACKS = [
+    "main_menu", "view_fish", "view_all_fish", "buy_fish", "view_duplicates", "view_balance",
+    "view_my_collection", "view_mini_collections", "view_settings", "upgrades",
+    "trademenu", "trade_view_active", "catch_fish",
+]
+
+DATA_FILES = (".json",)
+
+
+def summarize(name: str, kind: str, timings: list, queries: int, errors: list) -> dict:
+    ms = [t * 1000 for t in timings]
+    total = sum(timings)
+    return {
+        'name': name,
+        'kind': kind,
+        'iterations': len(timings),
+        'mean_ms': total * 1000 / len(timings) if timings else 0.0,
+        'min_ms': min(ms) if ms else 0.0,
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+        'max_ms': max(ms) if ms else 0.0,
+        'ops_per_sec': len(timings) / total if total else 0.0,
+        'queries_per_call': queries / len(timings) if timings else 0.0,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+    }
+
+
+class BenchmarkRunner:
+    """Готовит синтетическую базу и замеряет команды обоих ботов"""
+
+    def __init__(self, workdir: str = None, iterations: int = 200, seed: int = 1, **sizes):
+        self.workdir = workdir or tempfile.mkdtemp(prefix="bot_bench_")
+        self.iterations = iterations
+        self.seed = seed
+        self.sizes = sizes
+        self.rng = random.Random(seed)
+        self.twitch = None
+        self.telegram = None
+        self.dataset = None
+
+    def prepare(self):
+        """Copy data files, create the schema by starting both bots, fill it with data"""
+        os.makedirs(self.workdir, exist_ok=True)
+        for name in os.listdir(REPO_DIR):
+            if name.endswith(DATA_FILES):
+                shutil.copy(os.path.join(REPO_DIR, name), self.workdir)
+        # Боты открывают файлы по относительным путям
+        os.chdir(self.workdir)
+        if REPO_DIR not in sys.path:
+            sys.path.insert(0, REPO_DIR)
+
+        import telebot
+        real_telebot = telebot.TeleBot
+        telebot.TeleBot = FakeTeleBot
+        try:
+            tg_bot = importlib.import_module("tg_bot")
+            self.telegram = tg_bot.TelegramBot("benchmark", "bot_database.db")
+        finally:
+            telebot.TeleBot = real_telebot
+        self.twitch = importlib.import_module("optimized_bot")
+        self.dataset = populate("bot_database.db", seed=self.seed, **self.sizes)
+        get_fish_catalog("bot_database.db").invalidate()
+        self.twitch.db.queue.reload()
+        self.twitch.F_MODE = "normal"
+        # Один заброс за раз: без окна сборки замеряется сама обработка пачки
+        self.twitch.cast_collector.delay = 0
+
+    def _reset_cooldowns(self):
+        self.twitch.cooldowns.clear()
+
+    def _users(self):
+        players = self.dataset['players']
+        index = self.rng.randrange(players)
+        return index, player_name(index), player_name((index + 1) % players)
+
+    async def _run_twitch_case(self, name, content, call):
+        timings, errors, queries = [], [], 0
+        for _ in range(self.iterations):
+            _, username, other = self._users()
+            ctx = FakeContext(username, content.format(other=other))
+            ctx.other = other
+            self._reset_cooldowns()
+            start = time.perf_counter()
+            try:
+                with stats.track(f"bench:tw:{name}") as invocation:
+                    await call(self.twitch, ctx)
+                queries += invocation.queries
+            except Exception as e:
+                errors.append(repr(e))
+            timings.append(time.perf_counter() - start)
+        return summarize(name, "twitch", timings, queries, errors)
+
+    def _run_telegram_case(self, name, handler, make_argument):
+        timings, errors, queries = [], [], 0
+        for _ in range(self.iterations):
+            index, _, _ = self._users()
+            argument = make_argument(100000 + index)
+            start = time.perf_counter()
+            try:
+                with stats.track(f"bench:tg:{name}") as invocation:
+                    handler(argument)
+                queries += invocation.queries
+            except Exception as e:
+                errors.append(repr(e))
+            timings.append(time.perf_counter() - start)
+        return summarize(name, "telegram", timings, queries, errors)
+
+    def run(self, only: list = None) -> list:
+        results = []
+
+        def wanted(name):
+            return not only or name in only
+
+        loop = asyncio.new_event_loop()
+        try:
+            for name, content, call in TWITCH_CASES:
+                if wanted(name):
+                    results.append(loop.run_until_complete(self._run_twitch_case(name, content, call)))
+                    flush_all_queues()
+        finally:
+            loop.close()
+
+        for name, method, text in TELEGRAM_COMMANDS:
+            handler = getattr(self.telegram, method, None)
+            if handler is not None and wanted(f"tg_{name}"):
+                results.append(self._run_telegram_case(
+                    f"tg_{name}", handler, lambda chat_id, text=text: fake_message(chat_id, text)))
+                flush_all_queues()
+        for data in TELEGRAM_CALLBACKS:
+            if wanted(f"cb_{data}"):
+                results.append(self._run_telegram_case(
+                    f"cb_{data}", self.telegram.handle_callback_query,
+                    lambda chat_id, data=data: fake_callback(chat_id, data)))
+                flush_all_queues()
+        return results
+
+    def metadata(self) -> dict:
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                capture_output=True, text=True, timeout=10
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'iterations': self.iterations,
+            'dataset': self.dataset,
+            'drop_tables': drop_tables.stats(),
+        }
+
+
+def write_results(path: str, metadata: dict, results: list):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'meta': metadata, 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+def compare(old_path: str, new_path: str) -> str:
+    """Text table with p50/p95 of two result files and the new/old ratio"""
+    with open(old_path, encoding='utf-8') as f:
+        old = {(r['kind'], r['name']): r for r in json.load(f)['results']}
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)['results']
+    lines = [f"{'case':<32}{'p50 old':>10}{'p50 new':>10}{'p95 old':>10}{'p95 new':>10}{'ratio':>8}{'q/call':>8}"]
+    for result in new:
+        before = old.get((result['kind'], result['name']))
+        if before is None:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else 0.0
+        lines.append(
+            f"{result['kind'][:2] + ':' + result['name']:<32}{before['p50_ms']:>10.2f}{result['p50_ms']:>10.2f}"
+            f"{before['p95_ms']:>10.2f}{result['p95_ms']:>10.2f}{ratio:>8.2f}{result['queries_per_call']:>8.1f}"
+        )
+    return "\n".join(lines)
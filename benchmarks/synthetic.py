@@ -0,0 +1,100 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+RARITIES = {
+    # редкость: (количество рыб в каталоге, базовая цена)
+    "common": (40, 10),
+    "uncommon": (30, 25),
+    "rare": (25, 60),
+    "epic": (20, 150),
+    "legendary": (15, 400),
+    "immortal": (10, 1000),
+    "mythical": (8, 2500),
+    "arcane": (6, 6000),
+    "ultimate": (6, 20000),
+}
+
+
+def player_name(index: int) -> str:
+    return f"bench_user_{index}"
+
+
+def populate(db_path: str, players: int = 2000, inventory: int = 100000, trades: int = 1000,
+             pastes: int = 500, queue: int = 50, seed: int = 1) -> dict:
+    """Fill an initialised bot database with reproducible synthetic data.
+
+    The tables must already exist (the bots create them on start). Returns the
+    generated sizes, which are stored in the benchmark results.
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.executemany(
+        'INSERT OR REPLACE INTO players (username, balance, last_daily_reward) VALUES (?, ?, ?)',
+        ((player_name(i), rng.randint(0, 50000), None) for i in range(players))
+    )
+
+    fish = []
+    for rarity, (count, price) in RARITIES.items():
+        for n in range(count):
+            fish.append((len(fish) + 1, f"{rarity.capitalize()} fish {n}", 'fish', price, rarity,
+                         1 if rarity == 'ultimate' else 0, 0, f"Synthetic {rarity} fish"))
+    cursor.executemany('''
+        INSERT OR REPLACE INTO items (id, name, type, base_price, rarity, is_unique, is_caught, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', fish)
+    common_fish = [f for f in fish if f[4] != 'ultimate']
+
+    def inventory_rows():
+        for _ in range(inventory):
+            item = rng.choice(common_fish)
+            obtained = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+            yield (player_name(rng.randrange(players)), 'fish', item[0], item[1], item[4], item[3],
+                   obtained.isoformat(), str({}))
+    cursor.executemany('''
+        INSERT INTO inventory (username, item_type, item_id, item_name, rarity, value, obtained_at, metadata)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', inventory_rows())
+
+    # Каждый игрок привязан к Telegram: chat_id = 100000 + номер игрока
+    cursor.executemany(
+        'INSERT OR REPLACE INTO telegram_users (chat_id, link_code, twitch_username) VALUES (?, NULL, ?)',
+        ((100000 + i, player_name(i)) for i in range(players))
+    )
+    cursor.executemany(
+        'INSERT OR REPLACE INTO upgrades (twitch_username, double_catch_chance, rare_fish_chance, '
+        'fishing_cooldown_reduction, shop_discount, sale_price_increase, points_balance) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((player_name(i), rng.randint(0, 300), rng.randint(0, 50), rng.randint(0, 500),
+          rng.randint(0, 1000), rng.randint(0, 500), rng.randint(0, 1000)) for i in range(0, players, 2))
+    )
+
+    cursor.execute('SELECT id, username FROM inventory ORDER BY RANDOM() LIMIT ?', (trades,))
+    offered = cursor.fetchall()
+    cursor.executemany('''
+        INSERT INTO trades (creator_username, offered_fish_id, offered_coins, requested_fish_id,
+                            requested_coins, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', ((username, inventory_id, rng.choice((0, 0, 100)), rng.choice(common_fish)[0], rng.choice((0, 50)),
+           rng.choice(('active', 'active', 'completed', 'cancelled')),
+           (now - timedelta(hours=rng.randint(0, 24 * 30))).isoformat()) for inventory_id, username in offered))
+
+    cursor.executemany(
+        'INSERT OR IGNORE INTO pastes (name, text, approved) VALUES (?, ?, 1)',
+        ((f"паста {i}", " ".join(rng.choice(("рыба", "лонли", "очередь", "стрим", "LC")) for _ in range(40)))
+         for i in range(pastes))
+    )
+
+    cursor.executemany(
+        'INSERT INTO queue (username, number, timestamp) VALUES (?, ?, ?)',
+        ((player_name(i), str(i + 1), (now - timedelta(minutes=queue - i)).isoformat()) for i in range(queue))
+    )
+
+    conn.commit()
+    conn.close()
+    return {
+        'players': players, 'inventory': inventory, 'trades': len(offered),
+        'pastes': pastes, 'queue': queue, 'fish': len(fish), 'seed': seed,
+    }
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+class CastCollector:
+    """Собирает забросы, пришедшие за короткое окно, и обрабатывает их пачкой.
+
+    The first submit() starts a timer of delay seconds; everything submitted
+    until it fires is passed to resolve() in one call, and the (request, result)
+    pairs are then handed to publish() so it can answer with a few combined
+    chat messages. submit() returns the result of its own request.
+    """
+
+    def __init__(self, resolve: Callable[[list], Awaitable[list]],
+                 publish: Callable[[list], Awaitable[None]],
+                 delay: float = 0.25, max_batch: int = 100):
+        self.resolve = resolve
+        self.publish = publish
+        self.delay = delay
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self.batches = 0
+        self.casts = 0
+
+    async def submit(self, request):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((request, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self._flush_now)
+        return await future
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._process(batch))
+
+    async def _process(self, batch: List[tuple]):
+        requests = [request for request, _ in batch]
+        try:
+            results = await self.resolve(requests)
+        except Exception as e:
+            logger.exception("Error resolving a batch of casts")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.casts += len(batch)
+        try:
+            await self.publish(list(zip(requests, results)))
+        except Exception:
+            logger.exception("Error publishing a batch of casts")
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'casts': self.casts,
+            'avg_batch': self.casts / self.batches if self.batches else 0.0,
+        }
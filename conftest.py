@@ -0,0 +1,98 @@
+import sqlite3
+import pytest
+from migrations import run_migrations
+
+# Таблицы, которые в работе создают боты при старте (Database._init_tables и модули Telegram)
+SCHEMA = '''
+    CREATE TABLE players (
+        username TEXT PRIMARY KEY,
+        balance INTEGER DEFAULT 0,
+        last_daily_reward INTEGER,
+        last_played DATETIME
+    );
+    CREATE TABLE inventory (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        item_type TEXT CHECK(item_type IN ('fish', 'item')),
+        item_id INTEGER,
+        item_name TEXT,
+        rarity TEXT,
+        value INTEGER,
+        obtained_at DATETIME,
+        metadata TEXT
+    );
+    CREATE TABLE items (
+        id INTEGER PRIMARY KEY,
+        name TEXT,
+        type TEXT CHECK(type IN ('fish', 'item')),
+        base_price INTEGER,
+        rarity TEXT,
+        is_unique INTEGER DEFAULT 0,
+        is_caught INTEGER DEFAULT 0,
+        description TEXT
+    );
+    CREATE TABLE queue (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        number TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE queue_passes (
+        username TEXT PRIMARY KEY,
+        passes INTEGER DEFAULT 0
+    );
+    CREATE TABLE cooldowns (
+        username TEXT PRIMARY KEY,
+        last_used INTEGER
+    );
+    CREATE TABLE upgrades (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        twitch_username TEXT UNIQUE NOT NULL,
+        double_catch_chance INTEGER DEFAULT 0,
+        rare_fish_chance INTEGER DEFAULT 0,
+        fishing_cooldown_reduction INTEGER DEFAULT 0,
+        shop_discount INTEGER DEFAULT 0,
+        sale_price_increase INTEGER DEFAULT 0,
+        points_balance INTEGER DEFAULT 0
+    );
+    CREATE TABLE trades (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        creator_username TEXT NOT NULL,
+        offered_fish_id INTEGER,
+        offered_coins INTEGER DEFAULT 0,
+        requested_fish_id INTEGER,
+        requested_coins INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        completed_at TIMESTAMP NULL,
+        responder_username TEXT NULL
+    );
+'''
+
+
+@pytest.fixture
+def baseline_path(tmp_path):
+    """Bot database as the bots create it, before any migration: alice (100 LC), bob (50 LC)"""
+    path = str(tmp_path / 'bot_database.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany('INSERT INTO players (username, balance) VALUES (?, ?)', [('alice', 100), ('bob', 50)])
+    conn.execute("INSERT INTO items (id, name, type, base_price, rarity) VALUES (1, 'Карась', 'fish', 10, 'common')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def db_path(baseline_path):
+    """Fresh migrated bot database"""
+    run_migrations(baseline_path)
+    return baseline_path
+
+
+@pytest.fixture
+def raw(db_path):
+    """Separate plain connection for checking what was committed"""
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
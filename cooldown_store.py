@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import heapq
+import atexit
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+COOLDOWNS_FILE = 'cooldowns.json'
+
+
+class CooldownStore:
+    """Кулдауны команд: namespace ("fishing", "slots", ...) -> username -> время окончания.
+
+    check and set are dict operations; a min-heap of expiry times lets every
+    write evict the entries that already ran out, so the store only holds
+    viewers whose cooldown is still active. Expiry times are wall clock
+    (time.time()) and the live entries are saved to a compact JSON snapshot
+    every snapshot_interval seconds and on exit, so a restart keeps them.
+    """
+
+    def __init__(self, path: Optional[str] = COOLDOWNS_FILE, snapshot_interval: float = 30.0):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self._expires = {}
+        self._heap = []
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._dirty = False
+        self._closed = False
+        self._thread = None
+        self.evictions = 0
+        self.snapshots = 0
+        self._load()
+
+    def remaining(self, namespace: str, key: str, now: float = None) -> float:
+        """Seconds left on the cooldown, 0 when it is not active"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expires_at = self._expires.get((namespace, key))
+        if expires_at is None or expires_at <= now:
+            return 0.0
+        return expires_at - now
+
+    def active(self, namespace: str, key: str) -> bool:
+        return self.remaining(namespace, key) > 0
+
+    def set(self, namespace: str, key: str, seconds: float, now: float = None):
+        """Start a cooldown of seconds for key"""
+        now = time.time() if now is None else now
+        expires_at = now + seconds
+        with self._cond:
+            self._expires[(namespace, key)] = expires_at
+            heapq.heappush(self._heap, (expires_at, namespace, key))
+            self._evict(now)
+            self._mark_dirty()
+
+    def clear(self, namespace: str = None, key: str = None):
+        """Drop one cooldown, every cooldown of a namespace or everything"""
+        with self._cond:
+            if namespace is None:
+                self._expires.clear()
+                self._heap.clear()
+            elif key is None:
+                self._expires = {k: v for k, v in self._expires.items() if k[0] != namespace}
+                self._rebuild_heap()
+            else:
+                self._expires.pop((namespace, key), None)
+            self._mark_dirty()
+
+    def _evict(self, now: float):
+        # Записи кучи, чей ключ перезаписан или удален, просто пропускаются
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires_at, namespace, key = heapq.heappop(heap)
+            if self._expires.get((namespace, key)) == expires_at:
+                del self._expires[(namespace, key)]
+                self.evictions += 1
+        if len(heap) > 2 * len(self._expires) + 64:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [(expires_at, namespace, key) for (namespace, key), expires_at in self._expires.items()]
+        heapq.heapify(self._heap)
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self.path and self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="cooldown-snapshot", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # close() мог уведомить до того, как поток дошел до wait
+                if not self._closed:
+                    self._cond.wait(self.snapshot_interval)
+                if self._closed:
+                    return
+            self.save()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading cooldowns from {self.path}: {e}")
+            return
+        now = time.time()
+        try:
+            for namespace, entries in data.get('cooldowns', {}).items():
+                for key, expires_at in entries.items():
+                    if expires_at > now:
+                        self._expires[(namespace, key)] = float(expires_at)
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.error(f"Broken cooldown snapshot {self.path}: {e}")
+        self._rebuild_heap()
+
+    def save(self) -> bool:
+        """Write the live cooldowns to path if anything changed since the last snapshot"""
+        if not self.path:
+            return False
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._evict(time.time())
+            cooldowns = {}
+            for (namespace, key), expires_at in self._expires.items():
+                cooldowns.setdefault(namespace, {})[key] = round(expires_at, 1)
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'saved_at': round(time.time(), 1), 'cooldowns': cooldowns}, f,
+                          ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Error saving cooldowns to {self.path}: {e}")
+            with self._lock:
+                self._dirty = True
+            return False
+        self.snapshots += 1
+        return True
+
+    def close(self):
+        """Stop the snapshot thread and write the final snapshot"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(5.0)
+        self.save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._evict(time.time())
+            namespaces = {}
+            for namespace, _ in self._expires:
+                namespaces[namespace] = namespaces.get(namespace, 0) + 1
+            return {
+                'size': len(self._expires),
+                'heap': len(self._heap),
+                'namespaces': namespaces,
+                'evictions': self.evictions,
+                'snapshots': self.snapshots,
+            }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        namespaces = ", ".join(f"{name} {count}" for name, count in sorted(stats['namespaces'].items()))
+        return f"cooldowns: {stats['size']}" + (f" ({namespaces})" if namespaces else "")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_cooldown_store(path: str = COOLDOWNS_FILE) -> CooldownStore:
+    """Shared cooldown store for a snapshot file"""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = CooldownStore(path)
+            _stores[path] = store
+        return store
+
+
+def close_all_stores():
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.close()
+
+
+atexit.register(close_all_stores)
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """Асинхронный фасад над Database для обработчиков twitchio.
+
+    Every call runs on a dedicated DB worker thread, so a slow query or a lock
+    held by another thread does not stall the event loop. Methods of the wrapped
+    object are exposed as coroutines: ``await adb.get_balance(name)``.
+    """
+
+    def __init__(self, database, workers: int = 1, timeout: float = 5.0):
+        self.database = database
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-worker")
+
+    async def run(self, func, *args, timeout: float = None, **kwargs):
+        """Run any blocking function on the DB worker and await its result.
+
+        Raises asyncio.TimeoutError when the call takes longer than timeout seconds.
+        The caller's context is copied, so queries are attributed to its command.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(self._executor, functools.partial(context.run, func, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout if timeout is not None else self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"DB call {getattr(func, '__name__', func)} timed out after {timeout or self.timeout}s")
+            raise
+
+    def __getattr__(self, name):
+        attr = getattr(self.database, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, timeout: float = None, **kwargs):
+            return await self.run(attr, *args, timeout=timeout, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker thread"""
+        self._executor.shutdown(wait=wait)
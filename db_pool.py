@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from db_stats import TracedConnection
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """Пул соединений SQLite: одно долгоживущее соединение на поток"""
+
+    def __init__(self, db_path: str = 'bot_database.db', busy_timeout: int = 5000, cached_statements: int = 256):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        """Open a new connection with WAL and busy_timeout"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=TracedConnection
+        )
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+        except sqlite3.Error as e:
+            logger.error(f"Error configuring connection to {self.db_path}: {e}")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Return the connection owned by the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def borrow(self):
+        """Connection of the current thread for a single statement or read.
+
+        A transaction that was already open when the block started belongs to
+        the caller and is left alone; only one started inside the block and
+        left unfinished is rolled back on exit.
+        """
+        conn = self.get_connection()
+        outer = conn.in_transaction
+        try:
+            yield conn
+        finally:
+            if not outer:
+                self.release(conn)
+
+    def release(self, conn: sqlite3.Connection = None):
+        """Return the connection to the pool, rolling back an unfinished transaction"""
+        conn = conn or getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.error(f"Error releasing connection to {self.db_path}: {e}")
+
+    def close_all(self):
+        """Close every connection opened by the pool"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing connection to {self.db_path}: {e}")
+        self._local = threading.local()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str = 'bot_database.db') -> ConnectionPool:
+    """Shared pool for a database file"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ConnectionPool(db_path)
+            _pools[db_path] = pool
+        return pool
+
+
+def close_all_pools():
+    """Close connections of every pool"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
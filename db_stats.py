@@ -0,0 +1,244 @@
+import re
+import math
+import time
+import sqlite3
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Команда Twitch или обработчик Telegram, от имени которого идут запросы
+_current = contextvars.ContextVar('db_stats_invocation', default=None)
+
+_SPACES = re.compile(r'\s+')
+
+
+def percentile(samples, p: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class _Invocation:
+    __slots__ = ('command', 'queries', 'rows', 'seconds')
+
+    def __init__(self, command: str):
+        self.command = command
+        self.queries = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+
+class _CommandStats:
+    __slots__ = ('invocations', 'queries', 'rows', 'seconds', 'max_queries', 'samples')
+
+    def __init__(self, window: int):
+        self.invocations = 0
+        self.queries = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.max_queries = 0
+        self.samples = deque(maxlen=window)
+
+
+class DBStats:
+    """Статистика запросов к SQLite по командам.
+
+    Every statement run on a traced connection is timed and attributed to the
+    command that is active in the current context. Latency percentiles are
+    computed over the DB time of the last `window` invocations of a command.
+    Statements run outside of a command are grouped under "bg:<thread name>".
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.enabled = True
+        self._commands = {}
+        self._statements = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def _command(self, name: str) -> _CommandStats:
+        entry = self._commands.get(name)
+        if entry is None:
+            entry = _CommandStats(self.window)
+            self._commands[name] = entry
+        return entry
+
+    @contextmanager
+    def track(self, command: str):
+        """Attribute every query made inside the block to command"""
+        invocation = _Invocation(command)
+        token = _current.set(invocation)
+        try:
+            yield invocation
+        finally:
+            _current.reset(token)
+            self.finish(invocation)
+
+    def begin(self, command: str):
+        """Start tracking a command, for before/after hooks that cannot use a with block"""
+        _current.set(_Invocation(command))
+
+    def end(self):
+        invocation = _current.get()
+        if invocation is not None:
+            _current.set(None)
+            self.finish(invocation)
+
+    def finish(self, invocation: _Invocation):
+        with self._lock:
+            entry = self._command(invocation.command)
+            entry.invocations += 1
+            entry.max_queries = max(entry.max_queries, invocation.queries)
+            entry.samples.append(invocation.seconds)
+
+    def record(self, sql: str, seconds: float, rows: int = 0, statement: bool = True):
+        """Account one execute (statement=True) or fetch of a traced cursor"""
+        if not self.enabled:
+            return
+        invocation = _current.get()
+        if invocation is not None:
+            invocation.seconds += seconds
+            invocation.rows += rows
+            if statement:
+                invocation.queries += 1
+            command = invocation.command
+        else:
+            command = f"bg:{threading.current_thread().name}"
+        key = _SPACES.sub(' ', sql).strip()[:160]
+        with self._lock:
+            entry = self._command(command)
+            entry.seconds += seconds
+            entry.rows += rows
+            if statement:
+                entry.queries += 1
+            if invocation is None:
+                entry.samples.append(seconds)
+            totals = self._statements.get(key)
+            if totals is None:
+                totals = self._statements[key] = [0, 0.0, 0.0]
+            if statement:
+                totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+
+    def report(self) -> list:
+        """Per-command stats sorted by total DB time, times in milliseconds"""
+        with self._lock:
+            items = [(name, entry, list(entry.samples)) for name, entry in self._commands.items()]
+        result = []
+        for name, entry, samples in items:
+            calls = entry.invocations or len(samples)
+            result.append({
+                'command': name,
+                'calls': calls,
+                'queries': entry.queries,
+                'queries_per_call': entry.queries / calls if calls else 0.0,
+                'max_queries': entry.max_queries,
+                'rows': entry.rows,
+                'total_ms': entry.seconds * 1000,
+                'p50_ms': percentile(samples, 50) * 1000,
+                'p95_ms': percentile(samples, 95) * 1000,
+                'p99_ms': percentile(samples, 99) * 1000,
+            })
+        result.sort(key=lambda item: item['total_ms'], reverse=True)
+        return result
+
+    def top_statements(self, limit: int = 10) -> list:
+        """(sql, count, total_ms, max_ms) of the most expensive statements"""
+        with self._lock:
+            items = [(sql, count, total * 1000, worst * 1000) for sql, (count, total, worst) in self._statements.items()]
+        items.sort(key=lambda item: item[2], reverse=True)
+        return items[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._commands.clear()
+            self._statements.clear()
+            self.started_at = time.time()
+
+    def format_line(self, item: dict) -> str:
+        return (
+            f"{item['command']}: {item['calls']}x, {item['queries_per_call']:.1f} q/call "
+            f"(max {item['max_queries']}), p50 {item['p50_ms']:.1f} / p95 {item['p95_ms']:.1f} / "
+            f"p99 {item['p99_ms']:.1f} ms"
+        )
+
+
+stats = DBStats()
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that reports execute and fetch time to stats"""
+
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            stats.record(sql, time.perf_counter() - start, max(self.rowcount, 0))
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = sql
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            stats.record(sql, time.perf_counter() - start, max(self.rowcount, 0))
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def _fetched(self, seconds: float, rows: int):
+        if self.description is not None:
+            stats.record(getattr(self, '_sql', '') or 'fetch', seconds, rows, statement=False)
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors are timed by stats"""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def tracked(name):
+    """Decorator: attribute DB work of a handler to name.
+
+    name may be a string or a function that builds the name from the handler
+    arguments, e.g. from the callback data of a Telegram button.
+    """
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            command = name(*args, **kwargs) if callable(name) else name
+            with stats.track(command):
+                return func(*args, **kwargs)
+        wrapper.__name__ = getattr(func, '__name__', 'handler')
+        wrapper.__doc__ = getattr(func, '__doc__', None)
+        return wrapper
+    return decorator
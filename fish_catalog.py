@@ -0,0 +1,120 @@
+import time
+import sqlite3
+import logging
+import threading
+from typing import NamedTuple, Optional, Tuple
+from db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+
+class FishRecord(NamedTuple):
+    """Рыба из таблицы items, поля в порядке колонок (fish[4] - rarity, fish[6] - is_caught)"""
+    id: int
+    name: str
+    type: str
+    base_price: int
+    rarity: str
+    is_unique: int
+    is_caught: int
+    description: Optional[str]
+
+
+class CatalogSnapshot(NamedTuple):
+    db_path: str
+    version: int
+    fish: Tuple[FishRecord, ...]
+    by_id: dict
+
+
+class FishCatalog:
+    """Каталог рыбы в памяти с номером версии.
+
+    Readers get an immutable snapshot without touching SQLite. Writes made by
+    this process call invalidate(), the snapshot is then reloaded on the next
+    read and the version grows. Changes made by other processes (the admin UIs)
+    bump catalog_version through triggers on items, which is polled at most
+    every check_interval seconds.
+    """
+
+    def __init__(self, db_path: str = 'bot_database.db', check_interval: float = 5.0):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self.pool = get_pool(db_path)
+        self._snapshot = None
+        self._version = 0
+        self._db_version = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self.snapshot().version
+
+    def invalidate(self):
+        """Call after changing items, the next read reloads the catalog"""
+        with self._lock:
+            self._stale = True
+
+    def snapshot(self) -> CatalogSnapshot:
+        with self._lock:
+            if not self._stale and time.monotonic() - self._checked_at >= self.check_interval:
+                self._checked_at = time.monotonic()
+                if self._read_db_version() != self._db_version:
+                    self._stale = True
+            if self._stale or self._snapshot is None:
+                self._reload()
+            return self._snapshot
+
+    def fish(self) -> Tuple[FishRecord, ...]:
+        return self.snapshot().fish
+
+    def get(self, fish_id) -> Optional[FishRecord]:
+        try:
+            return self.snapshot().by_id.get(int(fish_id))
+        except (TypeError, ValueError):
+            return None
+
+    def _read_db_version(self):
+        with self.pool.borrow() as conn:
+            try:
+                row = conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()
+                return row[0] if row else None
+            except sqlite3.Error:
+                # Миграция с триггерами ещё не применена
+                return None
+
+    def _reload(self):
+        db_version = self._read_db_version()
+        with self.pool.borrow() as conn:
+            try:
+                rows = conn.execute('''
+                    SELECT id, name, type, base_price, rarity, is_unique, is_caught, description
+                    FROM items WHERE type = 'fish' ORDER BY id
+                ''').fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"Error loading fish catalog: {e}")
+                if self._snapshot is None:
+                    self._snapshot = CatalogSnapshot(self.db_path, self._version, (), {})
+                return
+        fish = tuple(FishRecord(*row) for row in rows)
+        self._version += 1
+        self._snapshot = CatalogSnapshot(self.db_path, self._version, fish, {record.id: record for record in fish})
+        self._db_version = db_version
+        self._checked_at = time.monotonic()
+        self._stale = False
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_fish_catalog(db_path: str = 'bot_database.db') -> FishCatalog:
+    """Shared fish catalog for a database file"""
+    with _catalogs_lock:
+        catalog = _catalogs.get(db_path)
+        if catalog is None:
+            catalog = FishCatalog(db_path)
+            _catalogs[db_path] = catalog
+        return catalog
@@ -0,0 +1,277 @@
+"""Общий движок рыбалки для Twitch и Telegram ботов.
+
+The drop configuration of every mode lives here and its derived tables (drop
+chances, alias samplers) are computed once; both bots call
+FishingEngine.cast() and only format the returned CastResult.
+"""
+import random
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import List, NamedTuple, Optional
+
+from alias_sampler import AliasSampler, drop_tables
+from fish_catalog import FishRecord
+from repository import Repository
+
+logger = logging.getLogger(__name__)
+
+RARITIES = ("common", "uncommon", "rare", "epic", "legendary", "immortal", "mythical", "arcane", "ultimate")
+
+RARITY_NAMES_RU = {
+    "common": "Обычная",
+    "uncommon": "Необычная",
+    "rare": "Редкая",
+    "epic": "Эпическая",
+    "legendary": "Легендарная",
+    "immortal": "Бессмертная",
+    "mythical": "Мифическая",
+    "arcane": "Волшебная",
+    "ultimate": "Ультимативная"
+}
+
+CURRENCY_NAME = "LC"  # Lonely Coins
+
+
+@dataclass(frozen=True)
+class FishingMode:
+    """Настройки выпадения одного режима рыбалки.
+
+    weights are per rarity and every fish of that rarity gets the weight;
+    multipliers scale base_price of non-ultimate fish. With upgrades the
+    player's rare_fish_chance level is added to every weight and
+    double_catch_chance gives bonus fish.
+    """
+    name: str
+    weights: dict
+    cooldown: int
+    multipliers: dict = field(default_factory=dict)
+    default_weight: int = 0
+    upgrades: bool = False
+    # Пойманная рыба любой редкости не выпадает (иначе только ultimate)
+    skip_caught: bool = False
+    # Если у всех рыб вес 0, выдать случайную рыбу из каталога
+    fallback_to_any: bool = False
+    drop_chances: dict = field(init=False, repr=False)
+
+    def __post_init__(self):
+        total = sum(self.weights.values())
+        object.__setattr__(self, 'drop_chances', {
+            rarity: {'weight': weight, 'chance': weight / total * 100 if total else 0.0}
+            for rarity, weight in self.weights.items()
+        })
+
+    def is_available(self, fish: FishRecord) -> bool:
+        if self.skip_caught:
+            return fish.is_caught != 1
+        return not (fish.rarity == "ultimate" and fish.is_caught)
+
+    def weight(self, fish: FishRecord, rare_level: int = 0) -> float:
+        return self.weights.get(fish.rarity or "common", self.default_weight) + (rare_level if self.upgrades else 0)
+
+    def value(self, fish: FishRecord) -> int:
+        if fish.rarity == "ultimate":
+            return fish.base_price
+        return int(fish.base_price * self.multipliers.get(fish.rarity, 1.0))
+
+
+MODES = {
+    # Twitch !рыбалка во время окна рыбалки
+    "limited": FishingMode(
+        name="limited",
+        weights={
+            "common": 3000,
+            "uncommon": 2500,
+            "rare": 2000,
+            "epic": 1500,
+            "legendary": 800,
+            "immortal": 200,
+            "mythical": 100,
+            "arcane": 50,
+            "ultimate": 10
+        },
+        multipliers={
+            "common": 6.0,
+            "uncommon": 5.5,
+            "rare": 4.5,
+            "epic": 3.0,
+            "legendary": 2.0,
+            "immortal": 1.7,
+            "mythical": 1.5,
+            "arcane": 1.4,
+            "ultimate": 1.0
+        },
+        cooldown=300,
+    ),
+    # Twitch !рыбалка в постоянном режиме
+    "normal": FishingMode(
+        name="normal",
+        weights={
+            "common": 6000,
+            "uncommon": 3000,
+            "rare": 1500,
+            "epic": 400,
+            "legendary": 50,
+            "immortal": 5,
+            "mythical": 3,
+            "arcane": 2,
+            "ultimate": 1
+        },
+        cooldown=300,
+    ),
+    # Telegram /catch, действуют прокачки
+    "telegram": FishingMode(
+        name="telegram",
+        weights={
+            "common": 3000,
+            "uncommon": 2500,
+            "rare": 2000,
+            "epic": 1500,
+            "legendary": 800,
+            "immortal": 200,
+            "mythical": 100,
+            "arcane": 50,
+            "ultimate": 10
+        },
+        cooldown=3600,
+        default_weight=1,
+        upgrades=True,
+        skip_caught=True,
+        fallback_to_any=True,
+    ),
+}
+
+
+class Catch(NamedTuple):
+    fish: FishRecord
+    value: int
+
+    @property
+    def rarity_name(self) -> str:
+        return RARITY_NAMES_RU.get(self.fish.rarity, self.fish.rarity)
+
+
+class CastResult(NamedTuple):
+    mode: str
+    catches: List[Catch]
+    # Сколько рыб выпало, включая уникальные, которые успел поймать кто-то другой
+    rolled: int
+
+    @property
+    def total_value(self) -> int:
+        return sum(catch.value for catch in self.catches)
+
+
+class FishingEngine:
+    """Забросы для обоих ботов: выбор рыбы, бонусный улов и запись в инвентарь"""
+
+    def __init__(self, db_path: str = 'bot_database.db'):
+        self.repo = Repository(db_path)
+        self.modes = MODES
+
+    def mode(self, name: str) -> FishingMode:
+        return self.modes[name]
+
+    def sampler(self, mode: str, rare_level: int = 0, catalog=None) -> Optional[AliasSampler]:
+        """Alias table of a mode, shared by every player with the same rare_fish_chance level"""
+        config = self.modes[mode]
+        catalog = catalog or self.repo.catalog.snapshot()
+        level = rare_level if config.upgrades else 0
+
+        def build():
+            available = [fish for fish in catalog.fish if config.is_available(fish)]
+            return available, [config.weight(fish, level) for fish in available]
+
+        return drop_tables.get((catalog.db_path, catalog.version, mode, level), build)
+
+    def roll(self, mode: str, rare_level: int = 0, catalog=None, rng=random) -> Optional[FishRecord]:
+        """One random fish, None when nothing can be caught"""
+        catalog = catalog or self.repo.catalog.snapshot()
+        sampler = self.sampler(mode, rare_level, catalog)
+        if sampler is not None:
+            return sampler.sample(rng)
+        if self.modes[mode].fallback_to_any and catalog.fish:
+            return rng.choice(catalog.fish)
+        return None
+
+    @staticmethod
+    def bonus_rolls(double_level: int, rng=random) -> int:
+        """Бонусные рыбы от double_catch_chance: до 4 попыток, 1 лвл = 0.1%, уровень -1 за попытку"""
+        bonus = 0
+        for _ in range(4):
+            if rng.random() < double_level * 0.001:
+                bonus += 1
+            double_level -= 1
+            if double_level <= 0:
+                break
+        return bonus
+
+    def roll_cast(self, username: str, mode: str, n: int = 1, catalog=None, rng=random) -> List[FishRecord]:
+        """Fish of n casts without writing them; a unique fish is rolled at most once"""
+        config = self.modes[mode]
+        rare_level = double_level = 0
+        if config.upgrades:
+            upgrades = self.repo.get_upgrades(username)
+            if upgrades:
+                rare_level = upgrades['rare_fish_chance'] or 0
+                double_level = upgrades['double_catch_chance'] or 0
+        catalog = catalog or self.repo.catalog.snapshot()
+
+        rolls = n
+        if config.upgrades:
+            rolls += sum(self.bonus_rolls(double_level, rng) for _ in range(n))
+        fish = []
+        for _ in range(rolls):
+            for _ in range(3):
+                record = self.roll(mode, rare_level, catalog, rng)
+                if record is None or record.rarity != "ultimate" or record not in fish:
+                    break
+            else:
+                continue
+            if record is not None:
+                fish.append(record)
+        return fish
+
+    def cast(self, username: str, mode: str, n: int = 1, metadata: str = None) -> Optional[CastResult]:
+        """Roll n casts and store the catch in one transaction.
+
+        Returns None on a database error; catches is empty when the lake is
+        empty or the rolled unique fish was caught by someone else first.
+        """
+        return self.cast_batch([(username, mode, n)], metadata)[0]
+
+    def cast_batch(self, casts: list, metadata: str = None) -> List[Optional[CastResult]]:
+        """Casts of many players, (username, mode) or (username, mode, n) each.
+
+        All of them are rolled against one catalog snapshot and written in one
+        transaction; results are in the order of casts.
+        """
+        catalog = self.repo.catalog.snapshot()
+        rolled = []
+        for username, mode, *rest in casts:
+            config = self.modes[mode]
+            fish = self.roll_cast(username, mode, rest[0] if rest else 1, catalog)
+            rolled.append((username, [(record, config.value(record)) for record in fish]))
+        added = self.repo.add_catches([(username, catches) for username, catches in rolled if catches], metadata)
+        if added is None:
+            return [None] * len(casts)
+        added = iter(added)
+        results = []
+        for (username, mode, *_), (_, catches) in zip(casts, rolled):
+            user_added = next(added) if catches else []
+            results.append(CastResult(mode, [Catch(record, value) for record, value in user_added], len(catches)))
+        return results
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_fishing_engine(db_path: str = 'bot_database.db') -> FishingEngine:
+    """Shared engine for a database file"""
+    with _engines_lock:
+        engine = _engines.get(db_path)
+        if engine is None:
+            engine = FishingEngine(db_path)
+            _engines[db_path] = engine
+        return engine
@@ -0,0 +1,144 @@
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_FILE = 'fishing_schedule.json'
+DEFAULT_SCHEDULE = {
+    # Окно открывается каждые interval_minutes начиная с offset_minutes от полуночи
+    'window_minutes': 7,
+    'interval_minutes': 60,
+    'offset_minutes': 0,
+    # День недели (0 - понедельник) -> те же ключи и "enabled": false для выходного
+    'weekdays': {},
+    # Разовые окна: {"start": "2026-10-20T18:00", "end": "2026-10-20T19:00", "title": "..."}
+    'events': [],
+}
+
+
+class FishingWindow(NamedTuple):
+    start: datetime
+    end: datetime
+    title: Optional[str] = None
+
+    @property
+    def minutes(self) -> int:
+        return int((self.end - self.start).total_seconds() // 60)
+
+
+class FishingSchedule:
+    """Расписание окон рыбалки для режима limited.
+
+    Regular windows repeat every interval_minutes within a day and can be
+    changed or disabled per weekday; one-off event windows are added on top and
+    overlapping windows are merged. Times are local, like datetime.now().
+    """
+
+    def __init__(self, config: dict = None):
+        config = {**DEFAULT_SCHEDULE, **(config or {})}
+        self.window = timedelta(minutes=config['window_minutes'])
+        self.interval = timedelta(minutes=config['interval_minutes'])
+        self.offset = timedelta(minutes=config['offset_minutes'])
+        self.weekdays = {int(day): rules for day, rules in config['weekdays'].items()}
+        self.events = [
+            FishingWindow(datetime.fromisoformat(event['start']), datetime.fromisoformat(event['end']),
+                          event.get('title'))
+            for event in config['events']
+        ]
+        if self.interval <= timedelta(0) or self.window <= timedelta(0):
+            raise ValueError("window_minutes and interval_minutes must be positive")
+
+    @classmethod
+    def load(cls, path: str = SCHEDULE_FILE) -> 'FishingSchedule':
+        """Schedule from a JSON file, the default one when the file is missing or broken"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls()
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            logger.error(f"Error loading {path}, using the default fishing schedule: {e}")
+            return cls()
+
+    def _day_windows(self, day: datetime) -> List[FishingWindow]:
+        rules = self.weekdays.get(day.weekday(), {})
+        if not rules.get('enabled', True):
+            return []
+        window = timedelta(minutes=rules['window_minutes']) if 'window_minutes' in rules else self.window
+        interval = timedelta(minutes=rules['interval_minutes']) if 'interval_minutes' in rules else self.interval
+        start = day + (timedelta(minutes=rules['offset_minutes']) if 'offset_minutes' in rules else self.offset)
+        end_of_day = day + timedelta(days=1)
+        windows = []
+        while start < end_of_day:
+            windows.append(FishingWindow(start, start + window))
+            start += interval
+        return windows
+
+    def windows(self, since: datetime, until: datetime) -> List[FishingWindow]:
+        """Merged windows that end after since and start before until"""
+        day = since.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        candidates = list(self.events)
+        while day < until:
+            candidates.extend(self._day_windows(day))
+            day += timedelta(days=1)
+        merged = []
+        for window in sorted(candidates, key=lambda w: (w.start, w.end)):
+            if merged and window.start <= merged[-1].end:
+                last = merged[-1]
+                if window.end > last.end or (window.title and not last.title):
+                    merged[-1] = FishingWindow(last.start, max(last.end, window.end), last.title or window.title)
+            else:
+                merged.append(window)
+        return [window for window in merged if window.end > since and window.start < until]
+
+    def current_window(self, now: datetime = None) -> Optional[FishingWindow]:
+        now = now or datetime.now()
+        for window in self.windows(now, now + timedelta(seconds=1)):
+            if window.start <= now < window.end:
+                return window
+        return None
+
+    def upcoming(self, now: datetime = None, count: int = 5, days: int = 8) -> List[FishingWindow]:
+        """The current window (if open) and the next ones"""
+        now = now or datetime.now()
+        return self.windows(now, now + timedelta(days=days))[:count]
+
+    def next_window(self, now: datetime = None) -> Optional[FishingWindow]:
+        now = now or datetime.now()
+        for window in self.upcoming(now, count=2):
+            if window.start > now:
+                return window
+        return None
+
+    def next_boundary(self, now: datetime = None) -> Tuple[Optional[datetime], Optional[FishingWindow]]:
+        """When the open/closed state changes next and the window that is open until then"""
+        now = now or datetime.now()
+        current = self.current_window(now)
+        if current is not None:
+            return current.end, current
+        upcoming = self.next_window(now)
+        return (upcoming.start if upcoming else None), None
+
+
+_schedule = None
+_schedule_lock = threading.Lock()
+
+
+def get_fishing_schedule() -> FishingSchedule:
+    """Shared schedule of the Twitch and Telegram bots"""
+    global _schedule
+    with _schedule_lock:
+        if _schedule is None:
+            _schedule = FishingSchedule.load()
+        return _schedule
+
+
+def reload_fishing_schedule(path: str = SCHEDULE_FILE) -> FishingSchedule:
+    global _schedule
+    schedule = FishingSchedule.load(path)
+    with _schedule_lock:
+        _schedule = schedule
+    return schedule
@@ -0,0 +1,246 @@
+"""Офлайн симулятор рыбалки (Monte-Carlo на NumPy).
+
+Loads the real fish catalog, the drop configuration of every mode from
+fishing_engine and the upgrade limits from UpgradeSystem.upgrade_config, then
+simulates casts in vectorised chunks and reports the rarity distribution, LC
+per cast and per hour, time to complete the collection and how fast the
+ultimate fish run out. The odds shown by /info are checked against the
+simulated ones.
+
+    python fishing_simulator.py --mode telegram --casts 20000000 --rare-level 100 --double-level 300
+"""
+import sys
+import math
+import argparse
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+try:
+    import numpy as np
+except ImportError:
+    print("Error: fishing_simulator.py needs NumPy.")
+    print("Please install it first by running: pip install -r requirements.txt")
+    sys.exit(1)
+
+from fish_catalog import get_fish_catalog
+from fishing_engine import MODES, RARITIES
+from fishing_schedule import FishingSchedule
+
+
+class DropModel:
+    """Вероятности и стоимость каждой рыбы в одном режиме, как их считают боты"""
+
+    def __init__(self, fish, mode: str, rare_level: int = 0, sale_level: int = 0):
+        self.mode = mode
+        self.config = MODES[mode]
+        self.fish = [f for f in fish if self.config.is_available(f)]
+        weights = [self.config.weight(f, rare_level) for f in self.fish]
+        values = [self.config.value(f) for f in self.fish]
+        # Надбавка sale_price_increase при продаже
+        values = [value + int(value * sale_level * 0.001) for value in values]
+        self.weights = np.array(weights, dtype=np.float64)
+        if not self.fish or self.weights.sum() <= 0:
+            raise ValueError(f"No fish can be caught in mode {mode}")
+        self.probs = self.weights / self.weights.sum()
+        self.values = np.array(values, dtype=np.int64)
+        self.rarity_index = np.array([RARITIES.index(f.rarity) if f.rarity in RARITIES else 0 for f in self.fish])
+        self.is_ultimate = np.array([f.rarity == "ultimate" for f in self.fish])
+
+    def rarity_probs(self) -> np.ndarray:
+        return np.bincount(self.rarity_index, weights=self.probs, minlength=len(RARITIES))
+
+
+def bonus_roll_chances(double_level: int) -> list:
+    """Шансы бонусных рыб как в FishingEngine.bonus_rolls (до 4 попыток, уровень -1 за попытку)"""
+    chances = []
+    for _ in range(4):
+        chances.append(min(double_level * 0.001, 1.0))
+        double_level -= 1
+        if double_level <= 0:
+            break
+    return chances
+
+
+def simulate(model: DropModel, casts: int, double_level: int, rng, chunk: int = 1_000_000) -> dict:
+    """Vectorised casts in chunks; returns per-fish counts and LC per cast statistics"""
+    counts = np.zeros(len(model.fish), dtype=np.int64)
+    bonus = bonus_roll_chances(double_level) if model.config.upgrades else []
+    total_fish = 0
+    lc_sum = 0.0
+    lc_sq_sum = 0.0
+    done = 0
+    while done < casts:
+        n = min(chunk, casts - done)
+        caught = rng.choice(len(model.fish), size=n, p=model.probs)
+        counts += np.bincount(caught, minlength=len(model.fish))
+        lc = model.values[caught].astype(np.float64)
+        total_fish += n
+        for chance in bonus:
+            hit = rng.random(n) < chance
+            extra = rng.choice(len(model.fish), size=int(hit.sum()), p=model.probs)
+            counts += np.bincount(extra, minlength=len(model.fish))
+            lc[hit] += model.values[extra]
+            total_fish += len(extra)
+        lc_sum += lc.sum()
+        lc_sq_sum += np.square(lc).sum()
+        done += n
+    mean = lc_sum / casts
+    return {
+        'counts': counts,
+        'fish_per_cast': total_fish / casts,
+        'lc_per_cast': mean,
+        'lc_std': math.sqrt(max(lc_sq_sum / casts - mean * mean, 0.0)),
+    }
+
+
+def collection_casts(model: DropModel, fish_per_cast: float, trials: int, rng) -> np.ndarray:
+    """Casts until every non-ultimate fish is caught at least once.
+
+    Poissonised coupon collector: with fish arriving as a Poisson process, the
+    first catch of each fish is an independent exponential, so one trial is the
+    maximum of a row of exponentials. The mean is exact, percentiles are a close
+    approximation.
+    """
+    rates = model.probs[~model.is_ultimate] * fish_per_cast
+    if len(rates) == 0:
+        return np.zeros(trials)
+    result = np.empty(trials)
+    step = max(1, 2_000_000 // len(rates))
+    for start in range(0, trials, step):
+        n = min(step, trials - start)
+        result[start:start + n] = rng.exponential(1.0 / rates, size=(n, len(rates))).max(axis=1)
+    return result
+
+
+def ultimate_depletion_hours(model: DropModel, casts_per_hour: float, fish_per_cast: float, players: int) -> float:
+    """Expected hours until players catch every uncaught ultimate fish, weights recalculated after each one"""
+    ultimate_weights = model.weights[model.is_ultimate]
+    other_weight = model.weights[~model.is_ultimate].sum()
+    rolls_per_hour = players * casts_per_hour * fish_per_cast
+    hours = 0.0
+    for k in range(len(ultimate_weights), 0, -1):
+        remaining = ultimate_weights[:k].sum()
+        hours += 1.0 / (rolls_per_hour * remaining / (other_weight + remaining))
+    return hours
+
+
+def casts_per_hour(mode: str, cooldown_level: int, schedule: FishingSchedule) -> float:
+    config = MODES[mode]
+    if config.upgrades:
+        cooldown = config.cooldown - config.cooldown * cooldown_level * 0.001
+        return 3600 / max(cooldown, 1)
+    if mode != "limited":
+        return 3600 / config.cooldown
+    # В limited рыбачат только в окнах: забросы в начале окна и каждые cooldown секунд
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    windows = schedule.windows(start, start + timedelta(days=7))
+    casts = sum(math.ceil((w.end - w.start).total_seconds() / config.cooldown) for w in windows)
+    return casts / (7 * 24)
+
+
+def displayed_chances(mode: str) -> dict:
+    """Шансы, которые /info показывает игрокам (HelpInfoModule.get_fish_drop_chances)"""
+    from help_info import HelpInfoModule
+    chances = HelpInfoModule.get_fish_drop_chances(SimpleNamespace(FISH_RARITY_WEIGHTS=MODES[mode].weights))
+    return {rarity: info['chance'] / 100 for rarity, info in chances.items()}
+
+
+def format_hours(hours: float) -> str:
+    if hours >= 48:
+        return f"{hours / 24:.1f} дн"
+    return f"{hours:.1f} ч"
+
+
+def report(mode: str, fish, args, upgrade_config: dict, rng) -> str:
+    model = DropModel(fish, mode, args.rare_level, args.sale_level)
+    result = simulate(model, args.casts, args.double_level, rng)
+    per_hour = casts_per_hour(mode, args.cooldown_level, FishingSchedule.load())
+    empirical = np.bincount(model.rarity_index, weights=result['counts'], minlength=len(RARITIES))
+    empirical = empirical / empirical.sum()
+    exact = model.rarity_probs()
+    try:
+        shown = displayed_chances(mode)
+    except ImportError as e:
+        shown = {}
+        print(f"HelpInfoModule is not available ({e}), skipping the /info cross-check")
+
+    lines = [f"=== {mode}: {len(model.fish)} fish, {args.casts:,} casts ===",
+             f"{'rarity':<11}{'fish':>6}{'simulated':>11}{'exact':>10}{'/info':>10}{'/info err':>11}"]
+    for i, rarity in enumerate(RARITIES):
+        fish_count = int((model.rarity_index == i).sum())
+        if not fish_count and rarity not in shown:
+            continue
+        line = f"{rarity:<11}{fish_count:>6}{empirical[i]:>10.4%}{exact[i]:>10.4%}"
+        if rarity in shown:
+            line += f"{shown[rarity]:>10.4%}{shown[rarity] / exact[i] if exact[i] else float('inf'):>10.2f}x"
+        lines.append(line)
+    max_error = float(np.abs(empirical - exact).max())
+    lines.append(f"max |simulated - exact| = {max_error:.5%}")
+    if shown and max(abs(shown.get(r, 0.0) - exact[i]) for i, r in enumerate(RARITIES)) > 0.001:
+        lines.append("!! /info odds differ from the real ones: it divides rarity weights, "
+                     "but every fish of a rarity gets the weight")
+
+    lines.append(f"fish per cast: {result['fish_per_cast']:.4f}")
+    lines.append(f"LC per cast: {result['lc_per_cast']:.2f} (std {result['lc_std']:.2f})")
+    lines.append(f"casts per hour: {per_hour:.2f}, LC per hour: {result['lc_per_cast'] * per_hour:.1f}")
+
+    collection = collection_casts(model, result['fish_per_cast'], args.trials, rng)
+    if collection.any():
+        p50, p90 = np.percentile(collection, [50, 90])
+        lines.append(
+            f"full collection (без ultimate): mean {collection.mean():,.0f} casts / "
+            f"{format_hours(collection.mean() / per_hour)}, p50 {p50:,.0f}, p90 {p90:,.0f} casts"
+        )
+
+    ultimate_rate = float(model.probs[model.is_ultimate].sum())
+    if ultimate_rate:
+        lines.append(
+            f"ultimate: {ultimate_rate * result['fish_per_cast']:.6%} per cast, "
+            f"{int(model.is_ultimate.sum())} left, all caught by {args.players} players in "
+            f"{format_hours(ultimate_depletion_hours(model, per_hour, result['fish_per_cast'], args.players))}"
+        )
+    else:
+        lines.append("ultimate: none left")
+
+    limits = {key: upgrade_config[key]['max_level'] for key in upgrade_config}
+    levels = {'sale_price_increase': args.sale_level}
+    if model.config.upgrades:
+        # На Twitch остальные прокачки не действуют
+        levels.update({'rare_fish_chance': args.rare_level, 'double_catch_chance': args.double_level,
+                       'fishing_cooldown_reduction': args.cooldown_level})
+    lines.append("upgrades: " + ", ".join(f"{key} {level}/{limits.get(key, '?')}" for key, level in levels.items()))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte-Carlo симулятор выпадения рыбы и выплат")
+    parser.add_argument("--db", default="bot_database.db")
+    parser.add_argument("--mode", choices=tuple(MODES) + ("all",), default="all")
+    parser.add_argument("--casts", type=int, default=20_000_000)
+    parser.add_argument("--trials", type=int, default=20_000, help="simulated players for the collection time")
+    parser.add_argument("--players", type=int, default=100, help="active players for the ultimate depletion time")
+    parser.add_argument("--rare-level", type=int, default=0)
+    parser.add_argument("--double-level", type=int, default=0)
+    parser.add_argument("--cooldown-level", type=int, default=0)
+    parser.add_argument("--sale-level", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    from upgrade_system import UpgradeSystem
+    upgrade_config = UpgradeSystem(args.db).upgrade_config
+    for key, level in (('rare_fish_chance', args.rare_level), ('double_catch_chance', args.double_level),
+                       ('fishing_cooldown_reduction', args.cooldown_level), ('sale_price_increase', args.sale_level)):
+        if not 0 <= level <= upgrade_config[key]['max_level']:
+            parser.error(f"{key} level must be between 0 and {upgrade_config[key]['max_level']}")
+
+    fish = get_fish_catalog(args.db).fish()
+    if not fish:
+        parser.error(f"no fish in {args.db}")
+    rng = np.random.default_rng(args.seed)
+    for mode in (tuple(MODES) if args.mode == "all" else (args.mode,)):
+        print(report(mode, fish, args, upgrade_config, rng))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import sqlite3
+import logging
+from typing import Optional
+from db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+# Коды причин изменения баланса -> название для отчетов
+LEDGER_REASONS = {
+    'opening': "Начальный баланс",
+    'daily': "Ежедневная награда",
+    'slots': "Слоты",
+    'fish_sale': "Продажа рыбы",
+    'fish_purchase': "Покупка рыбы",
+    'shop': "Магазин",
+    'transfer': "Переводы",
+    'trade': "Обмены",
+    'upgrade_points': "Очки прокачки",
+    'pass_sale': "Продажа пропусков",
+    'admin': "Модераторы",
+    'reconcile': "Сверка",
+    'other': "Прочее",
+}
+
+
+def record_entry(cursor, username: str, delta: int, reason: str, ref=None, balance_after: int = None):
+    """Write a ledger row on cursor, in the transaction that changed the balance.
+
+    Without balance_after it is read from players, so call it after the UPDATE.
+    """
+    if not delta:
+        return
+    if reason not in LEDGER_REASONS:
+        logger.warning(f"Unknown ledger reason {reason}, stored as is")
+    ref = str(ref) if ref is not None else None
+    if balance_after is None:
+        cursor.execute('''
+            INSERT INTO ledger (username, delta, balance_after, reason, ref)
+            SELECT ?, ?, balance, ?, ? FROM players WHERE username = ?
+        ''', (username.lower(), delta, reason, ref, username.lower()))
+    else:
+        cursor.execute('''
+            INSERT INTO ledger (username, delta, balance_after, reason, ref)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (username.lower(), delta, balance_after, reason, ref))
+
+
+class LedgerReconciler:
+    """Сверка players.balance с суммой ledger по каждому игроку.
+
+    ledger_checkpoint holds the sum of deltas per player up to
+    ledger_state.last_id, so a run only aggregates rows added since then and
+    compares the players they touched. A balance changed without a ledger row
+    gets a 'reconcile' row for the difference, which keeps sums over the
+    ledger equal to the materialised balances.
+    """
+
+    def __init__(self, db_path: str = 'bot_database.db'):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+
+    def run(self) -> Optional[dict]:
+        """One incremental pass; returns counters, None on a database error"""
+        conn = self.pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('SELECT last_id FROM ledger_state WHERE id = 1')
+            last_id = cursor.fetchone()[0]
+            cursor.execute('SELECT MAX(id) FROM ledger')
+            upper = cursor.fetchone()[0] or 0
+            if upper <= last_id:
+                conn.rollback()
+                return {'rows': 0, 'players': 0, 'mismatches': 0}
+            cursor.execute('''
+                SELECT l.username, SUM(l.delta), COUNT(*), COALESCE(c.balance, 0), p.balance
+                FROM ledger l
+                LEFT JOIN ledger_checkpoint c ON c.username = l.username
+                LEFT JOIN players p ON p.username = l.username
+                WHERE l.id > ? AND l.id <= ?
+                GROUP BY l.username
+            ''', (last_id, upper))
+            groups = cursor.fetchall()
+            mismatches = []
+            for username, delta, _, checkpoint, balance in groups:
+                expected = checkpoint + delta
+                if balance is not None and int(balance or 0) != expected:
+                    mismatches.append((username, int(balance or 0) - expected, int(balance or 0)))
+            # Исправления получают id > upper и войдут в checkpoint при следующей сверке
+            for username, difference, balance in mismatches:
+                record_entry(cursor, username, difference, 'reconcile', balance_after=balance)
+            cursor.executemany('''
+                INSERT INTO ledger_checkpoint (username, balance) VALUES (?, ?)
+                ON CONFLICT(username) DO UPDATE SET balance = excluded.balance
+            ''', ((username, checkpoint + delta) for username, delta, _, checkpoint, _ in groups))
+            cursor.execute("UPDATE ledger_state SET last_id = ?, checked_at = datetime('now') WHERE id = 1", (upper,))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error reconciling the ledger: {e}")
+            return None
+        finally:
+            self.pool.release()
+        for username, difference, balance in mismatches:
+            logger.warning(f"Balance of {username} changed by {difference} LC without a ledger entry, now {balance}")
+        return {
+            'rows': sum(count for _, _, count, _, _ in groups),
+            'players': len(groups),
+            'mismatches': len(mismatches),
+        }
@@ -0,0 +1,178 @@
+import os
+import sqlite3
+import logging
+from db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+LEGACY_UPGRADES_DB = 'upgrades.db'
+QUEUE_RANK_GAP = 1024
+UPGRADE_COLUMNS = (
+    'twitch_username', 'double_catch_chance', 'rare_fish_chance',
+    'fishing_cooldown_reduction', 'shop_discount', 'sale_price_increase', 'points_balance'
+)
+
+
+def import_legacy_upgrades(cursor, db_path: str):
+    """Copy rows of the old separate upgrades.db into the main database"""
+    legacy_path = os.path.join(os.path.dirname(os.path.abspath(db_path)), LEGACY_UPGRADES_DB)
+    if not os.path.exists(legacy_path):
+        return
+    legacy = sqlite3.connect(legacy_path)
+    try:
+        rows = legacy.execute(f"SELECT {', '.join(UPGRADE_COLUMNS)} FROM upgrades").fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Error reading {legacy_path}: {e}")
+        rows = []
+    finally:
+        legacy.close()
+    cursor.executemany(
+        f"INSERT OR IGNORE INTO upgrades ({', '.join(UPGRADE_COLUMNS)}) VALUES ({', '.join('?' * len(UPGRADE_COLUMNS))})",
+        rows
+    )
+    logger.info(f"Imported {len(rows)} upgrade rows from {legacy_path}, the file is no longer used")
+
+
+def add_queue_rank(cursor, db_path: str):
+    """Explicit order of the queue: rank column filled in the old ORDER BY timestamp order"""
+    cursor.execute('PRAGMA table_info(queue)')
+    if 'rank' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute('ALTER TABLE queue ADD COLUMN rank REAL')
+    cursor.execute('SELECT id FROM queue ORDER BY timestamp, id')
+    ids = [row[0] for row in cursor.fetchall()]
+    cursor.executemany('UPDATE queue SET rank = ? WHERE id = ?',
+                       ((float((i + 1) * QUEUE_RANK_GAP), queue_id) for i, queue_id in enumerate(ids)))
+
+
+# (версия, описание, таблицы которые должны существовать, SQL или функция (cursor, db_path))
+MIGRATIONS = [
+    (1, "inventory indexes", ("inventory",), [
+        'CREATE INDEX IF NOT EXISTS idx_inventory_user_type_obtained ON inventory (username, item_type, obtained_at)',
+        'CREATE INDEX IF NOT EXISTS idx_inventory_item_id ON inventory (item_id)',
+    ]),
+    (2, "queue timestamp index", ("queue",), [
+        'CREATE INDEX IF NOT EXISTS idx_queue_timestamp ON queue (timestamp)',
+    ]),
+    (3, "telegram_users lookup indexes", ("telegram_users",), [
+        'CREATE INDEX IF NOT EXISTS idx_telegram_users_twitch_username ON telegram_users (twitch_username)',
+        'CREATE INDEX IF NOT EXISTS idx_telegram_users_link_code ON telegram_users (link_code)',
+    ]),
+    (4, "trades indexes", ("trades",), [
+        'CREATE INDEX IF NOT EXISTS idx_trades_status_created ON trades (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_trades_creator ON trades (creator_username)',
+    ]),
+    (5, "move upgrades from upgrades.db into the main database", ("upgrades",), [
+        import_legacy_upgrades,
+    ]),
+    # Любое изменение items (в том числе из админок) увеличивает версию каталога рыбы
+    (6, "fish catalog version", ("items",), [
+        '''CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )''',
+        'INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)',
+        '''CREATE TRIGGER IF NOT EXISTS trg_items_catalog_insert AFTER INSERT ON items
+           BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_items_catalog_update AFTER UPDATE ON items
+           BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_items_catalog_delete AFTER DELETE ON items
+           BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END''',
+    ]),
+    (7, "queue rank", ("queue",), [
+        add_queue_rank,
+        'CREATE INDEX IF NOT EXISTS idx_queue_rank ON queue (rank, id)',
+    ]),
+    # Журнал изменений баланса; текущие балансы становятся строками 'opening'
+    (8, "balance ledger", ("players",), [
+        '''CREATE TABLE IF NOT EXISTS ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            delta INTEGER NOT NULL,
+            balance_after INTEGER,
+            reason TEXT NOT NULL,
+            ref TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_ledger_username ON ledger (username, id)',
+        'CREATE INDEX IF NOT EXISTS idx_ledger_created ON ledger (created_at)',
+        '''CREATE TABLE IF NOT EXISTS ledger_checkpoint (
+            username TEXT PRIMARY KEY,
+            balance INTEGER NOT NULL
+        )''',
+        '''CREATE TABLE IF NOT EXISTS ledger_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_id INTEGER NOT NULL DEFAULT 0,
+            checked_at DATETIME
+        )''',
+        'INSERT OR IGNORE INTO ledger_state (id, last_id) VALUES (1, 0)',
+        '''INSERT INTO ledger (username, delta, balance_after, reason)
+           SELECT username, CAST(balance AS INTEGER), CAST(balance AS INTEGER), 'opening' FROM players
+           WHERE CAST(COALESCE(balance, 0) AS INTEGER) != 0''',
+    ]),
+]
+
+
+def _table_exists(cursor, table: str) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    row = cursor.fetchone()
+    return row[0] or 0
+
+
+def get_applied_versions(conn: sqlite3.Connection) -> set:
+    get_schema_version(conn)
+    return {row[0] for row in conn.execute('SELECT version FROM schema_version')}
+
+
+def run_migrations(db_path: str = 'bot_database.db') -> int:
+    """Apply pending migrations in order and return the schema version.
+
+    A migration whose tables are not created yet is left pending, it will be
+    applied by the next call made after the owner of the table created it.
+    Later migrations whose tables exist are applied meanwhile.
+    """
+    conn = get_pool(db_path).get_connection()
+    cursor = conn.cursor()
+    version = 0
+    try:
+        applied = get_applied_versions(conn)
+        version = max(applied, default=0)
+        for number, description, tables, statements in MIGRATIONS:
+            if number in applied:
+                continue
+            if not all(_table_exists(cursor, table) for table in tables):
+                continue
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('SELECT 1 FROM schema_version WHERE version = ?', (number,))
+            if cursor.fetchone() is None:
+                for statement in statements:
+                    if callable(statement):
+                        statement(cursor, db_path)
+                    else:
+                        cursor.execute(statement)
+                cursor.execute(
+                    'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                    (number, description)
+                )
+                logger.info(f"Applied migration {number}: {description}")
+            conn.commit()
+            version = max(version, number)
+        return version
+    except sqlite3.Error as e:
+        logger.error(f"Error applying migrations to {db_path}: {e}")
+        if conn.in_transaction:
+            conn.rollback()
+        return version
@@ -9,7 +9,7 @@ import time
 import asyncio
 import sqlite3
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 import threading
 from twitchio.ext import commands
@@ -20,6 +20,20 @@ from twitch_link_handler import setup_twitch_link_handler
 from pastes_manager import PastesManager
 from tgw_past_def import handle_twitch_paste_command as pasta_comm
 from upgrade_system import UpgradeSystem
+from db_pool import get_pool
+from migrations import run_migrations
+from repository import Repository
+from queue_index import get_queue_index, QUEUE_MAX_AGE
+from queue_feed import QueueFeed, QUEUE_FEED_PORT
+from ledger import LedgerReconciler, LEDGER_REASONS
+from db_executor import AsyncDatabase
+from write_behind import flush_all_queues
+from db_stats import stats as db_stats
+from alias_sampler import drop_tables
+from fishing_schedule import get_fishing_schedule, reload_fishing_schedule
+from fishing_engine import get_fishing_engine, CURRENCY_NAME
+from cast_collector import CastCollector
+from cooldown_store import get_cooldown_store
 
 upgrade=UpgradeSystem()
 load_dotenv(".env")
@@ -51,8 +65,12 @@ HELP_FILE = "help.json"
 
 F_MODE = "limited"
 F_ACTIVE = False
+FISHING_SCHEDULE_CHANGED = asyncio.Event()
+TWITCH_MESSAGE_LIMIT = 500
 N_TASK = None
-F_CD = {}
+Q_TASK = None
+L_TASK = None
+LEDGER_RECONCILE_INTERVAL = 600
 ITEMS_PER_PAGE = 4
 COMMANDS_ENABLED = True  
 load_dotenv(".env")
@@ -123,20 +141,28 @@ class Database:
     def __init__(self, db_path: str = 'bot_database.db'):
         """Initialize the database connection"""
         self.db_path = db_path
-        self.conn = None
+        self.pool = get_pool(db_path)
+        self.repo = Repository(db_path)
         self._init_tables()
+        self.queue = get_queue_index(db_path)
+    
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Connection of the current thread from the pool"""
+        return self.pool.get_connection()
     
     def connect(self, db_path: str = None):
         """Connect database"""
-        if db_path:
+        if db_path and db_path != self.db_path:
             self.db_path = db_path
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+            self.pool = get_pool(db_path)
+            self.repo = Repository(db_path)
+            self.queue = get_queue_index(db_path)
+        return self.conn
     
     def close(self):
-        """Close the database connection"""
-        if self.conn:
-            self.conn.close()
+        """Release the connection back to the pool"""
+        self.pool.release()
             
     def _init_tables(self):
         """Create tables if they don't exist"""
@@ -290,320 +316,182 @@ class Database:
         
         self.conn.commit()
         self.close()
+        run_migrations(self.db_path)
     
     # Player methods
     def player_exists(self, username: str) -> bool:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT 1 FROM players WHERE username = ?', (username.lower(),))
-        answer = cursor.fetchone() is not None
-        self.close()
-        return answer
+        return self.repo.player_exists(username)
     
     def create_player(self, username: str) -> bool:
-        self.connect()
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT OR IGNORE INTO players (username) 
-                VALUES (?)
-            ''', (username.lower(),))
-            self.conn.commit()
-            return cursor.rowcount > 0
-        except sqlite3.Error:
-            return False
-        finally:
-            self.close()
+        return self.repo.create_player(username)
     
     def get_player(self, username: str) -> Optional[Dict]:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM players WHERE username = ?', (username.lower(),))
-        row = cursor.fetchone()
-        self.close()
+        row = self.repo.get_player(username)
         return dict(row) if row else None
     
     def update_player(self, username: str, **fields) -> bool:
-        if not fields:
-            return False
-        self.connect()
-        try:
-            cursor = self.conn.cursor()
-            set_clause = ', '.join(f"{k} = ?" for k in fields.keys())
-            values = list(fields.values()) + [username.lower()]
-            
-            cursor.execute(f'''
-                UPDATE players 
-                SET {set_clause}
-                WHERE username = ?
-            ''', values)
-            
-            self.conn.commit()
-            return cursor.rowcount > 0
-        except sqlite3.Error:
-            return False
-        finally:
-            self.close()
+        return self.repo.update_player(username, **fields)
     
     # Economy methods
     def get_balance(self, username: str) -> int:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT balance FROM players WHERE username = ?', (username.lower(),))
-        row = cursor.fetchone()
-        answer = row['balance'] if row else 0
-        self.close()
-        return answer
+        return self.repo.get_balance(username)
     
-    def add_coins(self, username: str, amount: int) -> int:
-        self.create_player(username)
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            UPDATE players 
-            SET balance = balance + ? 
-            WHERE username = ?
-        ''', (amount, username.lower()))
-        self.conn.commit()
-        answer = self.get_balance(username)
-        self.close()
-        return answer
+    def add_coins(self, username: str, amount: int, reason: str = 'other', ref=None) -> int:
+        answer = self.repo.add_coins(username, amount, reason=reason, ref=ref)
+        return answer if answer is not None else 0
     
     def transfer_coins(self, from_user: str, to_user: str, amount: int) -> bool:
-        if amount <= 0:
-            return False
-            
-        self.create_player(from_user)
-        self.create_player(to_user)
-        self.connect()
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT balance FROM players WHERE username = ?', (from_user.lower(),))
-            from_balance = cursor.fetchone()['balance']
-            
-            if from_balance < amount:
-                return False
-            
-            cursor.execute('''
-                UPDATE players 
-                SET balance = balance - ? 
-                WHERE username = ?
-            ''', (amount, from_user.lower()))
-            
-            cursor.execute('''
-                UPDATE players 
-                SET balance = balance + ? 
-                WHERE username = ?
-            ''', (amount, to_user.lower()))
-            
-            self.conn.commit()
-            return True
-        except sqlite3.Error:
-            return False
-        finally:
-            self.close()
+        return self.repo.transfer_coins(from_user, to_user, amount)
+    
+    def take_coins(self, username: str, amount: int, ref=None) -> Optional[Tuple[int, int]]:
+        """Take up to amount without going negative, returns (taken, new balance)"""
+        return self.repo.take_coins(username, amount, reason='admin', ref=ref)
+    
+    def transfer(self, from_user: str, to_user: str, amount: int) -> Optional[tuple]:
+        return self.repo.transfer(from_user, to_user, amount)
+    
+    def debit(self, username: str, amount: int, reason: str = 'other', ref=None) -> Optional[int]:
+        return self.repo.debit(username, amount, reason, ref)
+    
+    def purchase(self, username: str, price: int, statements=(), reason: str = 'shop', ref=None) -> Optional[int]:
+        return self.repo.purchase(username, price, statements, reason, ref)
+    
+    def get_ledger_summary(self, username: str = None, since: str = None) -> List[Dict]:
+        return [dict(row) for row in self.repo.get_ledger_summary(username, since)]
     
     # Inventory methods
     def add_to_inventory(self, username: str, item_data: Dict) -> bool:
-        self.connect()
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT INTO inventory (
-                    username, item_type, item_id, item_name, 
-                    rarity, value, obtained_at, metadata
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                username.lower(),
-                item_data.get('type', 'fish'),
-                item_data.get('id'),
-                item_data.get('name'),
-                item_data.get('rarity', 'common'),
-                item_data.get('price', 0),
-                item_data.get('obtained_at', datetime.now().isoformat()),
-                str(item_data.get('metadata', {}))
-            ))
-            self.conn.commit()
-            return cursor.lastrowid is not None
-        except sqlite3.Error:
-            return False
-        finally:
-            self.close()
+        self.repo.queue_inventory_item(
+            username,
+            item_data.get('type', 'fish'),
+            item_data.get('id'),
+            item_data.get('name'),
+            item_data.get('rarity', 'common'),
+            item_data.get('price', 0),
+            item_data.get('obtained_at', datetime.now().isoformat()),
+            str(item_data.get('metadata', {}))
+        )
+        return True
     
     def get_inventory(self, username: str, item_type: str = None) -> List[Dict]:
-        self.connect()
-        cursor = self.conn.cursor()
-        
-        if item_type:
-            cursor.execute('''
-                SELECT * FROM inventory 
-                WHERE username = ? AND item_type = ?
-                ORDER BY obtained_at DESC
-            ''', (username.lower(), item_type))
-        else:
-            cursor.execute('''
-                SELECT * FROM inventory 
-                WHERE username = ? 
-                ORDER BY obtained_at DESC
-            ''', (username.lower(),))
-        answer = [dict(row) for row in cursor.fetchall()]
-        self.close()
-        return answer
+        return [dict(row) for row in self.repo.get_inventory(username, item_type)]
     
     def remove_from_inventory(self, username: str, item_id: int) -> Optional[Dict]:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM inventory 
-            WHERE id = ? AND username = ?
-        ''', (item_id, username.lower()))
-        
-        item = cursor.fetchone()
-        if not item:
-            return None
-            
-        cursor.execute('''
-            DELETE FROM inventory 
-            WHERE id = ? AND username = ?
-        ''', (item_id, username.lower()))
-        
-        self.conn.commit()
-        answer=dict(item)
-        self.close()
-        return answer
+        item = self.repo.remove_inventory_item(item_id, username)
+        return dict(item) if item else None
+    
+    def sell_inventory(self, username: str, inventory_ids: List[int], release_fish_ids=(), ref=None):
+        """Sell inventory rows with the sale_price_increase bonus in one transaction.
+
+        release_fish_ids are ultimate fish marked uncaught together with the sale.
+        Returns (sold, income, new balance), None when nothing was sold.
+        """
+        upgrades = self.repo.get_upgrades(username.lower())
+        bonus = int(upgrades['sale_price_increase'] or 0) if upgrades else 0
+        statements = [Repository.release_unique_fish_statement(item_id) for item_id in release_fish_ids]
+        return self.repo.sell_items(username, inventory_ids, bonus, item_type=None, ref=ref, statements=statements)
    
     
     def get_fish_catalog(self) -> List[Dict]:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM items WHERE type = "fish"')
-        answer  = [dict(row) for row in cursor.fetchall()]
-        self.close()
-        return answer
+        return [fish._asdict() for fish in self.repo.get_fish_catalog()]
+    
+    def mark_fish_caught(self, item_id: int, caught: bool = True) -> bool:
+        return self.repo.set_fish_caught(item_id, caught)
+    
+    def fish_exists(self, name: str) -> bool:
+        return any(fish.name == name for fish in self.repo.get_fish_catalog())
+    
+    def add_fish(self, name: str, price: int, rarity: str) -> Optional[int]:
+        """Add a fish with the next free id, returns the id"""
+        return self.repo.add_fish(name, price, rarity)
+    
+    def get_top_balances(self, limit: int = 5) -> List[Dict]:
+        return [dict(row) for row in self.repo.get_top_balances(limit)]
     
     # Queue methods
-    def add_to_queue(self, username: str, number: str) -> bool:
-        self.connect()
-        try:
-            cursor = self.conn.cursor()
-            # Remove if already in queue
-            cursor.execute('DELETE FROM queue WHERE username = ?', (username.lower(),))
-            # Add to queue with current timestamp
-            cursor.execute('''
-                INSERT INTO queue (username, number, timestamp)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            ''', (username.lower(), number))
-            self.conn.commit()
-            
-            return True
-        except sqlite3.Error:
-            return False
-        finally:
-            self.close()
+    def add_to_queue(self, username: str, number: str, front: bool = False) -> bool:
+        return self.queue.add(username, number, front)
+    
+    def move_in_queue(self, username: str, position: int = 1, event: str = 'move') -> Optional[int]:
+        """Move user to a 1-based position, returns the new position or None"""
+        return self.queue.move(username, position, event)
     
     def remove_from_queue(self, username: str) -> bool:
         """Remove user from queue"""
-        self.connect()
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('DELETE FROM queue WHERE username = ?', (username.lower(),))
-            self.conn.commit()
-            return cursor.rowcount > 0
-        except sqlite3.Error:
-            return False
-        finally:
-            self.close()
+        return self.queue.remove(username)
     
-    def _clean_expired_queue_entries(self):
-        """Remove users who have been in queue for more than 8 hours"""
-        self.connect()
-        try:
-            cursor = self.conn.cursor()
-            # Remove expired entries (older than 8 hours)
-            cursor.execute('''
-                DELETE FROM queue 
-                WHERE timestamp < datetime('now', '-8 hours')
-            ''')
-            
-            if cursor.rowcount > 0:
-                self.conn.commit()
-                logging.info(f"Removed {cursor.rowcount} expired queue entries")
-        except sqlite3.Error as e:
-            logging.error(f"Error cleaning expired queue entries: {e}")
-        finally:
-            self.close()
+    def remove_from_queue_at(self, index: int) -> Optional[Dict]:
+        """Remove the entry at a 0-based index, returns it or None"""
+        page = self.queue.page(index, 1) if index >= 0 else []
+        if page and self.queue.remove(page[0]['username']):
+            return page[0]
+        return None
+    
+    def move_queue_entry(self, index: int, position: int) -> Optional[Tuple[str, int]]:
+        """Move the entry at a 0-based index to a 1-based position, returns (username, new position)"""
+        page = self.queue.page(index, 1) if index >= 0 else []
+        if not page:
+            return None
+        position = self.queue.move(page[0]['username'], position)
+        return (page[0]['username'], position) if position is not None else None
+    
+    def clear_queue(self) -> bool:
+        logger.info(f"ОЧЕРЕДЬ ПЕРЕД ОЧИСТКОЙ {self.queue.entries()}")
+        return self.queue.clear()
+    
+    def dequeue_many(self, usernames: List[str] = None, count: int = None,
+                     randomly: bool = False, weighted: bool = False) -> List[Dict]:
+        """Pick players out of the queue and stamp last_played in one transaction"""
+        last_played = datetime.now().isoformat()
+        picked = self.queue.dequeue_many(usernames, count, randomly, weighted, last_played)
+        if picked is None:
+            return []
+        for entry in picked:
+            self.repo.players.update(entry['username'], last_played=last_played)
+        return picked
+    
+    def remove_expired_queue_entries(self) -> List[Dict]:
+        """Remove users who have been in queue for more than 8 hours (queue_expiry_sweeper)"""
+        return self.queue.remove_expired()
     
     def get_queue(self) -> List[Dict]:
-        # First, remove users who have been in queue for more than 8 hours
-        self._clean_expired_queue_entries()
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT username, number, timestamp 
-            FROM queue 
-            ORDER BY timestamp ASC
-        ''')
-        answer = [dict(row) for row in cursor.fetchall()]
-        self.close()
-        return answer
+        return self.queue.entries()
+    
+    def get_queue_page(self, start: int, count: int) -> List[Dict]:
+        return self.queue.page(start, count)
+    
+    def get_queue_length(self) -> int:
+        return len(self.queue)
     
     def get_queue_position(self, username: str) -> Optional[int]:
-        # Clean expired entries first
-        self._clean_expired_queue_entries()
-        
-        queue = self.get_queue()
-        for i, entry in enumerate(queue, 1):
-            if entry['username'].lower() == username.lower():
-                return i
-        return None
+        return self.queue.position(username)
     
     # Queue passes methods
     def add_queue_pass(self, username: str, passes: int = 1) -> bool:
-        self.connect()
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO queue_passes (username, passes)
-                VALUES (?, COALESCE((SELECT passes FROM queue_passes WHERE username = ?), 0) + ?)
-            ''', (username.lower(), username.lower(), passes))
-            self.conn.commit()
-            return True
-        except sqlite3.Error:
-            return False
-        finally:
-            self.close()
+        return self.repo.add_queue_pass(username, passes) is not None
     
-    def get_queue_passes(self, username: str) -> int:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT passes FROM queue_passes WHERE username = ?', (username.lower(),))
-        row = cursor.fetchone()
-        self.close()
-        if row is not None:
-            # Handle case where row might be a tuple or dict
-            if isinstance(row, dict):
-                return row.get('passes', 0)
-            else:
-                # If it's a tuple, get the first element
-                return row[0] if len(row) > 0 else 0
-        return 0
+    def spend_queue_pass(self, username: str) -> Optional[int]:
+        """Take one pass, returns the passes left or None when there is none"""
+        return self.repo.spend_queue_pass(username)
     
-    # Economy methods
-    def get_balance(self, username: str) -> int:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT balance FROM players WHERE username = ?', (username.lower(),))
-        row = cursor.fetchone()
-        self.close()
-        if row is not None:
-            # Handle case where row might be a tuple or dict
-            if isinstance(row, dict):
-                return row.get('balance', 0)
-            else:
-                # If it's a tuple, get the first element
-                return row[0] if len(row) > 0 else 0
-        return 0
+    def transfer_passes(self, from_user: str, to_user: str, passes: int) -> Optional[Tuple[int, int]]:
+        return self.repo.transfer_passes(from_user, to_user, passes)
+    
+    def join_queue_with_pass(self, username: str, number: str) -> Optional[int]:
+        """Put the user first, take one pass and clear last_played in one transaction.
+
+        Returns the passes left, None when the user has no pass.
+        """
+        if not self.queue.add(username, number, front=True, statements=[
+            Repository.spend_queue_pass_statement(username),
+            ('UPDATE players SET last_played = NULL WHERE username = ?', (username.lower(),), False),
+        ]):
+            return None
+        self.repo.invalidate_player(username)
+        return self.repo.get_queue_passes(username)
+    
+    def get_queue_passes(self, username: str) -> int:
+        return self.repo.get_queue_passes(username)
     
     # Administration methods
     def ban_player(self, username: str) -> bool:
@@ -638,6 +526,22 @@ class Database:
         self.close()
         return answer
     
+    def get_banlist(self) -> List[str]:
+        self.connect()
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT username FROM bans')
+            return [row[0] for row in cursor.fetchall() if row[0] is not None]
+        except sqlite3.Error as e:
+            logger.error(f"Error fetching the banlist: {e}")
+            return []
+        finally:
+            self.close()
+    
+    def clear_last_played(self, username: str = None) -> int:
+        """Clear the queue cooldown of one player or everyone, returns the number of players changed"""
+        return self.repo.clear_last_played(username)
+    
     def ignore_player(self, username: str) -> bool:
         self.connect()
         try:
@@ -699,42 +603,6 @@ class Database:
         finally:
             self.close()
     
-    def get_cooldown_time(self, username: str) -> Optional[int]:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT last_used FROM cooldowns WHERE username = ?', (username.lower(),))
-        row = cursor.fetchone()
-        if not row:
-            self.close()
-            return None
-        # Handle case where row might be a tuple or dict
-        if isinstance(row, dict):
-            last_used = row.get('last_used')
-        else:
-            # If it's a tuple, get the first element
-            last_used = row[0] if len(row) > 0 else None
-        remaining = last_used - time.time() if last_used is not None else None
-        self.close()
-        return int(remaining) if remaining is not None and remaining > 0 else None
-    
-    def is_on_cooldown(self, username: str) -> bool:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT last_used FROM cooldowns WHERE username = ?', (username.lower(),))
-        row = cursor.fetchone()
-        if not row:
-            self.close()
-            return False
-        # Handle case where row might be a tuple or dict
-        if isinstance(row, dict):
-            last_used = row.get('last_used')
-        else:
-            # If it's a tuple, get the first element
-            last_used = row[0] if len(row) > 0 else None
-        answer = last_used > time.time() if last_used is not None else False
-        self.close()
-        return answer
-    
     def is_temp_banned(self, username: str) -> bool:
         self.connect()
         cursor = self.conn.cursor()
@@ -775,72 +643,24 @@ class Database:
     
     # Cooldowns methods
     def set_cooldown(self, username: str, duration: int) -> bool:
-        expiry = int(time.time()) + duration
-        self.connect()
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO cooldowns (username, last_used)
-                VALUES (?, ?)
-            ''', (username.lower(), expiry))
-            self.conn.commit()
-            return True
-        except sqlite3.Error:
-            return False
-        finally:
-            self.close()
+        return self.repo.set_cooldown(username, int(time.time()) + duration)
     
     def is_on_cooldown(self, username: str) -> bool:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT last_used FROM cooldowns WHERE username = ?', (username.lower(),))
-        row = cursor.fetchone()
-        if not row:
-            self.close()
-            return False
-        answer = row['last_used'] > time.time()
-        self.close()
-        return answer
+        last_used = self.repo.get_cooldown(username)
+        return last_used is not None and last_used > time.time()
     
     def get_cooldown_time(self, username: str) -> Optional[int]:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT last_used FROM cooldowns WHERE username = ?', (username.lower(),))
-        row = cursor.fetchone()
-        if not row:
-            self.close()
+        last_used = self.repo.get_cooldown(username)
+        if last_used is None:
             return None
-        remaining = row['last_used'] - time.time()
-        self.close()
-        return max(0, int(remaining))
+        return max(0, int(last_used - time.time()))
     
     # Daily fish catches methods
     def record_fish_catch(self, username: str, catch_date: str = None, catch_count: int = 1) -> bool:
         if catch_date is None:
             catch_date = datetime.now().strftime('%Y-%m-%d')
-        self.connect()
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO daily_fish_catches (username, catch_date, catch_count)
-                VALUES (?, ?, COALESCE((SELECT catch_count FROM daily_fish_catches WHERE username = ? AND catch_date = ?), 0) + ?)
-            ''', (username.lower(), catch_date, username.lower(), catch_date, catch_count))
-            self.conn.commit()
-            return True
-        except sqlite3.Error:
-            return False
-        finally:
-            self.close()
-    
-    # Queue pass methods
-    def get_queue_passes(self, username: str) -> int:
-        self.connect()
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT passes FROM queue_passes WHERE username = ?', (username.lower(),))
-        row = cursor.fetchone()
-        answer = row['passes'] if row else 0
-        self.close()
-        return row['passes'] if row else 0
+        self.repo.record_fish_catch(username, catch_date, catch_count)
+        return True
     
     # Pass cooldown methods
     def get_pass_cooldown(self, username: str) -> Optional[int]:
@@ -874,6 +694,17 @@ class Database:
         finally:
             self.close()
             
+    def use_queue_pass(self, username: str, last_used: int) -> Optional[int]:
+        """Move the user to the front, take one pass and start the pass cooldown in one transaction.
+
+        Returns the new position, None when the user is not in the queue or has no passes.
+        """
+        return self.queue.move(username, 1, event='skip', statements=[
+            Repository.spend_queue_pass_statement(username),
+            ('INSERT OR REPLACE INTO pass_cooldowns (username, last_used) VALUES (?, ?)',
+             (username.lower(), last_used), False),
+        ])
+
     def can_use_pass(self, username: str) -> bool:
         """Check if user can use a pass (8 hour cooldown)"""
         last_used = self.get_pass_cooldown(username)
@@ -969,10 +800,10 @@ class Database:
         return answer
     
     # Utility methods
-    def close(self):
-        """Close database connection"""
-        if self.conn:
-            self.conn.close()
+    def shutdown(self):
+        """Flush queued writes and close all pooled connections"""
+        self.repo.writes.close()
+        self.pool.close_all()
     
     def __enter__(self):
         return self
@@ -1070,6 +901,12 @@ def save_used_predictions(used_predictions):
 
 # Initialize database
 db = Database()
+adb = AsyncDatabase(db)
+fishing_engine = get_fishing_engine(db.db_path)
+# Очередь для оверлеев: queue_snapshot.json и http://127.0.0.1:QUEUE_FEED_PORT/events
+queue_feed = QueueFeed(db.queue, port=int(os.getenv("QUEUE_FEED_PORT", QUEUE_FEED_PORT)))
+# Кулдауны команд переживают перезапуск (снимок в cooldowns.json)
+cooldowns = get_cooldown_store()
 
 # Bot instances
 botMOD = commands.Bot(
@@ -1136,8 +973,8 @@ async def just_ask(ctx):
     current_time = time.time()
     
     # Check cooldown using database
-    if db.is_on_cooldown(user):
-        remaining = db.get_cooldown_time(user)
+    if await adb.is_on_cooldown(user):
+        remaining = await adb.get_cooldown_time(user)
         if remaining and remaining > 0:
             minutes = remaining // 60
             seconds = remaining % 60
@@ -1145,34 +982,28 @@ async def just_ask(ctx):
             return
     
     # Check temp ban using database
-    if db.is_temp_banned(user):
-        remaining = db.get_temp_ban_time(user)
+    if await adb.is_temp_banned(user):
+        remaining = await adb.get_temp_ban_time(user)
         if remaining and remaining > 0:
             minutes = remaining // 60
             seconds = remaining % 60
             await ctx.send(f"🚫 {ctx.author.name}, бан очереди (осталось {minutes}м {seconds}с)")
             return
     
-    queue = db.get_queue()
-    queue_entry = next((p for p in queue if p['username'].lower() == user), None)
-    if not queue_entry:
+    if await adb.get_queue_position(user) is None:
         await ctx.send(f"❌ Вас нет в очереди")
         return
     if random.random() < 0.01:
         # Move user to front of queue
-        queue.remove(queue_entry)
-        queue.insert(0, queue_entry)
-        # Update queue in database
-        for entry in queue:
-            db.add_to_queue(entry['username'], entry['number'])
+        await adb.move_in_queue(user, 1, event='skip')
         # Set cooldown
-        db.set_cooldown(user, 7200)  # 2 hours
+        await adb.set_cooldown(user, 7200)  # 2 hours
         await ctx.send(f"🎉 {ctx.author.name}, вы стали ПЕРВЫМ в очереди!")
     else:
         # Add temp ban for 30 minutes
-        db.add_temp_ban(user, 1800)
+        await adb.add_temp_ban(user, 1800)
         # Remove from queue
-        db.remove_from_queue(user)
+        await adb.remove_from_queue(user)
         fails = load_data("queue_fail.json", {})
         fail = fails.get("fail", [])
         event_data = random.choice(fail)
@@ -1184,8 +1015,8 @@ async def check_ban(ctx):
     current_time = time.time()
     
     # Check temp ban
-    if db.is_temp_banned(user):
-        remaining = db.get_temp_ban_time(user)
+    if await adb.is_temp_banned(user):
+        remaining = await adb.get_temp_ban_time(user)
         if remaining and remaining > 0:
             minutes = remaining // 60
             seconds = remaining % 60
@@ -1193,7 +1024,7 @@ async def check_ban(ctx):
             return
     
     # Check permanent ban
-    if db.is_banned(user):
+    if await adb.is_banned(user):
         await ctx.send(f"🚫 {ctx.author.name}, вы заблокированы и не можете записаться в очередь!")
         return
     
@@ -1203,8 +1034,8 @@ async def check_cooldown_cmd(ctx):
     user = ctx.author.name.lower()
     
     # Check cooldown
-    if db.is_on_cooldown(user):
-        remaining = db.get_cooldown_time(user)
+    if await adb.is_on_cooldown(user):
+        remaining = await adb.get_cooldown_time(user)
         if remaining and remaining > 0:
             minutes = remaining // 60
             seconds = remaining % 60
@@ -1217,7 +1048,6 @@ async def add_fish_cmd(ctx):
     if not_moder(ctx):
         await ctx.send("❌ Эта команда доступна только модераторам!")
         return
-    db.connect()
     try:
         parts = ctx.message.content.split()
         if len(parts) < 3:
@@ -1231,17 +1061,10 @@ async def add_fish_cmd(ctx):
             return
         
         # Check if fish already exists in database
-        cursor = db.conn.cursor()
-        cursor.execute('SELECT 1 FROM items WHERE name = ? AND type = "fish"', (name,))
-        if cursor.fetchone():
+        if await adb.fish_exists(name):
             await ctx.send(f"❌ Рыба с названием '{name}' уже существует!")
             return
             
-        # Get max id and create new id
-        cursor.execute('SELECT MAX(id) FROM items')
-        max_id = cursor.fetchone()[0] or 0
-        fish_id = max_id + 1
-        
         price_ranges = {
             "common": (1, 3),
             "uncommon": (4, 10),
@@ -1256,12 +1079,11 @@ async def add_fish_cmd(ctx):
         min_p, max_p = price_ranges[rarity]
         price = random.randint(min_p, max_p)
         
-        # Insert fish into database
-        cursor.execute('''
-            INSERT INTO items (id, name, type, base_price, rarity)
-            VALUES (?, ?, "fish", ?, ?)
-        ''', (fish_id, name, price, rarity))
-        db.conn.commit()
+        # Insert fish into database with the next free id
+        fish_id = await adb.add_fish(name, price, rarity)
+        if fish_id is None:
+            await ctx.send("❌ Не удалось добавить рыбу")
+            return
         
         await ctx.send(
             f"🎣 Добавлена новая рыба:"
@@ -1274,8 +1096,6 @@ async def add_fish_cmd(ctx):
     except Exception as e:
         logger.error(f"Ошибка при добавлении рыбы: {str(e)}")
         await ctx.send("❌ Произошла ошибка. Проверьте формат команды.")
-    finally:
-        db.close()
 
 async def transfer_passes(ctx, *args, **kwargs):
     """Передает пропуски другому игроку"""
@@ -1305,19 +1125,13 @@ async def transfer_passes(ctx, *args, **kwargs):
             await ctx.send("❌ Количество пропусков должно быть больше 0")
             return
 
-        # Получаем количество пропусков у отправителя
-        sender_passes = db.get_queue_passes(sender)
-        
-        if sender_passes < passes_to_transfer:
+        # Списание у отправителя и зачисление получателю одной транзакцией
+        passes = await adb.transfer_passes(sender, recipient, passes_to_transfer)
+        if passes is None:
+            sender_passes = await adb.get_queue_passes(sender)
             await ctx.send(f"❌ У вас недостаточно пропусков. Доступно: {sender_passes}")
             return
-        # Передаем пропуски
-        db.add_queue_pass(sender, -passes_to_transfer)  # Уменьшаем у отправителя
-        db.add_queue_pass(recipient, passes_to_transfer)  # Увеличиваем у получателя
-
-        # Получаем обновленное количество пропусков
-        new_sender_passes = db.get_queue_passes(sender)
-        new_recipient_passes = db.get_queue_passes(recipient)
+        new_sender_passes, new_recipient_passes = passes
 
         await ctx.send(
             f"⏩ {ctx.author.name} передал {passes_to_transfer} пропуск(ов) "
@@ -1356,19 +1170,18 @@ async def transfer_fish(ctx):
             return
 
         # Получаем инвентари обоих игроков
-        sender_inventory = get_user_inventory(sender)
-        recipient_inventory = get_user_inventory(recipient)
+        sender_inventory = await adb.run(get_user_inventory, sender)
 
         # Проверяем существование рыбы
         if fish_index < 0 or fish_index >= len(sender_inventory):
             await ctx.send(f"❌ Нет рыбы с номером {fish_index + 1} в вашем инвентаре")
             return
         fish_to_transfer = sender_inventory[fish_index]
-        removed_fish = remove_fish_from_inventory(sender, fish_index)
+        removed_fish = await adb.run(remove_fish_from_inventory, sender, fish_index)
         if not removed_fish:
             await ctx.send("❌ Ошибка при передаче рыбы")
             return
-        add_fish_to_inventory(recipient, fish_to_transfer)
+        await adb.run(add_fish_to_inventory, recipient, fish_to_transfer)
         await ctx.send(
             f"🎣 {ctx.author.name} передал рыбу '{fish_to_transfer['name']}' "
             f"игроку {recipient}!"
@@ -1387,7 +1200,7 @@ async def show_other_inventory(ctx, username: str, page: int = 1):
     if not ECONOMY_ENABLED:
         return
 
-    inventory = get_user_inventory(username.replace("@", "").strip())
+    inventory = await adb.run(get_user_inventory, username.replace("@", "").strip())
     if not inventory:
         await ctx.send(f"❌ У пользователя {username} нет рыбы!")
         return
@@ -1411,9 +1224,6 @@ async def show_other_inventory(ctx, username: str, page: int = 1):
         message.append(f"Используйте `!глядь {username} {page+1}` для следующей страницы")
     await ctx.send("\n".join(message))
 
-# Словарь для хранения времени последнего использования команды
-user_cooldowns = {}
-
 async def horoscope(ctx, zodiac_sign=None):
     logger.error(f"Вызвано !гороскоп для {zodiac_sign} пользователем {ctx.author.name}")
     
@@ -1422,8 +1232,7 @@ async def horoscope(ctx, zodiac_sign=None):
     
     # Проверка кулдауна для обычных пользователей
     if not is_privileged:
-        last_used = user_cooldowns.get(ctx.author.name)
-        if last_used and (datetime.now() - last_used).total_seconds() < 7200:  # 2 часа = 7200 секунд
+        if cooldowns.active("horoscope", ctx.author.name):  # 2 часа
             logger.info(f"Horoscope command on cooldown for {ctx.author.name}")
             return  # Просто выходим без сообщения
     
@@ -1448,7 +1257,7 @@ async def horoscope(ctx, zodiac_sign=None):
         
         # Обновляем время последнего использования для обычных пользователей
         if not is_privileged:
-            user_cooldowns[ctx.author.name] = datetime.now()
+            cooldowns.set("horoscope", ctx.author.name, 7200)
         
         await ctx.send(message)
     except Exception as e:
@@ -1456,9 +1265,6 @@ async def horoscope(ctx, zodiac_sign=None):
         logger.error(f"Horoscope command error: {message}")
         await ctx.send(message)
 
-# Словарь для хранения времени последнего использования команды дуэли
-user_cooldowns_duel = {}
-
 async def duel(ctx, target=None):
     logger.error(f"Вызвана дуэль: {ctx.author.name} vs {target}")
     
@@ -1477,8 +1283,7 @@ async def duel(ctx, target=None):
     
     # Проверка кулдауна для обычных пользователей
     if not is_privileged:
-        last_used = user_cooldowns_duel.get(ctx.author.name)
-        if last_used and (datetime.now() - last_used).total_seconds() < 600:  # 5 мин = 300
+        if cooldowns.active("duel", ctx.author.name):  # 10 мин
             return  # Просто выходим без сообщения
     outcome_type = random.choices(
         ['initiator_failed', 'target_failed', 'initiator_won', 'target_won', 'both_lost'],
@@ -1541,21 +1346,17 @@ async def transfer_coins(ctx):
             recipient = args[1].strip('@').lower()
             amount = int(args[2])
             sender = ctx.author.name.lower()
-            sender_balance = db.get_balance(sender)
             if sender == recipient:
                 await ctx.send("❌ Нельзя перевести самому себе")
                 return
-            if sender_balance >= amount and amount > 0:
-                success = db.transfer_coins(sender, recipient, amount)
-                if success:
-                    new_balance = db.get_balance(recipient)
-                    await ctx.send(
-                        f"💸 {ctx.author.name} перевел {amount} LC пользователю {recipient}. "
-                        f"Новый баланс получателя: {new_balance} LC"
-                    )
-                    logger.info(f"{sender} перевел {amount} LC на {recipient}")
-                else:
-                    await ctx.send("❌ Ошибка перевода")
+            balances = await adb.transfer(sender, recipient, amount) if amount > 0 else None
+            if balances:
+                new_balance = balances[1]
+                await ctx.send(
+                    f"💸 {ctx.author.name} перевел {amount} LC пользователю {recipient}. "
+                    f"Новый баланс получателя: {new_balance} LC"
+                )
+                logger.info(f"{sender} перевел {amount} LC на {recipient}")
             else:
                 await ctx.send("❌ Недостаточно средств или неверная сумма")
         else:
@@ -1570,7 +1371,7 @@ async def give_coins(ctx):
             if len(args) > 2:
                 username = args[1].strip('@').lower()
                 amount = int(args[2])
-                new_balance = db.add_coins(username, amount)
+                new_balance = await adb.add_coins(username, amount, reason='admin', ref=ctx.author.name.lower())
                 await ctx.send(f"🪙 {username} получил {amount} LC. Новый баланс: {new_balance} LC")
             else:
                 await ctx.send("❌ Использование: !выдать @ник сумма")
@@ -1584,11 +1385,8 @@ async def take_coins(ctx):
             if len(args) > 2:
                 username = args[1].strip('@').lower()
                 amount = int(args[2])
-                balance = db.get_balance(username)
-                if balance < amount:
-                    amount = balance
-                new_balance = db.add_coins(username, -amount)
-                await ctx.send(f"🪙 С {username} снято {amount} LC. Новый баланс: {new_balance} LC")
+                taken, new_balance = await adb.take_coins(username, amount, ref=ctx.author.name.lower()) or (0, 0)
+                await ctx.send(f"🪙 С {username} снято {taken} LC. Новый баланс: {new_balance} LC")
             else:
                 await ctx.send("❌ Использование: !снять @ник сумма")
         except ValueError:
@@ -1674,171 +1472,98 @@ async def fishing(ctx):
     if not ECONOMY_ENABLED:
         return
     username = ctx.author.name.lower()
-    current_time = time.time()
     now = datetime.now()
     if F_MODE == "limited":
         if not F_ACTIVE:
-            now = datetime.now()
-            next_window = (now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1))
-            wait_time = (next_window - now).total_seconds()
-            minutes = int(wait_time // 60)
+            next_window = get_fishing_schedule().next_window(now)
+            if next_window is None:
+                await ctx.send("⏳ Рыбалка закрыта! Ближайших окон нет")
+                return
+            wait_time = (next_window.start - now).total_seconds()
+            hours = int(wait_time // 3600)
+            minutes = int(wait_time % 3600 // 60)
             seconds = int(wait_time % 60)
             await ctx.send(
-                f"⏳ Рыбалка закрыта! Следующее окно через {minutes}м {seconds}с"
+                f"⏳ Рыбалка закрыта! Следующее окно через {f'{hours}ч ' if hours else ''}{minutes}м {seconds}с"
+                + (f" ({next_window.title})" if next_window.title else "")
             )
             return
-    if username in F_CD:
-        time_passed = time.time() - F_CD[username]
-        if time_passed < 300:
-            remaining = 300 - time_passed
-            await ctx.send(f"⏳ Следующая попытка через {int(remaining//60)}м {int(remaining%60)}с")
-            return
-    fish_catalog = db.get_fish_catalog()
-    fish_data = {"рыбы": fish_catalog}
-    if F_MODE == "limited" and F_ACTIVE:
-        rarity_weights = {
-            "common": 3000,
-            "uncommon": 2500,
-            "rare": 2000,
-            "epic": 1500,
-            "legendary": 800,
-            "immortal": 200,
-            "mythical": 100,
-            "arcane": 50,
-            "ultimate": 10
-        }
-        reward_multipliers = {
-            "common": 6.0,
-            "uncommon": 5.5,
-            "rare": 4.5,
-            "epic": 3.0,
-            "legendary": 2.0,
-            "immortal": 1.7,
-            "mythical": 1.5,
-            "arcane": 1.4,
-            "ultimate": 1.0
-        }
-    else:
-        rarity_weights = {
-            "common": 6000,
-            "uncommon": 3000,
-            "rare": 1500,
-            "epic": 400,
-            "legendary": 50,
-            "immortal": 5,
-            "mythical": 3,
-            "arcane": 2,
-            "ultimate": 1
-        }
-        reward_multipliers = {
-            "common": 1.0,
-            "uncommon": 1.0,
-            "rare": 1.0,
-            "epic": 1.0,
-            "legendary": 1.0,
-            "immortal": 1.0,
-            "mythical": 1.0,
-            "arcane": 1.0,
-            "ultimate": 1.0
-        }
-
-    # Редкость рыбы и их веса для выбора
-    FISH_RARITY_WEIGHTS = rarity_weights
-    
-    # Перевод названий редкости на русский язык
-    RARITY_NAMES_RU = {
-        "common": "Обычная",
-        "uncommon": "Необычная", 
-        "rare": "Редкая",
-        "epic": "Эпическая",
-        "legendary": "Легендарная",
-        "immortal": "Бессмертная",
-        "mythical": "Мифическая",
-        "arcane": "Волшебная",
-        "ultimate": "Ультимативная"
-    }
-    # Валюта бота
-    CURRENCY_NAME = "LC"  # Lonely Coins
-    
-    def get_fish_drop_chances():
-        """Получить шансы выпадения рыбы по редкости"""
-        rarity_info = FISH_RARITY_WEIGHTS
-        total_weight = sum(rarity_info.values())
-        chances = {}
-        
-        for rarity, weight in rarity_info.items():
-            chance = (weight / total_weight) * 100
-            chances[rarity] = {
-                'weight': weight,
-                'chance': chance
-            }
-        
-        return chances
-    # Use the exposed variables
-    available_fish = [
-        fish for fish in fish_data["рыбы"]
-        if not (fish["rarity"] == "ultimate" and fish.get("is_caught", False))
-    ]
-    if not available_fish:
-        await ctx.send("❌ В озере не осталось рыбы!")
+    mode = "limited" if F_MODE == "limited" and F_ACTIVE else "normal"
+    remaining = cooldowns.remaining("fishing", username)
+    if remaining:
+        await ctx.send(f"⏳ Следующая попытка через {int(remaining//60)}м {int(remaining%60)}с")
         return
-    
-    # Get drop chances for better fish selection
-    drop_chances = get_fish_drop_chances()
-    
-    # Create weighted pool using the exposed FISH_RARITY_WEIGHTS
-    weighted_pool = []
-    for fish in available_fish:
-        weight = FISH_RARITY_WEIGHTS.get(fish["rarity"], 0)
-        if weight > 0:
-            weighted_pool.extend([fish] * weight)
-    
-    if not weighted_pool:
-        await ctx.send("❌ Не удалось определить доступную рыбу")
+    # Забросы за ~250 мс обрабатываются одной пачкой и объявляются общими сообщениями
+    cooldowns.set("fishing", username, fishing_engine.mode(mode).cooldown)
+    try:
+        result = await cast_collector.submit((ctx, username, mode))
+    except Exception:
+        await ctx.send("❌ Не удалось поймать рыбу, попробуйте позже")
+        result = None
+    if result is None or not result.rolled:
+        cooldowns.clear("fishing", username)
         return
-    
-    caught_fish = random.choice(weighted_pool)
-    
-    # Use the exposed CURRENCY_NAME
-    if caught_fish["rarity"] != "ultimate":
-        caught_fish["base_price"] = int(caught_fish["base_price"] * reward_multipliers[caught_fish["rarity"]])
-    if caught_fish["rarity"] == "ultimate":
-        # Update fish as caught in database
-        db.connect()
-        cursor = db.conn.cursor()
-        cursor.execute('UPDATE items SET is_caught = 1 WHERE id = ?', (caught_fish['id'],))
-        db.conn.commit()
-        db.close()
-        
-    caught_copy = caught_fish.copy()
-    caught_copy["caught_at"] = int(current_time)
-    caught_copy["mode"] = F_MODE  # Save the mode in which the fish was caught
-    # Use base_price instead of price for database consistency
-    caught_copy["price"] = caught_copy.get("base_price", 0)
-    
-    # Add to inventory
-    item_data = {
-        'type': caught_copy.get('type', 'fish'),
-        'id': caught_copy.get('id'),
-        'name': caught_copy.get('name'),
-        'rarity': caught_copy.get('rarity', 'common'),
-        'price': caught_copy.get('price', 0),
-        'obtained_at': datetime.fromtimestamp(caught_copy.get('caught_at', time.time())).isoformat(),
-        'metadata': str(caught_copy.get('metadata', {}))
-    }
-    db.add_to_inventory(username, item_data)
-    
-    # Record the catch
-    db.record_fish_catch(username)
-    
-    F_CD[username] = current_time
-    # Get Russian name for rarity
-    rarity_ru = RARITY_NAMES_RU.get(caught_fish["rarity"], caught_fish["rarity"])
-    
-    await ctx.send(
-        f"🎣 {ctx.author.name} поймал "
-        f"{caught_fish['name']} ({rarity_ru})! +{caught_fish.get('base_price', 0)} {CURRENCY_NAME}"
-    )
+    if result.catches:
+        # Record the catch
+        await adb.record_fish_catch(username)
+
+async def resolve_casts(requests):
+    return await adb.run(fishing_engine.cast_batch, [(username, mode) for _, username, mode in requests],
+                         metadata=str({}))
+
+async def publish_casts(batch):
+    """Результаты пачки забросов: одна строка на заброс, несколько строк в сообщении"""
+    by_channel = {}
+    for (ctx, _, _), result in batch:
+        by_channel.setdefault(ctx.channel.name, []).append((ctx, result))
+    for entries in by_channel.values():
+        ctx = entries[0][0]
+        if len(entries) == 1:
+            result = entries[0][1]
+            if result is None:
+                await ctx.send("❌ Не удалось поймать рыбу, попробуйте позже")
+            elif not result.rolled:
+                await ctx.send("❌ В озере не осталось рыбы!")
+            elif not result.catches:
+                await ctx.send(f"😔 {ctx.author.name}, рыба сорвалась с крючка!")
+            else:
+                catch = result.catches[0]
+                await ctx.send(
+                    f"🎣 {ctx.author.name} поймал "
+                    f"{catch.fish.name} ({catch.rarity_name})! +{catch.value} {CURRENCY_NAME}"
+                )
+            continue
+        lines, lake_empty = [], False
+        for entry_ctx, result in entries:
+            name = entry_ctx.author.name
+            if result is None:
+                lines.append(f"{name}: ❌ ошибка")
+            elif not result.rolled:
+                lake_empty = True
+            elif not result.catches:
+                lines.append(f"{name}: 😔 сорвалась")
+            else:
+                catch = result.catches[0]
+                lines.append(f"{name}: {catch.fish.name} ({catch.rarity_name}) +{catch.value} {CURRENCY_NAME}")
+        if lake_empty:
+            lines.append("❌ В озере не осталось рыбы!")
+        for message in pack_chat_lines(lines, prefix="🎣 Улов: "):
+            await ctx.send(message)
+
+def pack_chat_lines(lines, prefix="", separator=" | ", limit=TWITCH_MESSAGE_LIMIT):
+    """Join lines into as few chat messages as fit into limit characters"""
+    messages, current = [], prefix
+    for line in lines:
+        candidate = current + (separator if current != prefix else "") + line
+        if len(candidate) > limit and current != prefix:
+            messages.append(current)
+            candidate = prefix + line
+        current = candidate[:limit]
+    if current != prefix:
+        messages.append(current)
+    return messages
+
+cast_collector = CastCollector(resolve_casts, publish_casts, delay=0.25)
 
 # Queue system
 async def join_queue(ctx):
@@ -1846,11 +1571,10 @@ async def join_queue(ctx):
     player_name = ctx.author.name
     player_name_lower = player_name.lower()
     args = ctx.message.content.split()
-    db._clean_expired_queue_entries()
     
     # Check if player is temporarily banned
-    if db.is_temp_banned(player_name_lower):
-        time_remaining = db.get_temp_ban_time(player_name_lower)
+    if await adb.is_temp_banned(player_name_lower):
+        time_remaining = await adb.get_temp_ban_time(player_name_lower)
         if time_remaining:
             minutes = time_remaining // 60
             seconds = time_remaining % 60
@@ -1859,7 +1583,7 @@ async def join_queue(ctx):
             return
     
     # Check if player is permanently banned
-    if db.is_banned(player_name_lower):
+    if await adb.is_banned(player_name_lower):
         await ctx.channel.send(f"❌ {player_name}, вы заблокированы и не можете записаться в очередь!")
         logger.info("banned player tried to join the queue")
         return
@@ -1876,7 +1600,7 @@ async def join_queue(ctx):
     number = args[1]
     use_pass = len(args) > 2 and args[2].lower() == "пропуск"
     
-    time_remaining = get_time_remaining(player_name)
+    time_remaining = await adb.run(get_time_remaining, player_name)
     if time_remaining and not use_pass:
         await ctx.channel.send(
             f"⏳ {player_name}, вы уже играли сегодня! "
@@ -1887,7 +1611,7 @@ async def join_queue(ctx):
         return
     
     if use_pass:
-        passes = db.get_queue_passes(player_name_lower)
+        passes = await adb.get_queue_passes(player_name_lower)
         if passes <= 0:
             await ctx.channel.send(
                 f"❌ {player_name}, у вас нет пропусков!"
@@ -1896,34 +1620,32 @@ async def join_queue(ctx):
             logger.info(f"{player_name} tried to use pass but has none")
             return
         
-        # Use one pass
-        db.add_queue_pass(player_name_lower, -1)
-        
-        # Clear cooldown for player
-        db.update_player(player_name_lower, last_played=None)
-        
-        # Add to front of queue
-        db.add_to_queue(player_name, number)
+        # Use one pass, clear cooldown and add to front of queue in one transaction
+        passes_left = await adb.join_queue_with_pass(player_name, number)
+        if passes_left is None:
+            await ctx.channel.send(f"❌ {player_name}, у вас нет пропусков!")
+            logger.info(f"{player_name} tried to use pass but has none")
+            return
         
         await ctx.channel.send(
             f"⏩ {player_name} использовал пропуск и теперь первый в очереди! "
-            f"🎫 Осталось пропусков: {passes - 1}"
+            f"🎫 Осталось пропусков: {passes_left}"
         )
         logger.info(f"{player_name} used pass to bypass cooldown")
         return
     
     # Check if player is already in queue
-    queue_position = db.get_queue_position(player_name_lower)
+    queue_position = await adb.get_queue_position(player_name_lower)
     if queue_position is not None:
         # Remove from queue
-        db.remove_from_queue(player_name_lower)
+        await adb.remove_from_queue(player_name_lower)
         await ctx.channel.send(f"❌ {player_name} удален из очереди!")
         logger.info(f"{player_name} removed from queue!")
     else:
         # Add to queue
-        db.add_to_queue(player_name, number)
+        await adb.add_to_queue(player_name, number)
         # Get the actual position of the user in the queue
-        position = db.get_queue_position(player_name_lower)
+        position = await adb.get_queue_position(player_name_lower)
         await ctx.channel.send(f"✅ {player_name} добавлен в очередь, вы {position} в очереди!")
         logger.info(f"{player_name} added to queue with number {number}!")
 
@@ -1934,6 +1656,7 @@ def get_user_inventory(username):
     # Convert database format to the old format for compatibility
     return [{
         'id': item['item_id'],
+        'inventory_id': item['id'],
         'name': item['item_name'],
         'rarity': item['rarity'],
         'price': item['value'],
@@ -2005,7 +1728,7 @@ async def show_inventory(ctx, *args):
             page = int(args[1])
     
     # Get inventory
-    inventory = get_user_inventory(ctx.author.name)
+    inventory = await adb.run(get_user_inventory, ctx.author.name)
     if not inventory:
         await ctx.send(f"❌ {ctx.author.name}, у вас нет рыбы! Используйте !рыбалка")
         return
@@ -2060,37 +1783,27 @@ async def sell_fish(ctx, fish_index: str = None):
         await ctx.send("❌ Укажите номер рыбы: `!продать <номер>` или `!продать всё`")
         return
     if fish_index.lower() in ['всё', 'все']:
-        inventory = get_user_inventory(ctx.author.name)
+        inventory = await adb.run(get_user_inventory, ctx.author.name)
         if not inventory:
             await ctx.send(f"❌ {ctx.author.name}, у вас нет рыбы для продажи!")
             return
-        total_income = 0
-        sold_count = 0
         kept_ultimate = 0
         kept_non_sale = 0
         # Separate fish to keep vs sell
-        fish_to_remove = []
-        for i, fish in enumerate(inventory):
+        fish_to_sell = []
+        for fish in inventory:
             if fish['rarity'] == 'ultimate':
                 kept_ultimate += 1
                 continue
             if fish['price']==0:
                 kept_non_sale += 1
                 continue
-            total_income += fish['price']
-            sold_count += 1
-            fish_to_remove.append(i)
-        # Remove sold fish from inventory (in reverse order to maintain indices)
-        for i in reversed(fish_to_remove):
-            remove_fish_from_inventory(ctx.author.name, i)
-        try:
-                fish_modi=upgrade.get_user_upgrades(ctx.author.name.lower())
-                total_income += int(total_income *fish_modi.get("sale_price_increase")*0.001)
-        except :
-                pass
-        if sold_count > 0:
-            db.add_coins(ctx.author.name, total_income)
-            new_balance = db.get_balance(ctx.author.name)
+            fish_to_sell.append(fish['inventory_id'])
+        # Удаление и зачисление одной транзакцией, уже проданные строки пропускаются
+        result = await adb.sell_inventory(ctx.author.name, fish_to_sell, ref=f"{len(fish_to_sell)} fish") if fish_to_sell else None
+        sold_count, total_income = (result[0], result[1]) if result else (0, 0)
+        if result:
+            new_balance = result[2]
             message = (f"💰 {ctx.author.name} продал {sold_count} рыб(y/ы) и получил {total_income} LC! 💳 Новый баланс: {new_balance} LC")
             if kept_ultimate > 0:
                 message += f"🔒 Сохранено {kept_ultimate} ultimate рыб(y/ы)"
@@ -2103,33 +1816,19 @@ async def sell_fish(ctx, fish_index: str = None):
         return
     try:
         fish_index = int(fish_index) - 1
-        inventory = get_user_inventory(ctx.author.name)
+        inventory = await adb.run(get_user_inventory, ctx.author.name)
         if fish_index < 0 or fish_index >= len(inventory):
             await ctx.send(f"❌ Нет рыбы с номером {fish_index + 1} в инвентаре!")
             return
         fish_to_sell = inventory[fish_index]
-        price = fish_to_sell['price']
-        
-        if fish_to_sell['rarity'] == 'ultimate':
-            # Mark fish as uncaught in database
-            db.connect()
-            cursor = db.conn.cursor()
-            cursor.execute('UPDATE items SET is_caught = 0 WHERE id = ?', (fish_to_sell.get('item_id', fish_to_sell.get('id')),))
-            db.conn.commit()
-            db.close()
-            
-        removed_fish = remove_fish_from_inventory(ctx.author.name, fish_index)
-        if not removed_fish:
+        fish_id = fish_to_sell.get('id')
+        # Ultimate рыба снова становится доступной в той же транзакции, что и продажа
+        release = [fish_id] if fish_to_sell['rarity'] == 'ultimate' else []
+        result = await adb.sell_inventory(ctx.author.name, [fish_to_sell['inventory_id']], release, ref=fish_id)
+        if not result:
             await ctx.send("❌ Ошибка при продаже рыбы!")
             return
-        try:
-                fish_modi=upgrade.get_user_upgrades(ctx.author.name.lower())
-                price += int(price *fish_modi.get("sale_price_increase")*0.001)
-                print(price)
-        except :
-                pass
-        db.add_coins(ctx.author.name, price)
-        new_balance = db.get_balance(ctx.author.name)
+        _, price, new_balance = result
         price_emojis = {
             "common": "🪙",
             "uncommon": "💰",
@@ -2181,39 +1880,36 @@ async def buy_item(ctx, item_id: str = None):
         if item["name"] == "Случайная уникальная рыба":
             print("test")
             # Special case: buying random unique fish
-            user_balance = db.get_balance(ctx.author.name)
             fish_price = item["price"]  # Fixed price for unique fish
             
-            # Check if user has enough funds
-            if user_balance < fish_price:
-                await ctx.send(f"❌ Недостаточно LC. Нужно {fish_price} LC, у вас {user_balance} LC")
-                return
-            
             # Get list of all unique (ultimate) fish that haven't been caught yet
-            db.connect()
-            cursor = db.conn.cursor()
-            cursor.execute('SELECT * FROM items WHERE type = "fish" AND rarity = "ultimate" AND is_caught = 0')
-            available_fish = cursor.fetchall()
+            available_fish = [
+                fish for fish in await adb.get_fish_catalog()
+                if fish["rarity"] == "ultimate" and not fish["is_caught"]
+            ]
             
             if not available_fish:
                 await ctx.send("❌ К сожалению, все уникальные рыбы уже куплены или пойманы!")
                 return
                 
             # Select random fish from available ones
-            fish_item = dict(random.choice(available_fish))
+            fish_item = random.choice(available_fish)
             
-            # Mark fish as caught
-            cursor.execute('UPDATE items SET is_caught = 1 WHERE id = ?', (fish_item['id'],))
-            db.conn.commit()
-            db.close()
-            # Add fish to user's inventory
-            fish_to_add = fish_item.copy()
-            fish_to_add["caught_at"] = int(time.time())
-            fish_to_add["mode"] = "purchased"
-            fish_to_add["price"] = fish_to_add["base_price"]
-            add_fish_to_inventory(ctx.author.name, fish_to_add)
-            # Deduct money
-            db.add_coins(ctx.author.name, -fish_price)
+            # Deduct money, mark fish as caught and add it to inventory in one transaction
+            new_balance = await adb.purchase(ctx.author.name, fish_price, [
+                db.repo.claim_unique_fish_statement(fish_item['id']),
+                db.repo.inventory_item_statement(
+                    ctx.author.name, 'fish', fish_item['id'], fish_item['name'], fish_item['rarity'],
+                    fish_item['base_price'], datetime.now().isoformat(), str({})
+                )
+            ], reason='fish_purchase', ref=fish_item['id'])
+            if new_balance is None:
+                user_balance = await adb.get_balance(ctx.author.name)
+                if user_balance < fish_price:
+                    await ctx.send(f"❌ Недостаточно LC. Нужно {fish_price} LC, у вас {user_balance} LC")
+                else:
+                    await ctx.send("❌ К сожалению, все уникальные рыбы уже куплены или пойманы!")
+                return
             
             await ctx.send(
                 f"🎉 {ctx.author.name} купил уникальную рыбу: {fish_item['name']}! "
@@ -2222,15 +1918,16 @@ async def buy_item(ctx, item_id: str = None):
             logger.info(f"{ctx.author.name} купил уникальную рыбу: {fish_item['name']} (ID:{fish_item['id']})")
             return
         
-        user_balance = db.get_balance(ctx.author.name)
-        if user_balance < item["price"]:
-            await ctx.send(f"❌ Недостаточно LC. Нужно {item['price']} LC, у вас {user_balance} LC")
-            return
         bonus_msg = ""
+        statements = []
         if item["name"] == "Пропуск в очередь":
-            db.add_queue_pass(ctx.author.name.lower(), 1)
+            statements.append(db.repo.queue_pass_statement(ctx.author.name, 1))
             bonus_msg = "🎫 +1 пропуск в очередь"
-        db.add_coins(ctx.author.name, -item["price"])
+        new_balance = await adb.purchase(ctx.author.name, item["price"], statements, reason='shop', ref=item_id)
+        if new_balance is None:
+            user_balance = await adb.get_balance(ctx.author.name)
+            await ctx.send(f"❌ Недостаточно LC. Нужно {item['price']} LC, у вас {user_balance} LC")
+            return
         await ctx.send(f"✅ Успешная покупка! ✅{bonus_msg}")
         logger.info(f"{ctx.author.name} купил {item['name']} (ID:{item_id}) за {item['price']} LC")
     
@@ -2249,7 +1946,8 @@ async def show_shop(ctx, page: int = 1):
     page = max(1, min(page, total_pages))
     start_idx = (page - 1) * ITEMS_PER_PAGE
     end_idx = min(start_idx + ITEMS_PER_PAGE, len(shop_items))
-    message = [f"🛒 Магазин LC (Стр. {page}/{total_pages}) Ваш баланс: {db.get_balance(ctx.author.name)} LC"]
+    balance = await adb.get_balance(ctx.author.name)
+    message = [f"🛒 Магазин LC (Стр. {page}/{total_pages}) Ваш баланс: {balance} LC"]
     for idx in range(start_idx, end_idx):
         item = shop_items[idx]
         message.append(
@@ -2261,7 +1959,6 @@ async def show_shop(ctx, page: int = 1):
     await ctx.send("".join(message))
 
 # Slots game
-SLOT_CD = {}
 
 async def slot_machine(ctx):
     global ECONOMY_ENABLED
@@ -2269,13 +1966,10 @@ async def slot_machine(ctx):
         return
     logger.error("Вызвано !слоты")
     username = ctx.author.name.lower()
-    current_time = datetime.now()
-    if username in SLOT_CD:
-        last_used = SLOT_CD[username]
-        if current_time - last_used < timedelta(minutes=2):
-            remaining = (last_used + timedelta(minutes=2) - current_time)
-            await ctx.send(f"⏳ {ctx.author.name}, следующая попытка через {remaining.seconds//60}м {remaining.seconds%60}с")
-            return
+    remaining = int(cooldowns.remaining("slots", username))
+    if remaining:
+        await ctx.send(f"⏳ {ctx.author.name}, следующая попытка через {remaining//60}м {remaining%60}с")
+        return
     cost = 10
     args = ctx.message.content.split()
     try:
@@ -2287,7 +1981,7 @@ async def slot_machine(ctx):
     except ValueError:
         await ctx.send("❌ Укажите корректную сумму (число)")
         return
-    balance = db.get_balance(username)
+    balance = await adb.get_balance(username)
     if balance < cost:
         await ctx.send(f"❌ Недостаточно LC. Игра стоит {cost} LC (у вас {balance} LC)")
         return
@@ -2304,8 +1998,8 @@ async def slot_machine(ctx):
     else:
         win = -cost
         prize = f"Проигрыш {cost} LC"
-    new_balance = db.add_coins(username, win)
-    SLOT_CD[username] = current_time
+    new_balance = await adb.add_coins(username, win, reason='slots')
+    cooldowns.set("slots", username, 120)
     await ctx.send(
         f"🎰 {ctx.author.name} крутит слоты: {result} || {prize} "
         f"(Баланс: {new_balance} LC)"
@@ -2314,7 +2008,7 @@ async def slot_machine(ctx):
 # Daily reward
 async def daily_reward(ctx):
     username = ctx.author.name.lower()
-    player = db.get_player(username)
+    player = await adb.get_player(username)
     current_time = time.time()
     last_claim = player.get('last_daily_reward', 0) if player else 0
     
@@ -2326,8 +2020,8 @@ async def daily_reward(ctx):
             last_claim = 0
     
     if current_time - last_claim >= 86400:  # 24 hours
-        coins = db.add_coins(username, DAILY_REWARD)
-        db.update_player(username, last_daily_reward=int(current_time))
+        coins = await adb.add_coins(username, DAILY_REWARD, reason='daily')
+        await adb.update_player(username, last_daily_reward=int(current_time))
         await ctx.send(
             f"🎁 {ctx.author.name}, вы получили {DAILY_REWARD} LC! "
             f"Теперь у вас {coins} LC"
@@ -2349,10 +2043,7 @@ async def top_rich(ctx):
     if not ECONOMY_ENABLED:
         return
     # Get top users from database
-    db.connect()
-    cursor = db.conn.cursor()
-    cursor.execute('SELECT username, balance FROM players WHERE balance > 0 ORDER BY balance DESC LIMIT 5')
-    top_users = cursor.fetchall()
+    top_users = await adb.get_top_balances(5)
     
     if not top_users:
         await ctx.send("ℹ️ Нет данных о балансах")
@@ -2362,36 +2053,31 @@ async def top_rich(ctx):
         f"{i+1}. {user['username']}: {user['balance']} LC"
         for i, user in enumerate(top_users)
     )
-    db.close()
     await ctx.send(message)
 
 # Queue management
 async def show_queue(ctx, page: str = None):
-    # Clean expired entries when showing queue
-    db._clean_expired_queue_entries()
-    
-    queue = db.get_queue()
+    queue_length = await adb.get_queue_length()
     logger.error(f"Вызвано !очередь, страница {page if page else '1'}")
-    if not queue:
+    if not queue_length:
         await ctx.channel.send("Очередь пуста FeelsBadMan")
         return
     try:
         page=int(page)
     except:
         page = 1
-    for entry in queue:
-        if str(entry['username']) == str(ctx.author.name.lower()):
-            queue_position = db.get_queue_position(ctx.author.name.lower())
-            await ctx.channel.send(
-                f"@{ctx.author.name} вы в очереди. "
-                f"Позиция {queue_position}/{len(queue)}"
-            )
-            if page> 0:
-                return
+    queue_position = await adb.run(db.queue.position, ctx.author.name.lower())
+    if queue_position is not None:
+        await ctx.channel.send(
+            f"@{ctx.author.name} вы в очереди. "
+            f"Позиция {queue_position}/{queue_length}"
+        )
+        if page> 0:
+            return
     if page is None:
         page = 1
     per_page = 5
-    total_pages = (len(queue) + per_page - 1) // per_page
+    total_pages = (queue_length + per_page - 1) // per_page
     if page < 1:
         await ctx.channel.send(f"Некорректная страница. Доступно: 1-{total_pages}")
         return
@@ -2399,10 +2085,9 @@ async def show_queue(ctx, page: str = None):
         await join_queue(ctx)
         return
     start = (page-1)*per_page
-    end = start + per_page
     queue_part = [
         f"{i+1}. {entry['username']} {entry['number']}"
-        for i, entry in enumerate(queue[start:end], start)
+        for i, entry in enumerate(await adb.run(db.queue.page, start, per_page), start)
     ]
     msg = (
         f"Очередь [{page}/{total_pages}]: " +
@@ -2417,12 +2102,12 @@ async def toggle_ban(ctx):
         if len(num) > 1:
             player_name = num[1].replace("@", "").strip().lower()
             # Check if player is already banned
-            if db.is_banned(player_name):
-                db.unban_player(player_name)
+            if await adb.is_banned(player_name):
+                await adb.unban_player(player_name)
                 await ctx.channel.send(f"✅ {player_name} теперь может снова записываться в очередь!")
                 logger.info(f"{player_name} removed from banlist!")
             else:
-                db.ban_player(player_name)
+                await adb.ban_player(player_name)
                 await ctx.channel.send(f"🚫 {player_name} забанен и больше не может записываться в очередь!")
                 logger.info(f"{player_name} added to banlist!")
         else:
@@ -2473,11 +2158,19 @@ async def my_message_handler(ctx):
                 
 
 async def event_ready():
-    global N_TASK
+    global N_TASK, Q_TASK, L_TASK
     logger.info(f"Bot {botMOD.nick} подключен к {CHANNEL}!")
     print("Запущен TW")
 
     N_TASK = asyncio.create_task(fishing_notifier())
+    if Q_TASK is None or Q_TASK.done():
+        Q_TASK = asyncio.create_task(queue_expiry_sweeper())
+    if L_TASK is None or L_TASK.done():
+        L_TASK = asyncio.create_task(ledger_reconciler())
+    try:
+        await queue_feed.start()
+    except OSError as e:
+        logger.error(f"Не удалось запустить ленту очереди на порту {queue_feed.port}: {e}")
 
 async def event_disconnected(ws, error):
     """Handler for when the bot is disconnected from Twitch"""
@@ -2486,35 +2179,88 @@ async def event_disconnected(ws, error):
     asyncio.create_task(restart_bot_with_delay())
 
 # Fishing notifier
+async def announce_fishing_window(window):
+    channel = botMOD.get_channel(CHANNEL)
+    if not channel:
+        return
+    if window is None:
+        text = "⏳ ⏳ ⏳ ОКНО РЫБАЛКИ ЗАКРЫТО ⏳ ⏳ ⏳ Больше рыбы и активностей --> https://t.me/PeroFish_bot"
+    else:
+        text = f"🎣 🎣 🎣 ОКНО РЫБАЛКИ ОТКРЫТО! 🎣 🎣 🎣 У вас есть {window.minutes} минут для рыбалки!"
+        if window.title:
+            text += f" {window.title}"
+    try:
+        await channel.send(text)
+    except Exception as e:
+        logger.warning(f"Не удалось отправить сообщение об окне рыбалки: {e}")
+        await reboot()
+
 async def fishing_notifier():
+    """Открывает и закрывает окна рыбалки точно по расписанию.
+
+    Sleeps until the next window boundary instead of polling; a mode switch or
+    schedule reload sets FISHING_SCHEDULE_CHANGED to recompute the state early.
+    """
     global F_ACTIVE, F_MODE
     while True:
+        timeout = None
         try:
-            now = datetime.now()
+            FISHING_SCHEDULE_CHANGED.clear()
             if F_MODE == "limited":
-                
-                    if now.minute >= 7 and F_ACTIVE:
-                        F_ACTIVE = False
-                        channel = botMOD.get_channel(CHANNEL)
-                        if channel:
-                            try:
-                                await channel.send("⏳ ⏳ ⏳ ОКНО РЫБАЛКИ ЗАКРЫТО ⏳ ⏳ ⏳ Больше рыбы и активностей --> https://t.me/PeroFish_bot")
-                            except Exception as e:
-                                logger.warning(f"Не удалось отправить сообщение о закрытии окна рыбалки: {e}")
-                                await reboot()
-                    if now.minute < 7 and not F_ACTIVE:
-                        F_ACTIVE = True
-                        channel = botMOD.get_channel(CHANNEL)
-                        if channel:
-                            try:
-                                await channel.send("🎣 🎣 🎣 ОКНО РЫБАЛКИ ОТКРЫТО! 🎣 🎣 🎣 У вас есть 7 минут для рыбалки!")
-                            except Exception as e:
-                                logger.warning(f"Не удалось отправить сообщение об открытии окна рыбалки: {e}")
-                                await reboot()
+                now = datetime.now()
+                schedule = get_fishing_schedule()
+                window = schedule.current_window(now)
+                if (window is not None) != F_ACTIVE:
+                    F_ACTIVE = window is not None
+                    await announce_fishing_window(window)
+                boundary, _ = schedule.next_boundary(now)
+                if boundary is not None:
+                    timeout = max((boundary - datetime.now()).total_seconds(), 0.05)
         except Exception as e:
             logger.exception("Ошибка в fishing_notifier")
-        finally:
-            await asyncio.sleep(1)
+            timeout = 60
+        try:
+            await asyncio.wait_for(FISHING_SCHEDULE_CHANGED.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+async def queue_expiry_sweeper():
+    """Убирает из очереди записи старше 8 часов.
+
+    Sleeps until the oldest entry expires; an empty queue is checked again
+    after QUEUE_MAX_AGE, since nothing added meanwhile can expire earlier.
+    Expired players are announced to the moderators in one batch.
+    """
+    while True:
+        try:
+            expired = await adb.remove_expired_queue_entries()
+            if expired:
+                names = [f"{entry['username']} {entry['number']}" for entry in expired]
+                logger.info(f"Queue entries expired: {', '.join(names)}")
+                channel = botMOD.get_channel(CHANNEL)
+                if channel:
+                    for text in pack_chat_lines(names, prefix="⌛ Модераторам: 8 часов в очереди истекли у ", separator=", "):
+                        await channel.send(text)
+            next_expiry = await adb.run(db.queue.next_expiry)
+            timeout = QUEUE_MAX_AGE.total_seconds()
+            if next_expiry is not None:
+                timeout = min(max((next_expiry - datetime.utcnow()).total_seconds(), 0) + 1, timeout)
+        except Exception:
+            logger.exception("Ошибка в queue_expiry_sweeper")
+            timeout = 60
+        await asyncio.sleep(timeout)
+
+async def ledger_reconciler():
+    """Периодическая сверка балансов с ledger, только строки после прошлой сверки"""
+    reconciler = LedgerReconciler(db.db_path)
+    while True:
+        try:
+            result = await adb.run(reconciler.run, timeout=60)
+            if result and result['mismatches']:
+                logger.warning(f"Ledger reconcile: {result['mismatches']} balances changed without a ledger entry")
+        except Exception:
+            logger.exception("Ошибка в ledger_reconciler")
+        await asyncio.sleep(LEDGER_RECONCILE_INTERVAL)
 
 # Bot commands
 @botMOD.command(name='баланс')
@@ -2523,7 +2269,7 @@ async def check_balance(ctx, *args, **kwargs):
     if not ECONOMY_ENABLED:
         return
     username = ctx.author.name
-    balance = db.get_balance(username)
+    balance = await adb.get_balance(username)
     await ctx.send(f"💰 {username}, ваш баланс: {balance} LC")
 
 @botMOD.command(name='ежедневка')
@@ -2702,16 +2448,16 @@ async def use_skip(ctx):
     player_name = ctx.author.name.replace("@", "").strip()
     
     # Check if player has queue passes
-    passes = db.get_queue_passes(player_name)
+    passes = await adb.get_queue_passes(player_name)
     if passes <= 0:
         await ctx.channel.send(f"❌ {player_name}, у вас нет пропусков!")
         logger.info(f"{player_name} пытался использовать пропуск, но у него их 0.")
         return
     
     # Check pass cooldown (8 hours)
-    if not db.can_use_pass(player_name):
+    if not await adb.can_use_pass(player_name):
         # Calculate remaining cooldown time
-        last_used = db.get_pass_cooldown(player_name)
+        last_used = await adb.get_pass_cooldown(player_name)
         current_time = int(time.time())
         elapsed_time = current_time - last_used
         remaining_time = max(0, 28800 - elapsed_time)  # 8 hours in seconds
@@ -2727,32 +2473,17 @@ async def use_skip(ctx):
         return
     
     # Check if player is in queue
-    queue_position = db.get_queue_position(player_name)
+    queue_position = await adb.get_queue_position(player_name)
     if queue_position is None:
         await ctx.channel.send(f"❌ {player_name}, ты не в очереди!")
         logger.info(f"{player_name} попытался использовать пропуск, но его нет в очереди.")
         return
     
-    # Move player to front of queue
-    queue = db.get_queue()
-    player_entry = None
-    for i, entry in enumerate(queue):
-        if entry['username'].lower() == player_name.lower():
-            player_entry = queue.pop(i)
-            break
-    
-    if player_entry:
-        queue.insert(0, player_entry)
-        # Update queue in database - this would require a full rewrite of the queue table
-        # For now we'll just use the existing method
-        for entry in queue:
-            db.add_to_queue(entry['username'], entry['number'])
-    
-    # Decrement passes
-    db.add_queue_pass(player_name, -1)
-    
-    # Update pass cooldown
-    db.update_pass_cooldown(player_name, int(time.time()))
+    # Move player to front of queue, decrement passes and update pass cooldown together
+    if await adb.use_queue_pass(player_name, int(time.time())) is None:
+        await ctx.channel.send(f"❌ {player_name}, не удалось использовать пропуск!")
+        logger.info(f"{player_name} не смог использовать пропуск: пропуск уже потрачен или очередь изменилась.")
+        return
     
     await ctx.channel.send(f"⏩ {player_name} использовал пропуск и теперь стоит первым в очереди!")
     logger.info(f"{player_name} использовал пропуск и переместился в начало очереди.")
@@ -2769,9 +2500,9 @@ async def give_skip(ctx, *args, **kwargs):
     amount = int(args[2]) if len(args) > 2 and args[2].isdigit() else 1
     
     # Add passes to player
-    db.add_queue_pass(player_name, amount)
+    await adb.add_queue_pass(player_name, amount)
     
-    passes = db.get_queue_passes(player_name)
+    passes = await adb.get_queue_passes(player_name)
     await ctx.send(
         f"⏩ {ctx.author.name} выдал {player_name} "
         f"{amount} пропуск(ов)! Теперь у него {passes}"
@@ -2784,10 +2515,8 @@ async def remove_skip(ctx):
         if len(args) > 1:
             player_name = args[1].replace("@", "").strip().lower()
             # Remove one pass
-            passes_before = db.get_queue_passes(player_name)
-            if passes_before > 0:
-                db.add_queue_pass(player_name, -1)
-                passes_after = db.get_queue_passes(player_name)
+            passes_after = await adb.spend_queue_pass(player_name)
+            if passes_after is not None:
                 await ctx.channel.send(f"⏳ {ctx.author.name} убрал у {player_name} 1 пропуск! Осталось {passes_after}.")
                 logger.info(f"{ctx.author.name} убрал пропуск у {player_name}. Осталось {passes_after}")
             else:
@@ -2805,7 +2534,7 @@ async def check_passes(ctx):
     else:
         player_name = ctx.author.name.replace("@", "").strip().lower()
     
-    passes = db.get_queue_passes(player_name)
+    passes = await adb.get_queue_passes(player_name)
     if passes == 1:
         word = "пропуск"
     elif 2 <= passes <= 4:
@@ -2827,51 +2556,30 @@ async def pick_users(ctx, count: int = 1):
             await ctx.channel.send("❌ Количество игроков должно быть положительным числом!")
             return
         
-        queue = db.get_queue()
-        count = min(count, len(queue)) if queue else 0
+        picked_users = await adb.dequeue_many(count=count)
+        count = len(picked_users)
         if count == 0:
             await ctx.channel.send("❌ Очередь пуста!")
             return
         
-        # Get the first 'count' users from queue
-        picked_users = queue[:count]
-        
-        # Remove picked users from queue
-        for user in picked_users:
-            db.remove_from_queue(user['username'])
-        
-        # Update last played for picked users
-        for user in picked_users:
-            db.update_player(user['username'].lower(), last_played=datetime.now().isoformat())
-        
         selected_names = " || ".join([f"{entry['username']} {entry['number']}" for entry in picked_users])
         await ctx.channel.send(f"🎲 Выбраны ({count}): {selected_names}")
         logger.info(f"Selected {count} users: {selected_names}")
 
-async def pick_random_users(ctx, count: int = 1):
+async def pick_random_users(ctx, count: int = 1, weighted: bool = False):
     if moder(ctx):
-        logger.error(f"Вызвано !pick_random {count}")
+        logger.error(f"Вызвано !pick_random {count}{' ожидание' if weighted else ''}")
         if count < 1:
             await ctx.channel.send("❌ Количество игроков должно быть положительным числом!")
             return
         
-        queue = db.get_queue()
-        count = min(count, len(queue)) if queue else 0
+        # Randomly select users, with weighted=True the longer wait the higher the chance
+        picked_users = await adb.dequeue_many(count=count, randomly=True, weighted=weighted)
+        count = len(picked_users)
         if count == 0:
             await ctx.channel.send("❌ Очередь пуста!")
             return
         
-        # Randomly select users
-        picked_users = random.sample(queue, count)
-        
-        # Remove picked users from queue
-        for user in picked_users:
-            db.remove_from_queue(user['username'])
-        
-        # Update last played for picked users
-        for user in picked_users:
-            db.update_player(user['username'].lower(), last_played=datetime.now().isoformat())
-        
         selected_names = " || ".join([f"{entry['username']} {entry['number']}" for entry in picked_users])
         await ctx.channel.send(f"🎲 Случайно выбраны ({count}): {selected_names}")
         logger.info(f"Randomly selected {count} users: {selected_names}")
@@ -2882,15 +2590,13 @@ async def remove_from_queue_cmd(ctx):
         args = ctx.message.content.split()
         if len(args) > 1 and args[1].isdigit():
             position = int(args[1]) - 1
-            queue = db.get_queue()
-            if 0 <= position < len(queue):
-                removed_player = queue[position]
-                db.remove_from_queue(removed_player['username'])
-                queue = db.get_queue()  # Refresh queue after removal
+            removed_player = await adb.remove_from_queue_at(position)
+            if removed_player:
                 await ctx.channel.send(f"🗑 {ctx.author.name} удалил {removed_player['username']} из очереди!")
                 logger.info(f"{ctx.author.name} удалил {removed_player['username']} из очереди (позиция {position+1})")
             else:
-                await ctx.channel.send(f"❌ Неверный номер! В очереди всего {len(queue)} игроков.")
+                queue_length = await adb.get_queue_length()
+                await ctx.channel.send(f"❌ Неверный номер! В очереди всего {queue_length} игроков.")
                 logger.info(f"{ctx.author.name} попытался удалить игрока с неверной позицией ({position+1})")
         else:
             await ctx.channel.send("❌ Использование: !удалить <номер в списке>")
@@ -2898,17 +2604,31 @@ async def remove_from_queue_cmd(ctx):
     else:
         logger.info(f"{ctx.author.name} попытался удалить игрока без прав")
 
+async def move_in_queue_cmd(ctx):
+    if moder(ctx):
+        logger.error("Вызвано !двинуть")
+        args = ctx.message.content.split()
+        if len(args) > 2 and args[1].isdigit() and args[2].isdigit():
+            moved = await adb.move_queue_entry(int(args[1]) - 1, int(args[2]))
+            if moved:
+                username, position = moved
+                await ctx.channel.send(f"↕️ {ctx.author.name} переместил {username} на позицию {position}")
+                logger.info(f"{ctx.author.name} переместил {username} с позиции {args[1]} на {position}")
+            else:
+                queue_length = await adb.get_queue_length()
+                await ctx.channel.send(f"❌ Неверный номер! В очереди всего {queue_length} игроков.")
+        else:
+            await ctx.channel.send("❌ Использование: !двинуть <номер в списке> <новая позиция>")
+    else:
+        logger.info(f"{ctx.author.name} попытался переместить игрока без прав")
+
 async def clear_cooldowns(ctx, username: str = None):
     if moder(ctx):
-        db.connect()
-        cursor = db.conn.cursor()
         if username:
             # Remove @ symbol if present
             clean_username = username.lstrip('@').lower()
             # Clear last played data for specific user
-            cursor.execute('UPDATE players SET last_played = NULL WHERE username = ?', (clean_username,))
-            db.conn.commit()
-            if cursor.rowcount > 0:
+            if await adb.clear_last_played(clean_username) > 0:
                 await ctx.channel.send(f"🗑 Кулдаун для очереди снят для пользователя {clean_username}")
                 logger.info(f"LastPlayed cleared for {clean_username} by moderator {ctx.author.name}")
             else:
@@ -2916,39 +2636,19 @@ async def clear_cooldowns(ctx, username: str = None):
                 logger.info(f"Attempt to clear cooldown for non-existent user {clean_username} by {ctx.author.name}")
         else:
             # Clear last played data for all players
-            cursor.execute('UPDATE players SET last_played = NULL')
-            db.conn.commit()
+            await adb.clear_last_played()
             await ctx.channel.send("🗑 Все кулдауны для очереди сняты")
             logger.info("LastPlayed cleared by moderator!")
-        db.close()
 
 async def clear_queue_cmd(ctx):
     if moder(ctx):
-        logger.info("ОЧЕРЕДЬ ПЕРЕД ОЧИСТКОЙ", db.get_queue())
-        # Clear queue table
-        db.connect()
-        cursor = db.conn.cursor()
-        cursor.execute('DELETE FROM queue')
-        db.conn.commit()
+        await adb.clear_queue()
         await ctx.channel.send("🗑 Очередь очищена!")
         logger.info("Queue cleared by moderator!")
-        db.close()
 
 async def show_banlist(ctx):
     if moder(ctx):
-        db.connect()
-        cursor = db.conn.cursor()
-        cursor.execute('SELECT username FROM bans')
-        rows = cursor.fetchall()
-        # Handle case where row might be a tuple or dict
-        banned_users = []
-        for row in rows:
-            if isinstance(row, dict):
-                banned_users.append(row.get('username'))
-            else:
-                # If it's a tuple, get the first element
-                banned_users.append(row[0] if len(row) > 0 else None)
-        banned_users = [user for user in banned_users if user is not None]
+        banned_users = await adb.get_banlist()
         
         if banned_users:
             ban_list = " || ".join(banned_users)
@@ -2957,7 +2657,6 @@ async def show_banlist(ctx):
         else:
             await ctx.channel.send("✅ В банлисте никого нет!")
             logger.info("Banlist empty")
-        db.close()
 
 # Add more command handlers
 @botMOD.command(name='пусти')
@@ -2996,24 +2695,39 @@ async def fish_mod_change(ctx, *args, **kwargs):
         else:
             F_MODE = "limited"
             await ctx.send("✅ Режим рыбачим изменен на ограниченную")
+        FISHING_SCHEDULE_CHANGED.set()
         
 
+@botMOD.command(name='окна')
+@commands_enabled
+async def fishing_windows_cmd(ctx, *args, **kwargs):
+    """Ближайшие окна рыбалки, модераторы: !окна reload перечитывает fishing_schedule.json"""
+    args = ctx.message.content.split()
+    if len(args) > 1 and args[1] == "reload" and moder(ctx):
+        reload_fishing_schedule()
+        FISHING_SCHEDULE_CHANGED.set()
+        await ctx.send("✅ Расписание рыбалки перечитано")
+        return
+    if F_MODE != "limited":
+        await ctx.send("🎣 Рыбалка открыта постоянно")
+        return
+    windows = get_fishing_schedule().upcoming(count=3)
+    if not windows:
+        await ctx.send("⏳ Ближайших окон рыбалки нет")
+        return
+    await ctx.send("🎣 Окна рыбалки: " + " | ".join(
+        f"{w.start:%d.%m %H:%M}-{w.end:%H:%M}" + (f" {w.title}" if w.title else "") for w in windows))
+
 @botMOD.command(name='сборка')
 @commands_enabled
 async def generate_build_cmd(ctx, *args, **kwargs):
     """Генерирует случайную сборку"""
     # Check for cooldown
     username = ctx.author.name.lower()
-    current_time = datetime.now()
-    
-    if username in BUILD_CD:
-        last_used = BUILD_CD[username]
-        if current_time - last_used < timedelta(minutes=7):
-            remaining = (last_used + timedelta(minutes=7) - current_time)
-            minutes = remaining.seconds // 60
-            seconds = remaining.seconds % 60
-            await ctx.send(f"⏳ {ctx.author.name}, следующая сборка через {minutes}м {seconds}с")
-            return
+    remaining = int(cooldowns.remaining("build", username))
+    if remaining:
+        await ctx.send(f"⏳ {ctx.author.name}, следующая сборка через {remaining // 60}м {remaining % 60}с")
+        return
     
     try:
         # Load heroes data
@@ -3054,7 +2768,7 @@ async def generate_build_cmd(ctx, *args, **kwargs):
         logger.info(f"Generated build: {hero_name} with items {item_names}")
         
         # Set cooldown
-        BUILD_CD[username] = current_time
+        cooldowns.set("build", username, 7 * 60)
         
     except FileNotFoundError as e:
         await ctx.send("❌ Ошибка: не удалось найти файлы с героями или предметами")
@@ -3062,7 +2776,6 @@ async def generate_build_cmd(ctx, *args, **kwargs):
     except Exception as e:
         await ctx.send("❌ Ошибка при генерации сборки")
         logger.error(f"Error generating build: {e}")
-BUILD_CD={}
 
 @botMOD.command(name='pick')
 @commands_enabled
@@ -3076,13 +2789,19 @@ async def pick_users_cmd(ctx, *args, **kwargs):
 async def pick_random_users_cmd(ctx, *args, **kwargs):
     args = ctx.message.content.split()
     count = int(args[1]) if len(args) > 1 and args[1].isdigit() else 1
-    await pick_random_users(ctx, count)
+    weighted = any(arg.lower() == "ожидание" for arg in args[1:])
+    await pick_random_users(ctx, count, weighted)
 
 @botMOD.command(name='удалить')
 @commands_enabled
 async def remove_from_queue_cmd_handler(ctx, *args, **kwargs):
     await remove_from_queue_cmd(ctx)
 
+@botMOD.command(name='двинуть')
+@commands_enabled
+async def move_in_queue_cmd_handler(ctx, *args, **kwargs):
+    await move_in_queue_cmd(ctx)
+
 @botMOD.command(name='свобода')
 @commands_enabled
 async def clear_cooldowns_cmd(ctx):
@@ -3103,6 +2822,51 @@ async def show_banlist_cmd(ctx):
 async def show_banlist_cmd(ctx):
     if moder(ctx):
         await reboot()
+
+@botMOD.command(name='экономика')
+@commands_enabled
+async def economy_stats_cmd(ctx):
+    """Откуда берутся и куда уходят LC: !экономика [@ник] (без ника - за 24 часа)"""
+    if not moder(ctx):
+        return
+    args = ctx.message.content.split()
+    username = args[1].strip('@').lower() if len(args) > 1 else None
+    since = None if username else (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+    summary = await adb.get_ledger_summary(username, since)
+    if not summary:
+        await ctx.send("📒 Записей об изменении баланса нет")
+        return
+    lines = [
+        f"{LEDGER_REASONS.get(row['reason'], row['reason'])}: +{row['income']}/-{row['spent']}"
+        for row in summary
+    ]
+    for text in pack_chat_lines(lines, prefix=f"📒 {username or 'За 24 часа'}: "):
+        await ctx.send(text)
+
+@botMOD.command(name='dbstats')
+@commands_enabled
+async def db_stats_cmd(ctx):
+    """Самые дорогие по времени БД команды: !dbstats [reset]"""
+    if not moder(ctx):
+        return
+    args = ctx.message.content.split()
+    if len(args) > 1 and args[1] == "reset":
+        db_stats.reset()
+        await ctx.send("🗑 Статистика запросов сброшена")
+        return
+    report = [item for item in db_stats.report() if not item['command'].startswith("bg:")][:3]
+    if not report:
+        await ctx.send("📊 Статистики запросов пока нет")
+        return
+    casts = cast_collector.stats()
+    await ctx.send("📊 " + " | ".join(db_stats.format_line(item) for item in report) + " | " + drop_tables.format_stats()
+                   + f" | casts: {casts['casts']} in {casts['batches']} batches | " + cooldowns.format_stats())
+
+async def db_stats_before_invoke(ctx):
+    db_stats.begin(f"tw:{ctx.command.name}")
+
+async def db_stats_after_invoke(ctx):
+    db_stats.end()
 @dataclass
 class PasteCommandCooldown:
     last_used: float = 0
@@ -3163,6 +2927,8 @@ async def paste_command(ctx):
 botMOD.add_event(my_message_handler, "event_message")
 botMOD.add_event(event_ready)
 botMOD.add_event(event_disconnected, "event_disconnected")
+botMOD.global_before_invoke = db_stats_before_invoke
+botMOD.global_after_invoke = db_stats_after_invoke
 
 async def restart_bot_with_delay():
     """Restart the bot after a delay"""
@@ -3173,6 +2939,8 @@ async def restart_bot_with_delay():
 
 
 async def reboot():
+    await adb.run(flush_all_queues)
+    await adb.run(cooldowns.save)
     subprocess.Popen(["reboot.exe"])
 def find_process(process_name):
     """
@@ -0,0 +1,96 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class PlayerCache:
+    """Кэш строк players в памяти, ключ - username в нижнем регистре.
+
+    Bounded LRU shared by every Repository of one database file, so writes made
+    by the Twitch handlers and by the Telegram thread update the same entries.
+    Entries expire after ttl seconds to pick up edits made by other processes
+    (the admin UIs). Balances are invalidated after the commit rather than
+    written through: two threads may commit in one order and reach the cache
+    in the other, while a dropped row is simply re-read.
+    """
+
+    def __init__(self, max_size: int = 2048, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self) -> int:
+        """Take before reading from SQLite and pass to put()"""
+        with self._lock:
+            return self._generation
+
+    def get(self, username: str) -> Optional[dict]:
+        key = username.lower()
+        with self._lock:
+            entry = self._rows.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._rows[key]
+                self.misses += 1
+                return None
+            self._rows.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, username: str, row: dict, generation: int):
+        """Store a row read from SQLite unless a write happened since generation"""
+        key = username.lower()
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._rows[key] = (time.monotonic() + self.ttl, dict(row))
+            self._rows.move_to_end(key)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+
+    def update(self, username: str, **fields):
+        """Write-through of committed fields into a cached row"""
+        key = username.lower()
+        with self._lock:
+            self._generation += 1
+            entry = self._rows.get(key)
+            if entry is not None:
+                entry[1].update(fields)
+
+    def invalidate(self, username: str = None):
+        """Drop one row, or every row when username is None"""
+        with self._lock:
+            self._generation += 1
+            if username is None:
+                self._rows.clear()
+            else:
+                self._rows.pop(username.lower(), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._rows),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_player_cache(db_path: str = 'bot_database.db') -> PlayerCache:
+    """Shared player cache for a database file"""
+    with _caches_lock:
+        cache = _caches.get(db_path)
+        if cache is None:
+            cache = PlayerCache()
+            _caches[db_path] = cache
+        return cache
@@ -3,6 +3,7 @@ import telebot
 from telebot import types
 import logging
 from datetime import datetime
+from repository import Repository
 
 # Configure logging for private messages
 pm_logger = logging.getLogger('private_messages')
@@ -24,6 +25,7 @@ class PrivateMessagingSystem:
     def __init__(self, bot, db_path='bot_database.db'):
         self.bot = bot
         self.db_path = db_path
+        self.repo = Repository(db_path)
         # Dictionary to store user states for private messaging
         self.user_states = {}
         # Dictionary to store last message senders (for /reply_to_last command)
@@ -33,10 +35,7 @@ class PrivateMessagingSystem:
         
     def create_private_messages_table(self):
         """Create table for storing private message metadata"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        self.repo.create_tables('''
             CREATE TABLE IF NOT EXISTS private_messages (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 sender_chat_id INTEGER,
@@ -47,73 +46,26 @@ class PrivateMessagingSystem:
             )
         ''')
         
-        conn.commit()
-        conn.close()
-        
     def log_action(self, sender_chat_id, receiver_chat_id, action, message_type="action"):
         """Log an action in the private messaging system"""
         # Log to file
         pm_logger.info(f"sender:{sender_chat_id} receiver:{receiver_chat_id} action:{action}")
         
         # Save to database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO private_messages 
-            (sender_chat_id, receiver_chat_id, message_type, action_log)
-            VALUES (?, ?, ?, ?)
-        ''', (sender_chat_id, receiver_chat_id, message_type, action))
-        
-        conn.commit()
-        conn.close()
+        self.repo.log_private_message(sender_chat_id, receiver_chat_id, message_type, action)
         
     def get_twitch_username(self, chat_id):
         """Get Twitch username for a Telegram chat ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT twitch_username FROM telegram_users WHERE chat_id = ?
-        ''', (chat_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result[0] if result else None
+        return self.repo.get_twitch_username(chat_id)
         
     def get_all_linked_users(self, page=0):
         """Get all linked users for the user selection UI"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         offset = page * self.ITEMS_PER_PAGE
-        cursor.execute('''
-            SELECT chat_id, twitch_username FROM telegram_users 
-            WHERE twitch_username IS NOT NULL
-            ORDER BY twitch_username
-            LIMIT ? OFFSET ?
-        ''', (self.ITEMS_PER_PAGE, offset))
-        
-        users = cursor.fetchall()
-        conn.close()
-        
-        return users
+        return [tuple(row) for row in self.repo.get_linked_users(self.ITEMS_PER_PAGE, offset)]
         
     def get_total_linked_users(self):
         """Get total count of linked users"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT COUNT(*) FROM telegram_users 
-            WHERE twitch_username IS NOT NULL
-        ''')
-        
-        count = cursor.fetchone()[0]
-        conn.close()
-        
-        return count
+        return self.repo.count_linked_users()
         
     def show_user_selection_ui(self, chat_id, page=0):
         """Show UI for selecting a user to message"""
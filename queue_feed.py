@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SNAPSHOT_FILE = 'queue_snapshot.json'
+QUEUE_FEED_PORT = 8765
+
+
+class QueueFeed:
+    """Живая лента очереди для оверлеев и дашбордов, без доступа к базе.
+
+    Every change of the QueueIndex is written to snapshot_path (replaced
+    atomically, so readers never see a half-written file) and pushed to the
+    clients of a small HTTP server on localhost:
+
+        GET /events  - server-sent events, one "queue" event per change
+        GET /queue   - the current snapshot as JSON
+
+    The JSON is built and written by a background thread, not by the thread
+    that changed the queue: changes made within coalesce seconds of each
+    other go out as one event (named "batch" when the events differ).
+    """
+
+    def __init__(self, index, snapshot_path: Optional[str] = QUEUE_SNAPSHOT_FILE,
+                 host: str = '127.0.0.1', port: int = QUEUE_FEED_PORT,
+                 keepalive: float = 15.0, client_buffer: int = 64, coalesce: float = 0.05):
+        self.index = index
+        self.snapshot_path = snapshot_path
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.client_buffer = client_buffer
+        self.coalesce = coalesce
+        self.version = 0
+        self._last = None
+        self._clients = set()
+        self._loop = None
+        self._server = None
+        self._cond = threading.Condition()
+        # события и usernames, накопленные с последней записи
+        self._events = []
+        self._changed = {}
+        self._busy = False
+        self._closed = False
+        self._thread = None
+        index.subscribe(self._on_change)
+
+    @property
+    def running(self) -> bool:
+        return self._server is not None
+
+    def _payload(self, version: int, event: str, changed: list) -> str:
+        entries = self.index.entries()
+        return json.dumps({
+            'version': version,
+            'event': event,
+            'changed': changed,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+            'length': len(entries),
+            'queue': [
+                {'position': i, 'username': entry['username'], 'number': entry['number'],
+                 'joined_at': entry['timestamp']}
+                for i, entry in enumerate(entries, 1)
+            ],
+        }, ensure_ascii=False)
+
+    def _on_change(self, event: str, changed: list):
+        # Вызывается потоком, изменившим очередь, под блокировкой индекса: только запоминаем
+        with self._cond:
+            self.version += 1
+            self._events.append(event)
+            for entry in changed:
+                self._changed[entry['username']] = None
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="queue-feed", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._events and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            # Даем пачке изменений (например, !скип нескольких человек) собраться в одно событие
+            time.sleep(self.coalesce)
+            with self._cond:
+                events, changed, version = self._events, list(self._changed), self.version
+                self._events, self._changed = [], {}
+                self._busy = True
+            try:
+                event = events[0] if len(set(events)) == 1 else 'batch'
+                data = self._payload(version, event, changed)
+                self._write_snapshot(data)
+                loop = self._loop
+                if loop is not None and not loop.is_closed():
+                    loop.call_soon_threadsafe(self._publish, data)
+                else:
+                    self._last = data
+            except Exception:
+                logger.exception("Queue feed writer failed")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every change so far is written, False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._events or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        """Stop the writer thread, pending changes are dropped"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(5.0)
+
+    def _write_snapshot(self, data: str):
+        if not self.snapshot_path:
+            return
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.error(f"Error writing {self.snapshot_path}: {e}")
+
+    def _publish(self, data: str):
+        # На цикле событий: /events отдает _last новым клиентам в том же порядке
+        self._last = data
+        self._broadcast(data)
+
+    def _broadcast(self, data: str):
+        for client in list(self._clients):
+            try:
+                client.put_nowait(data)
+            except asyncio.QueueFull:
+                # Клиент не успевает читать: отключаем, оверлей переподключится
+                self._clients.discard(client)
+                while not client.empty():
+                    client.get_nowait()
+                client.put_nowait(None)
+
+    async def start(self):
+        """Start the HTTP server on the running event loop"""
+        if self._server is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        await self._loop.run_in_executor(None, self.index.publish)
+        logger.info(f"Queue feed on http://{self.host}:{self.port}/events")
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        for client in list(self._clients):
+            self._clients.discard(client)
+            if not client.full():
+                client.put_nowait(None)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 10)
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 10)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+            parts = request.decode('latin-1').split()
+            path = parts[1].split('?')[0] if len(parts) > 1 else ''
+            if len(parts) < 2 or parts[0] != 'GET':
+                await self._respond(writer, '405 Method Not Allowed', 'text/plain', 'method not allowed')
+            elif path == '/events':
+                await self._stream(writer)
+            elif path in ('/', '/queue', '/queue.json'):
+                await self._respond(writer, '200 OK', 'application/json; charset=utf-8', self._last or '{}')
+            else:
+                await self._respond(writer, '404 Not Found', 'text/plain', 'not found')
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception:
+            logger.exception("Queue feed client error")
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: str, content_type: str, body: str):
+        data = body.encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+            f"Access-Control-Allow-Origin: *\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n".encode('latin-1')
+            + data
+        )
+        await writer.drain()
+
+    async def _stream(self, writer: asyncio.StreamWriter):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\nAccess-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n"
+        )
+        client = asyncio.Queue(self.client_buffer)
+        self._clients.add(client)
+        try:
+            if self._last is not None:
+                writer.write(f"event: queue\ndata: {self._last}\n\n".encode('utf-8'))
+            await writer.drain()
+            while True:
+                try:
+                    data = await asyncio.wait_for(client.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                else:
+                    if data is None:
+                        return
+                    writer.write(f"event: queue\ndata: {data}\n\n".encode('utf-8'))
+                await writer.drain()
+        finally:
+            self._clients.discard(client)
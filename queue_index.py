@@ -0,0 +1,585 @@
+import math
+import heapq
+import random
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+from db_pool import get_pool
+from migrations import QUEUE_RANK_GAP
+
+logger = logging.getLogger(__name__)
+
+# Формат CURRENT_TIMESTAMP / datetime('now') в SQLite (UTC)
+SQLITE_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+QUEUE_MAX_AGE = timedelta(hours=8)
+
+
+def sqlite_timestamp(moment: datetime = None) -> str:
+    return (moment or datetime.utcnow()).strftime(SQLITE_TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(value) -> datetime:
+    """Timestamp of a queue row; a missing or broken one never expires"""
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.max
+
+
+class _Node:
+    __slots__ = ('key', 'value', 'next', 'width')
+
+    def __init__(self, key, value, levels: int):
+        self.key = key
+        self.value = value
+        self.next = [None] * levels
+        # width[level] - сколько позиций до next[level]
+        self.width = [1] * levels
+
+
+class IndexedSkipList:
+    """Отсортированный по уникальному ключу список с доступом по индексу.
+
+    Every link of the skip list stores how many positions it skips, so
+    insert, remove, rank and lookup by index are all O(log n) on average.
+    """
+
+    MAX_LEVELS = 24
+
+    def __init__(self):
+        self._tail = _Node(None, None, 0)
+        self._head = _Node(None, None, self.MAX_LEVELS)
+        self._head.next = [self._tail] * self.MAX_LEVELS
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _chain(self, key):
+        """Last node before key on every level and its position (head is 0)"""
+        chain = [None] * self.MAX_LEVELS
+        steps = [0] * self.MAX_LEVELS
+        node, pos = self._head, 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            nxt = node.next[level]
+            while nxt is not self._tail and nxt.key < key:
+                pos += node.width[level]
+                node = nxt
+                nxt = node.next[level]
+            chain[level] = node
+            steps[level] = pos
+        return chain, steps
+
+    def insert(self, key, value):
+        chain, steps = self._chain(key)
+        if chain[0].next[0] is not self._tail and chain[0].next[0].key == key:
+            raise KeyError(key)
+        pos = steps[0]
+        levels = min(self.MAX_LEVELS, 1 - int(math.log(1.0 - random.random(), 2.0)))
+        node = _Node(key, value, levels)
+        for level in range(levels):
+            prev = chain[level]
+            node.next[level] = prev.next[level]
+            prev.next[level] = node
+            node.width[level] = prev.width[level] - (pos - steps[level])
+            prev.width[level] = pos + 1 - steps[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._chain(key)
+        node = chain[0].next[0]
+        if node is self._tail or node.key != key:
+            raise KeyError(key)
+        for level in range(self.MAX_LEVELS):
+            prev = chain[level]
+            if prev.next[level] is node:
+                prev.width[level] += node.width[level] - 1
+                prev.next[level] = node.next[level]
+            else:
+                prev.width[level] -= 1
+        self._size -= 1
+        return node.value
+
+    def rank(self, key) -> Optional[int]:
+        """0-based index of key, None when it is missing"""
+        chain, steps = self._chain(key)
+        node = chain[0].next[0]
+        if node is self._tail or node.key != key:
+            return None
+        return steps[0]
+
+    def _node_at(self, index: int) -> _Node:
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        node, pos, target = self._head, 0, index + 1
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not self._tail and pos + node.width[level] <= target:
+                pos += node.width[level]
+                node = node.next[level]
+        return node
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self._size
+        return self._node_at(index).value
+
+    def key_at(self, index: int):
+        return self._node_at(index).key
+
+    def first(self):
+        node = self._head.next[0]
+        return None if node is self._tail else node.value
+
+    def slice(self, start: int, stop: int) -> list:
+        """Values from start to stop, O(log n + k)"""
+        start, stop = max(start, 0), min(stop, self._size)
+        if start >= stop:
+            return []
+        node = self._node_at(start)
+        values = []
+        for _ in range(stop - start):
+            values.append(node.value)
+            node = node.next[0]
+        return values
+
+    def __iter__(self) -> Iterator:
+        node = self._head.next[0]
+        while node is not self._tail:
+            yield node.value
+            node = node.next[0]
+
+
+class QueueIndex:
+    """Очередь игроков в памяти, зеркало таблицы queue.
+
+    Entries are ordered by an explicit rank (``ORDER BY rank, id``) kept in an
+    IndexedSkipList, so position, page and length queries never touch SQLite.
+    Ranks are spaced by QUEUE_RANK_GAP: joining, moving to the front or to any
+    position and leaving each change one row in one transaction. Every change
+    is written to the table first and mirrored after the commit; the table is
+    read once, on first use.
+    """
+
+    def __init__(self, db_path: str = 'bot_database.db'):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self._entries = IndexedSkipList()
+        # username -> (rank, id), ключ записи в _entries
+        self._keys = {}
+        # (время записи, id, username) для поиска самой старой записи
+        self._ages = []
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._listeners = []
+
+    @staticmethod
+    def _entry(row) -> dict:
+        return {'username': row['username'], 'number': row['number'], 'timestamp': row['timestamp']}
+
+    def _ensure_loaded(self) -> bool:
+        if self._loaded:
+            return True
+        conn = self.pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, username, number, timestamp, rank FROM queue
+                ORDER BY rank IS NULL, rank, timestamp, id
+            ''')
+            rows = [dict(row) for row in cursor.fetchall()]
+            # Строки, добавленные в обход индекса (админки), встают в конец
+            unranked = [row for row in rows if row['rank'] is None]
+            if unranked:
+                last = max((row['rank'] for row in rows if row['rank'] is not None), default=0.0)
+                for i, row in enumerate(unranked, 1):
+                    row['rank'] = last + i * QUEUE_RANK_GAP
+                cursor.executemany('UPDATE queue SET rank = ? WHERE id = ?',
+                                   ((row['rank'], row['id']) for row in unranked))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error loading the queue: {e}")
+            return False
+        finally:
+            self.pool.release()
+        self._entries = IndexedSkipList()
+        self._keys = {}
+        self._ages = []
+        for row in rows:
+            self._mirror_add(row)
+        self._loaded = True
+        return True
+
+    def _mirror_add(self, row):
+        username = row['username'].lower()
+        self._mirror_remove(username)
+        key = (row['rank'], row['id'])
+        self._keys[username] = key
+        self._entries.insert(key, self._entry(row))
+        heapq.heappush(self._ages, (parse_timestamp(row['timestamp']), row['id'], username))
+
+    def _mirror_remove(self, username: str) -> Optional[dict]:
+        key = self._keys.pop(username, None)
+        return self._entries.remove(key) if key is not None else None
+
+    def _mirror_move(self, username: str, rank: float):
+        key = self._keys[username]
+        entry = self._entries.remove(key)
+        self._keys[username] = (rank, key[1])
+        self._entries.insert(self._keys[username], entry)
+
+    def _oldest(self) -> Optional[tuple]:
+        """(timestamp, id, username) of the oldest entry, stale heap items are dropped on the way"""
+        while self._ages:
+            timestamp, queue_id, username = self._ages[0]
+            key = self._keys.get(username)
+            if key is not None and key[1] == queue_id:
+                return self._ages[0]
+            heapq.heappop(self._ages)
+        return None
+
+    def subscribe(self, listener):
+        """listener(event, entries) is called after every committed change.
+
+        Events: join, skip, move, leave, pick, expire, clear, reload and
+        snapshot (publish). It runs
+        on the thread that made the change with the index locked, so it sees
+        changes in order and may read the index, but must not block.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def _notify(self, event: str, entries: list):
+        for listener in self._listeners:
+            try:
+                listener(event, [dict(entry) for entry in entries if entry])
+            except Exception:
+                logger.exception(f"Queue listener failed on {event}")
+
+    def publish(self, event: str = 'snapshot'):
+        """Notify the listeners without a change, e.g. when a feed starts"""
+        with self._lock:
+            if self._ensure_loaded():
+                self._notify(event, [])
+
+    def reload(self):
+        """Re-read the table, e.g. after it was changed with raw SQL"""
+        with self._lock:
+            self._loaded = False
+            if self._ensure_loaded():
+                self._notify('reload', [])
+
+    # Reads
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries) if self._ensure_loaded() else 0
+
+    def entries(self) -> List[dict]:
+        with self._lock:
+            if not self._ensure_loaded():
+                return []
+            return [dict(entry) for entry in self._entries]
+
+    def page(self, start: int, count: int) -> List[dict]:
+        """Entries start..start+count-1 (0-based)"""
+        with self._lock:
+            if not self._ensure_loaded():
+                return []
+            return [dict(entry) for entry in self._entries.slice(start, start + count)]
+
+    def get(self, username: str) -> Optional[dict]:
+        with self._lock:
+            if not self._ensure_loaded():
+                return None
+            key = self._keys.get(username.lower())
+            if key is None:
+                return None
+            return dict(self._entries[self._entries.rank(key)])
+
+    def position(self, username: str) -> Optional[int]:
+        """1-based position in the queue, None when the user is not in it"""
+        with self._lock:
+            if not self._ensure_loaded():
+                return None
+            key = self._keys.get(username.lower())
+            if key is None:
+                return None
+            return self._entries.rank(key) + 1
+
+    # Writes
+    def _rank_at(self, index: int, exclude: str = None, entries: IndexedSkipList = None,
+                 keys: dict = None) -> Optional[float]:
+        """Rank that puts an entry at 0-based index of the queue without exclude.
+
+        None when the two neighbours have no room left between their ranks.
+        entries/keys default to the index itself (see _renumber).
+        """
+        entries = self._entries if entries is None else entries
+        keys = self._keys if keys is None else keys
+        skip = keys.get(exclude) if exclude else None
+        skip_index = entries.rank(skip) if skip is not None else None
+        size = len(entries) - (skip_index is not None)
+
+        def rank_of(i):
+            if not 0 <= i < size:
+                return None
+            return entries.key_at(i if skip_index is None or i < skip_index else i + 1)[0]
+
+        before, after = rank_of(index - 1), rank_of(index)
+        if before is None and after is None:
+            return float(QUEUE_RANK_GAP)
+        if before is None:
+            return after - QUEUE_RANK_GAP
+        if after is None:
+            return before + QUEUE_RANK_GAP
+        rank = (before + after) / 2
+        return rank if before < rank < after else None
+
+    def _renumber(self, cursor) -> tuple:
+        """Evenly spaced ranks for the whole queue, only when two neighbours ran out of room.
+
+        Returns the renumbered (entries, keys); the caller installs them after its commit.
+        """
+        entries = IndexedSkipList()
+        keys = {}
+        for i, entry in enumerate(self._entries, 1):
+            username = entry['username'].lower()
+            keys[username] = (float(i * QUEUE_RANK_GAP), self._keys[username][1])
+            entries.insert(keys[username], entry)
+        cursor.executemany('UPDATE queue SET rank = ? WHERE id = ?', keys.values())
+        return entries, keys
+
+    def add(self, username: str, number: str, front: bool = False, statements=()) -> bool:
+        """Put the user at the end (or the front) of the queue, replacing their old entry.
+
+        statements are run in the same transaction, as in move().
+        """
+        username = username.lower()
+        with self._lock:
+            if not self._ensure_loaded():
+                return False
+            old_key = self._keys.get(username)
+            rank = self._rank_at(0 if front else len(self._entries) - (old_key is not None), exclude=username)
+            conn = self.pool.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('DELETE FROM queue WHERE username = ?', (username,))
+                timestamp = sqlite_timestamp()
+                cursor.execute('INSERT INTO queue (username, number, timestamp, rank) VALUES (?, ?, ?, ?)',
+                               (username, number, timestamp, rank))
+                row = {'id': cursor.lastrowid, 'username': username, 'number': number,
+                       'timestamp': timestamp, 'rank': rank}
+                for query, params, required in statements:
+                    cursor.execute(query, params)
+                    if required and cursor.rowcount == 0:
+                        conn.rollback()
+                        return False
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error adding {username} to the queue: {e}")
+                return False
+            finally:
+                self.pool.release()
+            self._mirror_add(row)
+            self._notify('skip' if front else 'join', [self._entry(row)])
+            return True
+
+    def move(self, username: str, position: int = 1, event: str = 'move', statements=()) -> Optional[int]:
+        """Move the user to a 1-based position (clamped), returns the new position.
+
+        statements are (query, params, required) tuples run in the same
+        transaction, as in Repository.purchase; when a required one changes no
+        rows the move is rolled back and None is returned.
+        """
+        username = username.lower()
+        with self._lock:
+            if not self._ensure_loaded() or username not in self._keys:
+                return None
+            index = min(max(position, 1), len(self._entries)) - 1
+            stay = self._entries.rank(self._keys[username]) == index
+            if stay and not statements:
+                return index + 1
+            rank = None if stay else self._rank_at(index, exclude=username)
+            renumbered = None
+            conn = self.pool.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                if not stay and rank is None:
+                    renumbered = self._renumber(cursor)
+                    rank = self._rank_at(index, username, *renumbered)
+                if not stay:
+                    cursor.execute('UPDATE queue SET rank = ? WHERE id = ?', (rank, self._keys[username][1]))
+                for query, params, required in statements:
+                    cursor.execute(query, params)
+                    if required and cursor.rowcount == 0:
+                        conn.rollback()
+                        return None
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error moving {username} in the queue: {e}")
+                return None
+            finally:
+                self.pool.release()
+            # Новые ранги ставим в индекс только после коммита
+            if renumbered:
+                self._entries, self._keys = renumbered
+            if not stay:
+                self._mirror_move(username, rank)
+            index = self._entries.rank(self._keys[username])
+            self._notify(event, [self._entries[index]])
+            return index + 1
+
+    def _pick(self, count: int, randomly: bool, weighted: bool, rng) -> List[str]:
+        entries = list(self._entries)
+        if not randomly:
+            return [entry['username'].lower() for entry in entries[:count]]
+        if not weighted:
+            return [entry['username'].lower() for entry in rng.sample(entries, min(count, len(entries)))]
+        # Взвешенная выборка без повторов (Efraimidis-Spirakis): вес - секунды ожидания
+        now = datetime.utcnow()
+        keys = []
+        for entry in entries:
+            waited = parse_timestamp(entry['timestamp'])
+            weight = max((now - waited).total_seconds(), 1.0) if waited != datetime.max else 1.0
+            keys.append((math.log(1.0 - rng.random()) / weight, entry['username'].lower()))
+        return [username for _, username in heapq.nlargest(count, keys)]
+
+    def dequeue_many(self, usernames: List[str] = None, count: int = None, randomly: bool = False,
+                     weighted: bool = False, last_played: str = None, rng=random) -> Optional[List[dict]]:
+        """Take players out of the queue in one transaction and stamp their last_played.
+
+        Picks the given usernames, or count players from the front, at random
+        or at random weighted by how long they have been waiting. Returns the
+        picked entries in pick order, None on a database error.
+        """
+        last_played = last_played or datetime.now().isoformat()
+        with self._lock:
+            if not self._ensure_loaded():
+                return None
+            if usernames is not None:
+                # Один и тот же ник дважды удаляется один раз
+                picked = [username for username in dict.fromkeys(name.lower() for name in usernames)
+                          if username in self._keys]
+            else:
+                picked = self._pick(count or 1, randomly, weighted, rng)
+            if not picked:
+                return []
+            conn = self.pool.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.executemany('DELETE FROM queue WHERE id = ?',
+                                   ((self._keys[username][1],) for username in picked))
+                cursor.executemany('UPDATE players SET last_played = ? WHERE username = ?',
+                                   ((last_played, username) for username in picked))
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error picking {picked} from the queue: {e}")
+                return None
+            finally:
+                self.pool.release()
+            picked = [self._mirror_remove(username) for username in picked]
+            self._notify('pick', picked)
+            return picked
+
+    def move_to_front(self, username: str) -> bool:
+        return self.move(username, 1, event='skip') is not None
+
+    def remove(self, username: str) -> bool:
+        username = username.lower()
+        with self._lock:
+            if not self._ensure_loaded():
+                return False
+            conn = self.pool.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM queue WHERE username = ?', (username,))
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error removing {username} from the queue: {e}")
+                return False
+            finally:
+                self.pool.release()
+            removed = self._mirror_remove(username)
+            if removed is not None:
+                self._notify('leave', [removed])
+            return removed is not None or cursor.rowcount > 0
+
+    def clear(self) -> bool:
+        with self._lock:
+            conn = self.pool.get_connection()
+            try:
+                conn.execute('DELETE FROM queue')
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error clearing the queue: {e}")
+                return False
+            finally:
+                self.pool.release()
+            self._entries = IndexedSkipList()
+            self._keys = {}
+            self._ages = []
+            self._loaded = True
+            self._notify('clear', [])
+            return True
+
+    def next_expiry(self, max_age: timedelta = QUEUE_MAX_AGE) -> Optional[datetime]:
+        """UTC time when the oldest entry expires, None for an empty queue"""
+        with self._lock:
+            if not self._ensure_loaded():
+                return None
+            oldest = self._oldest()
+            if oldest is None or oldest[0] == datetime.max:
+                return None
+            return oldest[0] + max_age
+
+    def remove_expired(self, max_age: timedelta = QUEUE_MAX_AGE, now: datetime = None) -> List[dict]:
+        """Drop entries older than max_age in one transaction and return them"""
+        cutoff = (now or datetime.utcnow()) - max_age
+        with self._lock:
+            if not self._ensure_loaded():
+                return []
+            expired = []
+            while True:
+                oldest = self._oldest()
+                if oldest is None or oldest[0] >= cutoff:
+                    break
+                expired.append(heapq.heappop(self._ages))
+            if not expired:
+                return []
+            conn = self.pool.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.executemany('DELETE FROM queue WHERE id = ?', ((queue_id,) for _, queue_id, _ in expired))
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error cleaning expired queue entries: {e}")
+                for item in expired:
+                    heapq.heappush(self._ages, item)
+                return []
+            finally:
+                self.pool.release()
+            removed = [self._mirror_remove(username) for _, _, username in expired]
+            self._notify('expire', removed)
+            logger.info(f"Removed {len(removed)} expired queue entries")
+            return removed
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_queue_index(db_path: str = 'bot_database.db') -> QueueIndex:
+    """Shared queue index for a database file"""
+    with _indexes_lock:
+        index = _indexes.get(db_path)
+        if index is None:
+            index = QueueIndex(db_path)
+            _indexes[db_path] = index
+        return index
@@ -0,0 +1,1043 @@
+import sqlite3
+import logging
+from typing import List, Optional, Tuple
+from db_pool import get_pool
+from write_behind import get_write_queue
+from player_cache import get_player_cache
+from fish_catalog import get_fish_catalog, FishRecord
+from ledger import record_entry
+
+logger = logging.getLogger(__name__)
+
+INSERT_INVENTORY_SQL = '''
+    INSERT INTO inventory (
+        username, item_type, item_id, item_name,
+        rarity, value, obtained_at, metadata
+    )
+    VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, datetime('now')), ?)
+'''
+
+CLAIM_UNIQUE_FISH_SQL = 'UPDATE items SET is_caught = 1 WHERE id = ? AND is_caught = 0'
+RELEASE_UNIQUE_FISH_SQL = 'UPDATE items SET is_caught = 0 WHERE id = ?'
+
+USER_SETTINGS = ('fishing_notifications', 'fishing_sound')
+
+
+class Repository:
+    """Общий слой доступа к данным для Twitch и Telegram ботов.
+
+    Rows are returned as sqlite3.Row, so callers can read them both by index
+    and by column name.
+    """
+
+    def __init__(self, db_path: str = 'bot_database.db'):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self.writes = get_write_queue(db_path)
+        self.players = get_player_cache(db_path)
+        self.catalog = get_fish_catalog(db_path)
+
+    def connection(self) -> sqlite3.Connection:
+        """Pooled connection of the current thread"""
+        return self.pool.get_connection()
+
+    # Хелперы не трогают транзакцию, открытую вызывающим кодом на этом потоке
+    def _fetchone(self, query: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+        with self.pool.borrow() as conn:
+            try:
+                return conn.execute(query, params).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Error executing query: {e}")
+                return None
+
+    def _fetchall(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self.pool.borrow() as conn:
+            try:
+                return conn.execute(query, params).fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"Error executing query: {e}")
+                return []
+
+    def _execute(self, query: str, params: tuple = ()) -> Optional[sqlite3.Cursor]:
+        """Run a write; inside a caller's transaction it joins it instead of committing"""
+        with self.pool.borrow() as conn:
+            outer = conn.in_transaction
+            try:
+                cursor = conn.execute(query, params)
+                if not outer:
+                    conn.commit()
+                return cursor
+            except sqlite3.Error as e:
+                logger.error(f"Error executing query: {e}")
+                return None
+
+    def create_tables(self, *statements: str) -> bool:
+        """Run CREATE TABLE IF NOT EXISTS statements of a module that owns the tables"""
+        return all(self._execute(statement) is not None for statement in statements)
+
+    def _sync(self, key):
+        """Read-your-writes barrier: flush the write queue if key has a pending write"""
+        if self.writes.has_pending(key):
+            self.writes.flush()
+
+    @staticmethod
+    def _to_int(value) -> int:
+        try:
+            return int(value) if value is not None and value != '' else 0
+        except (ValueError, TypeError):
+            return 0
+
+    # Players
+    def player_exists(self, username: str) -> bool:
+        return self.get_player(username) is not None
+
+    def create_player(self, username: str) -> bool:
+        cursor = self._execute('INSERT OR IGNORE INTO players (username) VALUES (?)', (username.lower(),))
+        self.players.invalidate(username)
+        return cursor is not None and cursor.rowcount > 0
+
+    def get_player(self, username: str) -> Optional[dict]:
+        """Player row as a dict, served from the player cache when possible"""
+        row = self.players.get(username)
+        if row is not None:
+            return row
+        generation = self.players.generation()
+        row = self._fetchone('SELECT * FROM players WHERE username = ?', (username.lower(),))
+        if row is None:
+            return None
+        row = dict(row)
+        self.players.put(username, row, generation)
+        return row
+
+    def update_player(self, username: str, **fields) -> bool:
+        if not fields:
+            return False
+        set_clause = ', '.join(f"{k} = ?" for k in fields.keys())
+        values = tuple(fields.values()) + (username.lower(),)
+        cursor = self._execute(f'UPDATE players SET {set_clause} WHERE username = ?', values)
+        if cursor is None:
+            self.players.invalidate(username)
+            return False
+        self.players.update(username, **fields)
+        return cursor.rowcount > 0
+
+    def clear_last_played(self, username: str = None) -> int:
+        """Снять кулдаун очереди одному игроку или всем, returns the number of players changed"""
+        if username:
+            cursor = self._execute('UPDATE players SET last_played = NULL WHERE username = ?', (username.lower(),))
+        else:
+            cursor = self._execute('UPDATE players SET last_played = NULL')
+        self.players.invalidate(username)
+        return cursor.rowcount if cursor is not None else 0
+
+    def invalidate_player(self, username: str = None):
+        """Call after changing players with raw SQL, None drops every cached row"""
+        self.players.invalidate(username)
+
+    # Economy
+    def get_balance(self, username: str) -> int:
+        player = self.get_player(username)
+        return self._to_int(player['balance']) if player else 0
+
+    def _change_balance(self, cursor, username: str, amount: int, minimum: int = None,
+                        reason: str = 'other', ref=None) -> Optional[int]:
+        """One conditional UPDATE ... RETURNING plus its ledger row, None when nothing was updated"""
+        if minimum is None:
+            cursor.execute('''
+                UPDATE players
+                SET balance = COALESCE(balance, 0) + ?
+                WHERE username = ?
+                RETURNING balance
+            ''', (amount, username.lower()))
+        else:
+            cursor.execute('''
+                UPDATE players
+                SET balance = balance + ?
+                WHERE username = ? AND balance >= ?
+                RETURNING balance
+            ''', (amount, username.lower(), minimum))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        balance = self._to_int(row[0])
+        record_entry(cursor, username, amount, reason, ref, balance)
+        return balance
+
+    def add_coins(self, username: str, amount: int, create: bool = True,
+                  reason: str = 'other', ref=None) -> Optional[int]:
+        """Change balance and return the new one, None if the player is missing"""
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            if create:
+                cursor.execute('INSERT OR IGNORE INTO players (username) VALUES (?)', (username.lower(),))
+            balance = self._change_balance(cursor, username, amount, reason=reason, ref=ref)
+            conn.commit()
+            self.players.invalidate(username)
+            return balance
+        except sqlite3.Error as e:
+            logger.error(f"Error adding coins to {username}: {e}")
+            self.players.invalidate(username)
+            return None
+        finally:
+            self.pool.release()
+
+    def credit(self, username: str, amount: int, reason: str = 'other', ref=None) -> Optional[int]:
+        """Зачисление: returns the new balance"""
+        return self.add_coins(username, abs(amount), reason=reason, ref=ref)
+
+    def debit(self, username: str, amount: int, reason: str = 'other', ref=None) -> Optional[int]:
+        """Списание без ухода в минус: returns the new balance, None if funds are short"""
+        return self.purchase(username, amount, reason=reason, ref=ref)
+
+    def take_coins(self, username: str, amount: int, reason: str = 'admin', ref=None) -> Optional[Tuple[int, int]]:
+        """Списание не больше остатка: the clamp is done by the UPDATE itself.
+
+        Returns (taken, new balance), None if the player is missing.
+        """
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('SELECT balance FROM players WHERE username = ?', (username.lower(),))
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            cursor.execute('''
+                UPDATE players
+                SET balance = COALESCE(balance, 0) - MIN(MAX(COALESCE(balance, 0), 0), ?)
+                WHERE username = ?
+                RETURNING balance
+            ''', (max(amount, 0), username.lower()))
+            balance = self._to_int(cursor.fetchone()[0])
+            taken = self._to_int(row[0]) - balance
+            record_entry(cursor, username, -taken, reason, ref, balance)
+            conn.commit()
+            self.players.invalidate(username)
+            return taken, balance
+        except sqlite3.Error as e:
+            logger.error(f"Error taking coins from {username}: {e}")
+            self.players.invalidate(username)
+            return None
+        finally:
+            self.pool.release()
+
+    def transfer(self, from_user: str, to_user: str, amount: int,
+                 reason: str = 'transfer') -> Optional[Tuple[int, int]]:
+        """Move coins in one transaction and return both new balances (sender, recipient)"""
+        if amount <= 0:
+            return None
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            balance = self._change_balance(cursor, from_user, -amount, minimum=amount,
+                                           reason=reason, ref=to_user.lower())
+            if balance is None:
+                conn.rollback()
+                return None
+            cursor.execute('INSERT OR IGNORE INTO players (username) VALUES (?)', (to_user.lower(),))
+            to_balance = self._change_balance(cursor, to_user, amount, reason=reason, ref=from_user.lower())
+            conn.commit()
+            self.players.invalidate(from_user)
+            self.players.invalidate(to_user)
+            return balance, to_balance
+        except sqlite3.Error as e:
+            logger.error(f"Error transferring coins from {from_user} to {to_user}: {e}")
+            self.players.invalidate(from_user)
+            self.players.invalidate(to_user)
+            return None
+        finally:
+            self.pool.release()
+
+    def transfer_coins(self, from_user: str, to_user: str, amount: int) -> bool:
+        return self.transfer(from_user, to_user, amount) is not None
+
+    def purchase(self, username: str, price: int, statements=(), reason: str = 'shop', ref=None) -> Optional[int]:
+        """Debit price and apply statements in one transaction.
+
+        statements is a list of (query, params, required) tuples; when a required
+        statement changes no rows the whole purchase is rolled back. Returns the
+        new balance, or None when funds are short or a required statement failed.
+        """
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            balance = self._change_balance(cursor, username, -price, minimum=price, reason=reason, ref=ref)
+            if balance is None:
+                conn.rollback()
+                return None
+            for query, params, required in statements:
+                cursor.execute(query, params)
+                if required and cursor.rowcount == 0:
+                    conn.rollback()
+                    return None
+            conn.commit()
+            self.players.invalidate(username)
+            if any(query == CLAIM_UNIQUE_FISH_SQL for query, _, _ in statements):
+                self.catalog.invalidate()
+            return balance
+        except sqlite3.Error as e:
+            logger.error(f"Error processing purchase of {username}: {e}")
+            self.players.invalidate(username)
+            return None
+        finally:
+            self.pool.release()
+
+    @staticmethod
+    def inventory_item_statement(username: str, item_type: str, item_id: int, name: str, rarity: str,
+                                 value: int, obtained_at: str = None, metadata: str = None) -> tuple:
+        return (INSERT_INVENTORY_SQL,
+                (username.lower(), item_type, item_id, name, rarity, value, obtained_at, metadata), False)
+
+    @staticmethod
+    def claim_unique_fish_statement(item_id: int) -> tuple:
+        return (CLAIM_UNIQUE_FISH_SQL, (item_id,), True)
+
+    @staticmethod
+    def release_unique_fish_statement(item_id: int) -> tuple:
+        return (RELEASE_UNIQUE_FISH_SQL, (item_id,), False)
+
+    @staticmethod
+    def queue_pass_statement(username: str, passes: int = 1) -> tuple:
+        return ('''
+            INSERT OR REPLACE INTO queue_passes (username, passes)
+            VALUES (?, COALESCE((SELECT passes FROM queue_passes WHERE username = ?), 0) + ?)
+        ''', (username.lower(), username.lower(), passes), False)
+
+    @staticmethod
+    def spend_queue_pass_statement(username: str, passes: int = 1) -> tuple:
+        return ('UPDATE queue_passes SET passes = passes - ? WHERE username = ? AND passes >= ?',
+                (passes, username.lower(), passes), True)
+
+    @staticmethod
+    def upgrade_points_statement(username: str, points: int) -> tuple:
+        return ('''
+            INSERT INTO upgrades (twitch_username, points_balance) VALUES (?, ?)
+            ON CONFLICT(twitch_username) DO UPDATE SET points_balance = points_balance + excluded.points_balance
+        ''', (username, points), False)
+
+    def get_top_balances(self, limit: int = 5) -> List[sqlite3.Row]:
+        return self._fetchall('''
+            SELECT username, balance FROM players
+            WHERE balance > 0
+            ORDER BY balance DESC
+            LIMIT ?
+        ''', (limit,))
+
+    def get_ledger_summary(self, username: str = None, since: str = None) -> List[sqlite3.Row]:
+        """Income and spending per reason code: reason, entries, income, spent.
+
+        since is an SQLite datetime (UTC); 'opening' and 'reconcile' rows are
+        included, so a player's sums add up to their balance.
+        """
+        conditions, params = [], []
+        if username:
+            conditions.append('username = ?')
+            params.append(username.lower())
+        if since:
+            conditions.append('created_at >= ?')
+            params.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return self._fetchall(f'''
+            SELECT reason, COUNT(*) AS entries,
+                   SUM(CASE WHEN delta > 0 THEN delta ELSE 0 END) AS income,
+                   SUM(CASE WHEN delta < 0 THEN -delta ELSE 0 END) AS spent
+            FROM ledger {where}
+            GROUP BY reason
+            ORDER BY income + spent DESC
+        ''', tuple(params))
+
+    # Queue passes
+    def get_queue_passes(self, username: str) -> int:
+        row = self._fetchone('SELECT passes FROM queue_passes WHERE username = ?', (username.lower(),))
+        return self._to_int(row[0]) if row else 0
+
+    def add_queue_pass(self, username: str, passes: int = 1) -> Optional[int]:
+        """Change the number of passes and return the new one"""
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO queue_passes (username, passes)
+                VALUES (?, COALESCE((SELECT passes FROM queue_passes WHERE username = ?), 0) + ?)
+            ''', (username.lower(), username.lower(), passes))
+            cursor.execute('SELECT passes FROM queue_passes WHERE username = ?', (username.lower(),))
+            row = cursor.fetchone()
+            conn.commit()
+            return self._to_int(row[0]) if row else 0
+        except sqlite3.Error as e:
+            logger.error(f"Error adding queue passes to {username}: {e}")
+            return None
+        finally:
+            self.pool.release()
+
+    def sell_queue_pass(self, username: str, reward: int) -> Optional[Tuple[int, int]]:
+        """Take one pass and credit reward in one transaction; returns (passes, balance), None if there is no pass"""
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                UPDATE queue_passes SET passes = passes - 1
+                WHERE username = ? AND passes >= 1
+                RETURNING passes
+            ''', (username.lower(),))
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            balance = self._change_balance(cursor, username, reward, reason='pass_sale')
+            if balance is None:
+                conn.rollback()
+                return None
+            conn.commit()
+            self.players.invalidate(username)
+            return self._to_int(row[0]), balance
+        except sqlite3.Error as e:
+            logger.error(f"Error selling a queue pass of {username}: {e}")
+            self.players.invalidate(username)
+            return None
+        finally:
+            self.pool.release()
+
+    def spend_queue_pass(self, username: str, passes: int = 1) -> Optional[int]:
+        """Conditional decrement, returns the passes left or None if there were too few"""
+        query, params, _ = self.spend_queue_pass_statement(username, passes)
+        with self.pool.borrow() as conn:
+            try:
+                row = conn.execute(query + ' RETURNING passes', params).fetchone()
+                conn.commit()
+                return self._to_int(row[0]) if row else None
+            except sqlite3.Error as e:
+                logger.error(f"Error spending queue passes of {username}: {e}")
+                return None
+
+    def transfer_passes(self, from_user: str, to_user: str, passes: int) -> Optional[Tuple[int, int]]:
+        """Move passes in one transaction; returns (sender, recipient) passes, None if the sender has too few"""
+        if passes <= 0:
+            return None
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            query, params, _ = self.spend_queue_pass_statement(from_user, passes)
+            cursor.execute(query + ' RETURNING passes', params)
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            cursor.execute('''
+                INSERT INTO queue_passes (username, passes) VALUES (?, ?)
+                ON CONFLICT(username) DO UPDATE SET passes = passes + excluded.passes
+                RETURNING passes
+            ''', (to_user.lower(), passes))
+            to_row = cursor.fetchone()
+            conn.commit()
+            return self._to_int(row[0]), self._to_int(to_row[0])
+        except sqlite3.Error as e:
+            logger.error(f"Error transferring queue passes from {from_user} to {to_user}: {e}")
+            return None
+        finally:
+            self.pool.release()
+
+    # Inventory
+    def add_inventory_item(self, username: str, item_type: str, item_id: int, name: str, rarity: str,
+                           value: int, obtained_at: str = None, metadata: str = None) -> Optional[int]:
+        """Add an item to inventory, obtained_at defaults to datetime('now')"""
+        cursor = self._execute(
+            INSERT_INVENTORY_SQL,
+            (username.lower(), item_type, item_id, name, rarity, value, obtained_at, metadata)
+        )
+        return cursor.lastrowid if cursor is not None else None
+
+    def queue_inventory_item(self, username: str, item_type: str, item_id: int, name: str, rarity: str,
+                             value: int, obtained_at: str = None, metadata: str = None):
+        """Same as add_inventory_item, but written by the write-behind queue"""
+        self.writes.submit(
+            INSERT_INVENTORY_SQL,
+            (username.lower(), item_type, item_id, name, rarity, value, obtained_at, metadata),
+            key=('inventory', username.lower())
+        )
+
+    def add_catch(self, username: str, catches: list, metadata: str = None) -> Optional[list]:
+        """Add several caught fish of one player in one transaction.
+
+        catches is a list of (FishRecord, value) pairs. Ultimate fish are claimed
+        in the same transaction; one that is already caught is left out.
+        Returns the pairs actually added, or None on error.
+        """
+        added = self.add_catches([(username, catches)], metadata)
+        return added[0] if added is not None else None
+
+    def add_catches(self, batch: list, metadata: str = None) -> Optional[list]:
+        """add_catch for many players at once: batch is a list of (username, catches).
+
+        Everything is written by one executemany in one transaction; when two
+        players rolled the same ultimate fish the first one in the batch gets it.
+        Returns the added pairs of every player in batch order, or None on error.
+        """
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            added, rows, claimed = [], [], False
+            for username, catches in batch:
+                user_added = []
+                for record, value in catches:
+                    if record.rarity == 'ultimate':
+                        cursor.execute(CLAIM_UNIQUE_FISH_SQL, (record.id,))
+                        if cursor.rowcount == 0:
+                            continue
+                        claimed = True
+                    user_added.append((record, value))
+                    rows.append((username.lower(), 'fish', record.id, record.name, record.rarity, value, None, metadata))
+                added.append(user_added)
+            cursor.executemany(INSERT_INVENTORY_SQL, rows)
+            conn.commit()
+            if claimed:
+                self.catalog.invalidate()
+            return added
+        except sqlite3.Error as e:
+            logger.error(f"Error adding catches of {len(batch)} players: {e}")
+            return None
+        finally:
+            self.pool.release()
+
+    def get_inventory(self, username: str, item_type: str = None) -> List[sqlite3.Row]:
+        self._sync(('inventory', username.lower()))
+        if item_type:
+            return self._fetchall('''
+                SELECT * FROM inventory
+                WHERE username = ? AND item_type = ?
+                ORDER BY obtained_at DESC
+            ''', (username.lower(), item_type))
+        return self._fetchall('''
+            SELECT * FROM inventory
+            WHERE username = ?
+            ORDER BY obtained_at DESC
+        ''', (username.lower(),))
+
+    def get_inventory_item(self, inventory_id: int, username: str = None, item_type: str = None) -> Optional[sqlite3.Row]:
+        query = 'SELECT * FROM inventory WHERE id = ?'
+        params = [inventory_id]
+        if username is not None:
+            self._sync(('inventory', username.lower()))
+            query += ' AND username = ?'
+            params.append(username.lower())
+        if item_type is not None:
+            query += ' AND item_type = ?'
+            params.append(item_type)
+        return self._fetchone(query, tuple(params))
+
+    def get_duplicate_items(self, username: str, item_type: str = 'fish') -> List[sqlite3.Row]:
+        """Items held more than once: (item_name, count, ids, rarities, values), cheapest groups first"""
+        self._sync(('inventory', username.lower()))
+        return self._fetchall('''
+            SELECT item_name, COUNT(*) as count,
+                   GROUP_CONCAT(id) as ids,
+                   GROUP_CONCAT(rarity) as rarities,
+                   GROUP_CONCAT(value) as fish_values
+            FROM inventory
+            WHERE username = ? AND item_type = ?
+            GROUP BY item_name
+            HAVING COUNT(*) > 1
+            ORDER BY MAX(value) ASC
+        ''', (username.lower(), item_type))
+
+    def get_item_names_by_rarity(self, username: str, rarity: str, item_type: str = 'fish') -> List[str]:
+        """Distinct names of a player's items of one rarity"""
+        self._sync(('inventory', username.lower()))
+        rows = self._fetchall('''
+            SELECT DISTINCT item_name
+            FROM inventory
+            WHERE username = ? AND item_type = ? AND rarity = ?
+            ORDER BY item_name
+        ''', (username.lower(), item_type, rarity))
+        return [row[0] for row in rows]
+
+    def get_collection_summary(self, username: str, item_type: str = 'fish') -> List[sqlite3.Row]:
+        """(rarity, count, unique_count) of a player's items, rarest first"""
+        self._sync(('inventory', username.lower()))
+        return self._fetchall('''
+            SELECT rarity, COUNT(*) as count,
+                   COUNT(DISTINCT item_name) as unique_count
+            FROM inventory
+            WHERE username = ? AND item_type = ?
+            GROUP BY rarity
+            ORDER BY
+                CASE rarity
+                    WHEN 'ultimate' THEN 1
+                    WHEN 'arcane' THEN 2
+                    WHEN 'mythical' THEN 3
+                    WHEN 'immortal' THEN 4
+                    WHEN 'legendary' THEN 5
+                    WHEN 'epic' THEN 6
+                    WHEN 'rare' THEN 7
+                    WHEN 'uncommon' THEN 8
+                    WHEN 'common' THEN 9
+                END
+        ''', (username.lower(), item_type))
+
+    def get_inventory_item_name(self, inventory_id: int) -> Optional[str]:
+        row = self._fetchone('SELECT item_name FROM inventory WHERE id = ?', (inventory_id,))
+        return row[0] if row else None
+
+    def remove_inventory_item(self, inventory_id: int, username: str) -> Optional[sqlite3.Row]:
+        """Delete an inventory row and return it"""
+        self._sync(('inventory', username.lower()))
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM inventory WHERE id = ? AND username = ?', (inventory_id, username.lower()))
+            item = cursor.fetchone()
+            if not item:
+                return None
+            cursor.execute('DELETE FROM inventory WHERE id = ? AND username = ?', (inventory_id, username.lower()))
+            conn.commit()
+            return item
+        except sqlite3.Error as e:
+            logger.error(f"Error removing inventory item {inventory_id}: {e}")
+            return None
+        finally:
+            self.pool.release()
+
+    def sell_items(self, username: str, item_ids: list, bonus_permille: int = 0, item_type: Optional[str] = 'fish',
+                   reason: str = 'fish_sale', ref=None, statements=()) -> Optional[Tuple[int, int, int]]:
+        """Delete items of a player and credit their value in one transaction.
+
+        The credit is relative (balance = balance + income), so it never
+        overwrites a concurrent change. Items that are already gone are skipped;
+        item_type None sells rows of any type. statements are (query, params,
+        required) tuples applied in the same transaction, as in purchase().
+        Returns (sold, income, new balance), None when nothing was sold.
+        """
+        item_ids = [int(item_id) for item_id in item_ids]
+        if not item_ids:
+            return None
+        self._sync(('inventory', username.lower()))
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            placeholders = ','.join('?' * len(item_ids))
+            type_filter = 'AND item_type = ?' if item_type is not None else ''
+            type_params = (item_type,) if item_type is not None else ()
+            cursor.execute(f'''
+                DELETE FROM inventory
+                WHERE username = ? {type_filter} AND id IN ({placeholders})
+                RETURNING value
+            ''', (username.lower(), *type_params, *item_ids))
+            values = [self._to_int(row[0]) for row in cursor.fetchall()]
+            if not values:
+                conn.rollback()
+                return None
+            income = sum(values)
+            income += int(income * bonus_permille * 0.001)
+            balance = self._change_balance(cursor, username, income, reason=reason, ref=ref)
+            if balance is None:
+                conn.rollback()
+                return None
+            for query, params, required in statements:
+                cursor.execute(query, params)
+                if required and cursor.rowcount == 0:
+                    conn.rollback()
+                    return None
+            conn.commit()
+            self.players.invalidate(username)
+            if any(query == RELEASE_UNIQUE_FISH_SQL for query, _, _ in statements):
+                self.catalog.invalidate()
+            return len(values), income, balance
+        except sqlite3.Error as e:
+            logger.error(f"Error selling items of {username}: {e}")
+            self.players.invalidate(username)
+            return None
+        finally:
+            self.pool.release()
+
+    # Items
+    def get_fish_catalog(self) -> Tuple[FishRecord, ...]:
+        """Snapshot of the in-memory catalog, does not touch SQLite"""
+        return self.catalog.fish()
+
+    def get_item(self, item_id: int):
+        """FishRecord for fish, sqlite3.Row for other items"""
+        fish = self.catalog.get(item_id)
+        if fish is not None:
+            return fish
+        return self._fetchone('SELECT * FROM items WHERE id = ?', (item_id,))
+
+    def get_item_name(self, item_id: int) -> Optional[str]:
+        fish = self.catalog.get(item_id)
+        if fish is not None:
+            return fish.name
+        row = self._fetchone('SELECT name FROM items WHERE id = ?', (item_id,))
+        return row[0] if row else None
+
+    def set_fish_caught(self, item_id: int, caught: bool = True) -> bool:
+        cursor = self._execute('UPDATE items SET is_caught = ? WHERE id = ?', (1 if caught else 0, item_id))
+        self.catalog.invalidate()
+        return cursor is not None and cursor.rowcount > 0
+
+    def get_fish_owners(self, item_ids: List[int]) -> dict:
+        """item_id -> username of a player holding that fish"""
+        if not item_ids:
+            return {}
+        rows = self._fetchall(f'''
+            SELECT item_id, MIN(username) FROM inventory
+            WHERE item_type = 'fish' AND item_id IN ({', '.join('?' * len(item_ids))})
+            GROUP BY item_id
+        ''', tuple(item_ids))
+        return {row[0]: row[1] for row in rows}
+
+    def add_fish(self, name: str, base_price: int, rarity: str) -> Optional[int]:
+        """New fish with the next free id, returns the id"""
+        cursor = self._execute('''
+            INSERT INTO items (id, name, type, base_price, rarity)
+            SELECT COALESCE(MAX(id), 0) + 1, ?, 'fish', ?, ? FROM items
+        ''', (name, base_price, rarity))
+        if cursor is None:
+            return None
+        self.catalog.invalidate()
+        return cursor.lastrowid
+
+    def invalidate_catalog(self):
+        """Call after changing items with raw SQL"""
+        self.catalog.invalidate()
+
+    # Telegram users
+    def get_telegram_user(self, chat_id: int) -> Optional[sqlite3.Row]:
+        return self._fetchone('SELECT * FROM telegram_users WHERE chat_id = ?', (chat_id,))
+
+    def save_telegram_user(self, chat_id: int, link_code: str = None) -> bool:
+        """Create or replace a Telegram user together with default settings"""
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                INSERT OR REPLACE INTO telegram_users (chat_id, link_code)
+                VALUES (?, ?)
+            ''', (chat_id, link_code))
+            cursor.execute('INSERT OR IGNORE INTO user_settings (chat_id) VALUES (?)', (chat_id,))
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error saving telegram user {chat_id}: {e}")
+            return False
+        finally:
+            self.pool.release()
+
+    def link_telegram_account(self, chat_id: int, twitch_username: str) -> bool:
+        """Link a chat to an existing player, False if there is no such player"""
+        if not self.player_exists(twitch_username):
+            return False
+        cursor = self._execute('''
+            UPDATE telegram_users
+            SET twitch_username = ?, link_code = NULL
+            WHERE chat_id = ?
+        ''', (twitch_username.lower(), chat_id))
+        return cursor is not None
+
+    def get_user_settings(self, chat_id: int) -> Optional[sqlite3.Row]:
+        return self._fetchone('''
+            SELECT fishing_notifications, fishing_sound
+            FROM user_settings
+            WHERE chat_id = ?
+        ''', (chat_id,))
+
+    def ensure_user_settings(self, chat_id: int) -> bool:
+        """Default settings row for a chat, existing settings are kept"""
+        cursor = self._execute('''
+            INSERT OR IGNORE INTO user_settings (chat_id, fishing_notifications, fishing_sound)
+            VALUES (?, 1, 0)
+        ''', (chat_id,))
+        return cursor is not None
+
+    def update_user_setting(self, chat_id: int, setting: str, value: bool) -> bool:
+        if setting not in USER_SETTINGS:
+            logger.error(f"Unknown user setting {setting}")
+            return False
+        conn = self.connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('INSERT OR IGNORE INTO user_settings (chat_id) VALUES (?)', (chat_id,))
+            cursor.execute(f'UPDATE user_settings SET {setting} = ? WHERE chat_id = ?', (int(value), chat_id))
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error updating setting {setting} of {chat_id}: {e}")
+            return False
+        finally:
+            self.pool.release()
+
+    def get_notification_subscribers(self) -> List[sqlite3.Row]:
+        """(chat_id, twitch_username) of chats with fishing notifications on"""
+        return self._fetchall('''
+            SELECT ts.chat_id, ts.twitch_username
+            FROM telegram_users ts
+            JOIN user_settings us ON ts.chat_id = us.chat_id
+            WHERE us.fishing_notifications = 1
+        ''')
+
+    def get_twitch_username(self, chat_id: int) -> Optional[str]:
+        row = self._fetchone('SELECT twitch_username FROM telegram_users WHERE chat_id = ?', (chat_id,))
+        return row[0] if row else None
+
+    def get_chat_id(self, twitch_username: str) -> Optional[int]:
+        row = self._fetchone('SELECT chat_id FROM telegram_users WHERE twitch_username = ?', (twitch_username,))
+        return row[0] if row else None
+
+    def get_linked_users(self, limit: int, offset: int = 0) -> List[sqlite3.Row]:
+        return self._fetchall('''
+            SELECT chat_id, twitch_username FROM telegram_users
+            WHERE twitch_username IS NOT NULL
+            ORDER BY twitch_username
+            LIMIT ? OFFSET ?
+        ''', (limit, offset))
+
+    def count_linked_users(self) -> int:
+        row = self._fetchone('SELECT COUNT(*) FROM telegram_users WHERE twitch_username IS NOT NULL')
+        return row[0] if row else 0
+
+    # Daily fish catches
+    def record_fish_catch(self, username: str, catch_date: str, catch_count: int = 1):
+        self.writes.submit('''
+            INSERT OR REPLACE INTO daily_fish_catches (username, catch_date, catch_count)
+            VALUES (?, ?, COALESCE((SELECT catch_count FROM daily_fish_catches WHERE username = ? AND catch_date = ?), 0) + ?)
+        ''', (username.lower(), catch_date, username.lower(), catch_date, catch_count))
+
+    # Cooldowns
+    def get_cooldown(self, username: str) -> Optional[int]:
+        """Raw last_used value of the cooldowns table"""
+        pending = self.writes.lookup(('cooldown', username.lower()))
+        if pending is not None:
+            return pending
+        row = self._fetchone('SELECT last_used FROM cooldowns WHERE username = ?', (username.lower(),))
+        return row[0] if row else None
+
+    def set_cooldown(self, username: str, last_used: int) -> bool:
+        self._sync(('cooldown', username.lower()))
+        cursor = self._execute('''
+            INSERT OR REPLACE INTO cooldowns (username, last_used)
+            VALUES (?, ?)
+        ''', (username.lower(), last_used))
+        return cursor is not None
+
+    def queue_cooldown(self, username: str, last_used: int):
+        """Same as set_cooldown, but written by the write-behind queue"""
+        self.writes.submit('''
+            INSERT OR REPLACE INTO cooldowns (username, last_used)
+            VALUES (?, ?)
+        ''', (username.lower(), last_used), key=('cooldown', username.lower()), value=last_used)
+
+    # Fishing notifications
+    def fishing_notification_sent(self, chat_id: int) -> bool:
+        pending = self.writes.lookup(('fishing_notification', chat_id))
+        if pending is not None:
+            return pending
+        return self._fetchone('SELECT last_sent FROM fishing_notifications WHERE chat_id = ?', (chat_id,)) is not None
+
+    def queue_fishing_notification(self, chat_id: int, sent: bool = True):
+        """Record (or clear) a sent fishing notification through the write-behind queue"""
+        if sent:
+            query = '''
+                INSERT OR REPLACE INTO fishing_notifications (chat_id, last_sent)
+                VALUES (?, datetime('now'))
+            '''
+        else:
+            query = 'DELETE FROM fishing_notifications WHERE chat_id = ?'
+        self.writes.submit(query, (chat_id,), key=('fishing_notification', chat_id), value=sent)
+
+    # Private messages
+    def log_private_message(self, sender_chat_id: int, receiver_chat_id: int, message_type: str, action: str):
+        self.writes.submit('''
+            INSERT INTO private_messages
+            (sender_chat_id, receiver_chat_id, message_type, action_log)
+            VALUES (?, ?, ?, ?)
+        ''', (sender_chat_id, receiver_chat_id, message_type, action))
+
+    # Trades
+    def create_trade(self, creator: str, offered_fish_id: int, offered_coins: int,
+                     requested_fish_id: int, requested_coins: int) -> Optional[int]:
+        """Store an active trade offer and return its id"""
+        cursor = self._execute('''
+            INSERT INTO trades
+            (creator_username, offered_fish_id, offered_coins, requested_fish_id, requested_coins)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (creator, offered_fish_id, offered_coins, requested_fish_id, requested_coins))
+        return cursor.lastrowid if cursor is not None else None
+
+    def get_trade(self, trade_id: int, active_only: bool = False) -> Optional[sqlite3.Row]:
+        """(id, creator_username, offered_fish_id, offered_coins, requested_fish_id,
+        requested_coins, status, created_at, completed_at, responder_username)"""
+        return self._fetchone(f'''
+            SELECT id, creator_username, offered_fish_id, offered_coins,
+                   requested_fish_id, requested_coins, status, created_at,
+                   completed_at, responder_username
+            FROM trades
+            WHERE id = ?{" AND status = 'active'" if active_only else ""}
+        ''', (trade_id,))
+
+    def count_active_trades(self, exclude: str = None) -> int:
+        """Active offers, without the ones created by exclude"""
+        row = self._fetchone('''
+            SELECT COUNT(*) FROM trades
+            WHERE status = 'active' AND (? IS NULL OR creator_username != ?)
+        ''', (exclude, exclude))
+        return row[0] if row else 0
+
+    def get_active_trades(self, limit: int, offset: int = 0, exclude: str = None) -> List[sqlite3.Row]:
+        """(id, creator_username, offered_fish_id, offered_coins, requested_fish_id, requested_coins, created_at)"""
+        return self._fetchall('''
+            SELECT id, creator_username, offered_fish_id, offered_coins,
+                   requested_fish_id, requested_coins, created_at
+            FROM trades
+            WHERE status = 'active' AND (? IS NULL OR creator_username != ?)
+            ORDER BY created_at DESC
+            LIMIT ? OFFSET ?
+        ''', (exclude, exclude, limit, offset))
+
+    def count_user_trades(self, creator: str) -> int:
+        row = self._fetchone('SELECT COUNT(*) FROM trades WHERE creator_username = ?', (creator,))
+        return row[0] if row else 0
+
+    def get_user_trades(self, creator: str, limit: int, offset: int = 0) -> List[sqlite3.Row]:
+        """(id, offered_fish_id, offered_coins, requested_fish_id, requested_coins, status, created_at)"""
+        return self._fetchall('''
+            SELECT id, offered_fish_id, offered_coins,
+                   requested_fish_id, requested_coins, status, created_at
+            FROM trades
+            WHERE creator_username = ?
+            ORDER BY created_at DESC
+            LIMIT ? OFFSET ?
+        ''', (creator, limit, offset))
+
+    def cancel_trade(self, trade_id: int, creator: str, cancelled_at: str = None) -> Optional[bool]:
+        """Cancel an active offer of creator; False if there is none, None on a database error"""
+        cursor = self._execute('''
+            UPDATE trades
+            SET status = 'cancelled', completed_at = COALESCE(?, datetime('now'))
+            WHERE id = ? AND creator_username = ? AND status = 'active'
+        ''', (cancelled_at, trade_id, creator))
+        return cursor.rowcount > 0 if cursor is not None else None
+
+    def accept_trade(self, trade_id: int, responder: str, completed_at: str = None) -> Tuple[str, Optional[sqlite3.Row]]:
+        """Complete an active trade in one transaction.
+
+        Fish change owner only if the owner still has them and coins are taken
+        by conditional debits, so a side that no longer has what the trade
+        needs rolls the whole trade back. Returns (status, trade) where status
+        is 'ok', 'not_found', 'no_requested_fish', 'responder_funds',
+        'no_offered_fish', 'creator_funds' or 'error'.
+        """
+        responder = responder.lower()
+        self._sync(('inventory', responder))
+        conn = self.connection()
+        trade = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT creator_username, offered_fish_id, offered_coins,
+                       requested_fish_id, requested_coins
+                FROM trades
+                WHERE id = ? AND status = 'active'
+            ''', (trade_id,))
+            trade = cursor.fetchone()
+            status = 'not_found' if trade is None else self._apply_trade(cursor, trade_id, trade, responder)
+            if status != 'ok':
+                conn.rollback()
+                return status, trade
+            cursor.execute('''
+                UPDATE trades
+                SET status = 'completed', responder_username = ?, completed_at = COALESCE(?, datetime('now'))
+                WHERE id = ? AND status = 'active'
+            ''', (responder, completed_at, trade_id))
+            conn.commit()
+            return 'ok', trade
+        except sqlite3.Error as e:
+            logger.error(f"Error accepting trade {trade_id}: {e}")
+            return 'error', trade
+        finally:
+            self.pool.release()
+            if trade is not None:
+                self.players.invalidate(trade['creator_username'])
+                self.players.invalidate(responder)
+
+    def _apply_trade(self, cursor, trade_id: int, trade: sqlite3.Row, responder: str) -> str:
+        creator = trade['creator_username']
+        offered_coins = self._to_int(trade['offered_coins'])
+        requested_coins = self._to_int(trade['requested_coins'])
+        if trade['requested_fish_id']:
+            # requested_fish_id - id из items, отдаём любой такой экземпляр ответившего
+            cursor.execute('''
+                UPDATE inventory SET username = ?
+                WHERE id = (
+                    SELECT i.id FROM inventory i
+                    JOIN items it ON i.item_id = it.id
+                    WHERE i.username = ? AND it.id = ?
+                    LIMIT 1
+                )
+            ''', (creator, responder, trade['requested_fish_id']))
+            if cursor.rowcount == 0:
+                return 'no_requested_fish'
+        if requested_coins > 0 and self._change_balance(
+                cursor, responder, -requested_coins, minimum=requested_coins, reason='trade', ref=trade_id) is None:
+            return 'responder_funds'
+        if trade['offered_fish_id']:
+            cursor.execute('UPDATE inventory SET username = ? WHERE id = ? AND username = ?',
+                           (responder, trade['offered_fish_id'], creator))
+            if cursor.rowcount == 0:
+                return 'no_offered_fish'
+        if offered_coins > 0 and self._change_balance(
+                cursor, creator, -offered_coins, minimum=offered_coins, reason='trade', ref=trade_id) is None:
+            return 'creator_funds'
+        if offered_coins > 0 and self._change_balance(
+                cursor, responder, offered_coins, reason='trade', ref=trade_id) is None:
+            return 'error'
+        if requested_coins > 0 and self._change_balance(
+                cursor, creator, requested_coins, reason='trade', ref=trade_id) is None:
+            return 'error'
+        return 'ok'
+
+    # Upgrades
+    def get_upgrades(self, username: str) -> Optional[sqlite3.Row]:
+        return self._fetchone('''
+            SELECT double_catch_chance, rare_fish_chance, fishing_cooldown_reduction,
+                   shop_discount, sale_price_increase, points_balance
+            FROM upgrades WHERE twitch_username = ?
+        ''', (username,))
+
+    def init_upgrades(self, username: str) -> bool:
+        cursor = self._execute('INSERT OR IGNORE INTO upgrades (twitch_username) VALUES (?)', (username,))
+        return cursor is not None
+
+    def level_up(self, username: str, upgrade_type: str, level: int, cost: int) -> bool:
+        """Spend cost points and raise upgrade_type from level in one conditional update.
+
+        upgrade_type must be an upgrades column checked by the caller.
+        """
+        cursor = self._execute(f'''
+            UPDATE upgrades
+            SET points_balance = points_balance - ?, {upgrade_type} = {upgrade_type} + 1
+            WHERE twitch_username = ? AND points_balance >= ? AND {upgrade_type} = ?
+        ''', (cost, username, cost, level))
+        return cursor is not None and cursor.rowcount > 0
+
+    def get_fishing_cooldown(self, username: str) -> Tuple[int, int]:
+        """Last fishing time and fishing_cooldown_reduction level in one query"""
+        row = self._fetchone('''
+            SELECT c.last_used, u.fishing_cooldown_reduction
+            FROM (SELECT ? AS username, ? AS twitch_username) p
+            LEFT JOIN cooldowns c ON c.username = p.username
+            LEFT JOIN upgrades u ON u.twitch_username = p.twitch_username
+        ''', (username.lower(), username))
+        last_used, reduction = (row[0], row[1]) if row else (None, None)
+        pending = self.writes.lookup(('cooldown', username.lower()))
+        if pending is not None:
+            last_used = pending
+        return self._to_int(last_used), self._to_int(reduction)
@@ -0,0 +1,42 @@
+import random
+from collections import Counter
+import pytest
+from alias_sampler import AliasSampler, DropTables
+
+
+def test_sample_frequencies_follow_weights():
+    weights = {'common': 60, 'rare': 30, 'epic': 9, 'ultimate': 1, 'never': 0}
+    sampler = AliasSampler(list(weights), list(weights.values()))
+    assert len(sampler) == 4
+    rng = random.Random(11)
+    draws = 200_000
+    counts = Counter(sampler.sample(rng) for _ in range(draws))
+    assert 'never' not in counts
+    for item, weight in weights.items():
+        if weight:
+            assert counts[item] / draws == pytest.approx(weight / 100, abs=0.005)
+
+
+def test_sampler_needs_a_positive_weight():
+    with pytest.raises(ValueError):
+        AliasSampler(['a', 'b'], [0, -1])
+
+
+def test_drop_tables_build_once_and_evict_lru():
+    tables = DropTables(max_size=2)
+    builds = []
+
+    def build(name):
+        def inner():
+            builds.append(name)
+            return [name], [1]
+        return inner
+
+    first = tables.get('a', build('a'))
+    assert tables.get('a', build('a')) is first
+    tables.get('b', build('b'))
+    tables.get('a', build('a'))
+    tables.get('c', build('c'))
+    tables.get('b', build('b'))
+    assert builds == ['a', 'b', 'c', 'b']
+    assert tables.get('empty', lambda: ([1], [0])) is None
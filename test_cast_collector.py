@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from cast_collector import CastCollector
+
+
+def test_casts_within_the_delay_are_resolved_and_published_together():
+    batches, published = [], []
+
+    async def resolve(requests):
+        batches.append(list(requests))
+        return [request * 10 for request in requests]
+
+    async def publish(pairs):
+        published.append(pairs)
+
+    async def main():
+        collector = CastCollector(resolve, publish, delay=0.01, max_batch=3)
+        first = await asyncio.gather(*(collector.submit(i) for i in range(4)))
+        second = await collector.submit(9)
+        return collector, first, second
+
+    collector, first, second = asyncio.run(main())
+    assert first == [0, 10, 20, 30]
+    assert second == 90
+    # max_batch сбрасывает пачку сразу, остаток ждет таймера
+    assert batches == [[0, 1, 2], [3], [9]]
+    assert published[0] == [(0, 0), (1, 10), (2, 20)]
+    assert collector.stats() == {'batches': 3, 'casts': 5, 'avg_batch': 5 / 3}
+
+
+def test_resolve_error_reaches_every_caller_of_the_batch():
+    async def resolve(requests):
+        raise RuntimeError('database is locked')
+
+    async def publish(pairs):
+        raise AssertionError('nothing to publish')
+
+    async def main():
+        collector = CastCollector(resolve, publish, delay=0.01)
+        return collector, await asyncio.gather(collector.submit(1), collector.submit(2), return_exceptions=True)
+
+    collector, results = asyncio.run(main())
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+    assert collector.stats()['batches'] == 0
+
+
+def test_publish_error_does_not_lose_results():
+    async def resolve(requests):
+        return requests
+
+    async def publish(pairs):
+        raise RuntimeError('chat is down')
+
+    async def main():
+        collector = CastCollector(resolve, publish, delay=0.01)
+        return await collector.submit('cast')
+
+    assert asyncio.run(main()) == 'cast'
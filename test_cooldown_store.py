@@ -0,0 +1,45 @@
+import json
+import time
+from cooldown_store import CooldownStore
+
+
+def test_expired_cooldowns_are_evicted_on_write():
+    store = CooldownStore(path=None)
+    now = time.time()
+    store.set('fishing', 'alice', 10, now=now - 20)
+    store.set('slots', 'alice', 100, now=now - 20)
+    assert store.remaining('fishing', 'alice', now=now - 15) == 5
+    assert store.remaining('fishing', 'alice', now=now - 10) == 0
+    store.set('slots', 'bob', 100, now=now)
+    stats = store.stats()
+    assert stats['evictions'] == 1
+    assert stats['namespaces'] == {'slots': 2}
+
+
+def test_overwritten_cooldown_is_not_evicted_by_its_old_expiry():
+    store = CooldownStore(path=None)
+    now = time.time()
+    store.set('fishing', 'alice', 10, now=now - 20)
+    store.set('fishing', 'alice', 60, now=now - 15)
+    store.set('fishing', 'bob', 1, now=now)
+    assert store.remaining('fishing', 'alice', now=now) == 45
+
+
+def test_snapshot_round_trip_keeps_only_live_cooldowns(tmp_path):
+    path = str(tmp_path / 'cooldowns.json')
+    store = CooldownStore(path=path, snapshot_interval=3600)
+    store.set('build', 'alice', 600)
+    store.set('slots', 'bob', 600)
+    store.clear('slots')
+    store.close()
+    data = json.loads(open(path, encoding='utf-8').read())
+    assert set(data['cooldowns']) == {'build'}
+    data['cooldowns']['fishing'] = {'carol': 1.0}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    restored = CooldownStore(path=path)
+    # Снимок округляет время окончания до 0.1 с
+    assert 590 < restored.remaining('build', 'alice') < 600.1
+    assert not restored.active('fishing', 'carol')
+    assert not restored.active('slots', 'bob')
+    assert restored.save() is False
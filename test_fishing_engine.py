@@ -0,0 +1,18 @@
+import shutil
+import sqlite3
+from fishing_engine import FishingEngine
+
+
+def test_drop_tables_are_kept_per_database(db_path, tmp_path):
+    other_path = str(tmp_path / 'other.db')
+    shutil.copy(db_path, other_path)
+    conn = sqlite3.connect(other_path)
+    conn.execute("UPDATE items SET name = 'Окунь' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    # Оба каталога начинают с версии 1
+    first = FishingEngine(db_path).sampler('limited')
+    second = FishingEngine(other_path).sampler('limited')
+    assert first is not second
+    assert first.sample().name == 'Карась'
+    assert second.sample().name == 'Окунь'
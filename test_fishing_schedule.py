@@ -0,0 +1,43 @@
+from datetime import datetime
+from fishing_schedule import FishingSchedule, FishingWindow
+
+def at(day: int, hour: int, minute: int = 0) -> datetime:
+    """Время в неделе с 2026-10-19 (понедельник)"""
+    return datetime(2026, 10, day, hour, minute)
+
+
+def test_regular_windows_repeat_every_interval():
+    schedule = FishingSchedule({'window_minutes': 7, 'interval_minutes': 60, 'offset_minutes': 30})
+    assert schedule.current_window(at(19, 10, 33)) == FishingWindow(at(19, 10, 30), at(19, 10, 37))
+    assert schedule.current_window(at(19, 10, 37)) is None
+    assert schedule.next_boundary(at(19, 10, 40)) == (at(19, 11, 30), None)
+    assert schedule.next_boundary(at(19, 11, 31)) == (at(19, 11, 37), FishingWindow(at(19, 11, 30), at(19, 11, 37)))
+
+
+def test_weekday_overrides_and_days_off():
+    schedule = FishingSchedule({
+        'weekdays': {
+            '5': {'enabled': False},
+            '6': {'window_minutes': 30, 'interval_minutes': 120, 'offset_minutes': 60},
+        },
+    })
+    assert schedule.windows(at(24, 0), at(25, 0)) == []
+    sunday = schedule.windows(at(25, 0), at(25, 6))
+    assert [(w.start, w.minutes) for w in sunday] == [(at(25, 1), 30), (at(25, 3), 30), (at(25, 5), 30)]
+    # Суббота выходная, значит следующее окно - в воскресенье в 01:00
+    assert schedule.next_window(at(24, 12)).start == at(25, 1)
+
+
+def test_events_are_merged_with_regular_windows():
+    schedule = FishingSchedule({'events': [
+        {'start': '2026-10-19T12:05', 'end': '2026-10-19T13:00', 'title': 'Турнир'},
+    ]})
+    # Окна 12:00-12:07, 12:05-13:00 и 13:00-13:07 пересекаются или касаются
+    assert schedule.windows(at(19, 11, 30), at(19, 14)) == [FishingWindow(at(19, 12), at(19, 13, 7), 'Турнир')]
+
+
+def test_broken_file_falls_back_to_the_default(tmp_path):
+    path = tmp_path / 'fishing_schedule.json'
+    path.write_text('{"window_minutes": 0}', encoding='utf-8')
+    schedule = FishingSchedule.load(str(path))
+    assert schedule.current_window(at(19, 10, 3)).minutes == 7
@@ -0,0 +1,16 @@
+from ledger import LedgerReconciler
+from repository import Repository
+
+
+def test_reconciler_books_balance_drift(db_path, raw):
+    reconciler = LedgerReconciler(db_path)
+    assert reconciler.run()['mismatches'] == 0
+    # Прямой UPDATE в обход Repository не пишет строку в ledger
+    raw.execute("UPDATE players SET balance = balance + 7 WHERE username = 'alice'")
+    raw.commit()
+    assert Repository(db_path).transfer('bob', 'alice', 5) == (45, 112)
+    assert reconciler.run() == {'rows': 2, 'players': 2, 'mismatches': 1}
+    assert raw.execute("SELECT username, delta FROM ledger WHERE reason = 'reconcile'").fetchall() == [('alice', 7)]
+    sums = dict(raw.execute('SELECT username, SUM(delta) FROM ledger GROUP BY username'))
+    assert sums == dict(raw.execute('SELECT username, balance FROM players'))
+    assert reconciler.run()['mismatches'] == 0
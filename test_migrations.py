@@ -0,0 +1,48 @@
+import os
+import sqlite3
+from migrations import LEGACY_UPGRADES_DB, MIGRATIONS, get_applied_versions, run_migrations
+
+
+def test_upgrade_from_the_baseline_schema(baseline_path):
+    raw = sqlite3.connect(baseline_path)
+    raw.executemany('INSERT INTO queue (username, number, timestamp) VALUES (?, ?, ?)', [
+        ('late', '1', '2026-01-01 12:00:00'),
+        ('early', '2', '2026-01-01 10:00:00'),
+    ])
+    raw.commit()
+    assert run_migrations(baseline_path) == MIGRATIONS[-1][0]
+    # telegram_users еще не создан ботом, миграция 3 ждет
+    assert get_applied_versions(raw) == {number for number, *_ in MIGRATIONS} - {3}
+    assert raw.execute('SELECT username FROM queue ORDER BY rank').fetchall() == [('early',), ('late',)]
+    assert dict(raw.execute("SELECT username, delta FROM ledger WHERE reason = 'opening'")) == {'alice': 100, 'bob': 50}
+    version = raw.execute('SELECT version FROM catalog_version').fetchone()[0]
+    raw.execute("UPDATE items SET base_price = 11 WHERE id = 1")
+    raw.commit()
+    assert raw.execute('SELECT version FROM catalog_version').fetchone()[0] == version + 1
+    raw.close()
+
+
+def test_migrations_are_applied_once_and_pending_ones_later(db_path, raw):
+    ledger_rows = raw.execute('SELECT COUNT(*) FROM ledger').fetchone()
+    run_migrations(db_path)
+    assert raw.execute('SELECT COUNT(*) FROM ledger').fetchone() == ledger_rows
+    raw.execute('CREATE TABLE telegram_users (chat_id INTEGER PRIMARY KEY, twitch_username TEXT, link_code TEXT)')
+    raw.commit()
+    run_migrations(db_path)
+    assert 3 in get_applied_versions(raw)
+    indexes = {row[0] for row in raw.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'idx_telegram_users_link_code' in indexes
+
+
+def test_legacy_upgrades_are_imported(baseline_path):
+    legacy = sqlite3.connect(os.path.join(os.path.dirname(baseline_path), LEGACY_UPGRADES_DB))
+    legacy.execute('''CREATE TABLE upgrades (twitch_username TEXT, double_catch_chance INTEGER,
+                      rare_fish_chance INTEGER, fishing_cooldown_reduction INTEGER, shop_discount INTEGER,
+                      sale_price_increase INTEGER, points_balance INTEGER)''')
+    legacy.execute("INSERT INTO upgrades VALUES ('alice', 1, 2, 3, 4, 5, 6)")
+    legacy.commit()
+    legacy.close()
+    run_migrations(baseline_path)
+    raw = sqlite3.connect(baseline_path)
+    assert raw.execute("SELECT rare_fish_chance, points_balance FROM upgrades WHERE twitch_username = 'alice'").fetchone() == (2, 6)
+    raw.close()
@@ -0,0 +1,42 @@
+from player_cache import PlayerCache
+
+
+def test_put_is_dropped_after_a_write_since_the_read():
+    cache = PlayerCache()
+    generation = cache.generation()
+    cache.invalidate('alice')
+    cache.put('alice', {'balance': 1}, generation)
+    assert cache.get('alice') is None
+    cache.put('alice', {'balance': 2}, cache.generation())
+    assert cache.get('Alice') == {'balance': 2}
+
+
+def test_update_writes_through_and_get_returns_copies():
+    cache = PlayerCache()
+    cache.put('alice', {'balance': 2, 'last_played': None}, cache.generation())
+    cache.update('alice', last_played='2026-01-01')
+    row = cache.get('alice')
+    row['balance'] = 100
+    assert cache.get('alice') == {'balance': 2, 'last_played': '2026-01-01'}
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('player_cache.time.monotonic', lambda: now[0])
+    cache = PlayerCache(ttl=30)
+    cache.put('alice', {'balance': 2}, cache.generation())
+    now[0] += 29
+    assert cache.get('alice') is not None
+    now[0] += 2
+    assert cache.get('alice') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_size_is_bounded_lru():
+    cache = PlayerCache(max_size=2)
+    for name in ['a', 'b']:
+        cache.put(name, {}, cache.generation())
+    cache.get('a')
+    cache.put('c', {}, cache.generation())
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
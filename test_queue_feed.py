@@ -0,0 +1,89 @@
+import json
+import asyncio
+from queue_feed import QueueFeed
+from queue_index import QueueIndex
+
+
+async def read_event(reader) -> dict:
+    lines = []
+    while True:
+        line = (await asyncio.wait_for(reader.readline(), 5)).decode('utf-8').rstrip('\n')
+        if not line:
+            if lines:
+                break
+            continue
+        if not line.startswith(':'):
+            lines.append(line)
+    assert lines[0] == 'event: queue'
+    return json.loads(lines[1][len('data: '):])
+
+
+async def request(port: int, path: str):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    return reader, writer
+
+
+def test_snapshot_and_events_follow_the_queue(db_path, tmp_path):
+    snapshot_path = tmp_path / 'queue_snapshot.json'
+    queue = QueueIndex(db_path)
+    queue.add('alice', '1')
+    feed = QueueFeed(queue, str(snapshot_path), port=0)
+
+    async def scenario():
+        await feed.start()
+        port = feed._server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await request(port, '/events')
+            first = await read_event(reader)
+            assert first['event'] == 'snapshot'
+            assert [entry['username'] for entry in first['queue']] == ['alice']
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, queue.add, 'bob', '2', True)
+            event = await read_event(reader)
+            assert event['event'] == 'skip' and event['changed'] == ['bob']
+            assert event['version'] > first['version']
+            assert [(entry['position'], entry['username']) for entry in event['queue']] == [(1, 'bob'), (2, 'alice')]
+            writer.close()
+
+            reader, writer = await request(port, '/queue')
+            assert json.loads(await reader.read()) == event
+            writer.close()
+            return event
+        finally:
+            await feed.stop()
+
+    last = asyncio.run(scenario())
+    feed.close()
+    assert json.loads(snapshot_path.read_text(encoding='utf-8')) == last
+
+
+def test_bursts_are_written_once_outside_the_index_lock(db_path, tmp_path, monkeypatch):
+    snapshot_path = tmp_path / 'queue_snapshot.json'
+    queue = QueueIndex(db_path)
+    feed = QueueFeed(queue, str(snapshot_path), coalesce=0.2)
+    writes = []
+    write_snapshot = feed._write_snapshot
+
+    def record(data):
+        # Запись идет без блокировки индекса: другой поток может менять очередь
+        assert queue._lock.acquire(blocking=False)
+        queue._lock.release()
+        writes.append(data)
+        write_snapshot(data)
+    monkeypatch.setattr(feed, '_write_snapshot', record)
+
+    queue.add('alice', '1')
+    queue.add('bob', '2')
+    queue.add('carol', '3', front=True)
+    assert feed.flush()
+    feed.close()
+    assert len(writes) == 1
+    snapshot = json.loads(snapshot_path.read_text(encoding='utf-8'))
+    assert snapshot['version'] == 3 and snapshot['event'] == 'batch'
+    assert snapshot['changed'] == ['alice', 'bob', 'carol']
+    assert [entry['username'] for entry in snapshot['queue']] == ['carol', 'alice', 'bob']
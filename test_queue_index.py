@@ -0,0 +1,120 @@
+import math
+import random
+from queue_index import IndexedSkipList, QueueIndex
+from repository import Repository
+
+
+def db_order(raw):
+    return [row[0] for row in raw.execute('SELECT username FROM queue ORDER BY rank, id')]
+
+
+def test_skip_list_matches_sorted_list():
+    rng = random.Random(7)
+    skip, expected = IndexedSkipList(), []
+    for _ in range(500):
+        key = rng.randrange(200)
+        if key in expected:
+            skip.remove(key)
+            expected.remove(key)
+        else:
+            skip.insert(key, str(key))
+            expected.append(key)
+        expected.sort()
+    assert list(skip) == [str(key) for key in expected]
+    for i, key in enumerate(expected):
+        assert skip.rank(key) == i
+        assert skip.key_at(i) == key
+    assert skip.slice(3, 8) == [str(key) for key in expected[3:8]]
+
+
+def test_move_updates_index_and_rank_column(db_path, raw):
+    queue = QueueIndex(db_path)
+    for name in 'abcde':
+        queue.add(name, '1')
+    assert queue.move('e', 2) == 2
+    assert queue.move('a', 99) == 5
+    expected = ['e', 'b', 'c', 'd', 'a']
+    assert [entry['username'] for entry in queue.entries()] == expected
+    assert db_order(raw) == expected
+    assert queue.position('b') == 2
+
+
+def test_move_with_a_required_statement_is_all_or_nothing(db_path, raw):
+    queue = QueueIndex(db_path)
+    for name in ['bob', 'alice']:
+        queue.add(name, '1')
+    spend = [Repository.spend_queue_pass_statement('alice')]
+    assert queue.move('alice', 1, 'skip', spend) is None
+    assert db_order(raw) == ['bob', 'alice']
+    raw.execute("INSERT INTO queue_passes (username, passes) VALUES ('alice', 2)")
+    raw.commit()
+    assert queue.move('alice', 1, 'skip', spend) == 1
+    # Уже первая: позиция не меняется, но пропуск всё равно тратится
+    assert queue.move('alice', 1, 'skip', spend) == 1
+    assert queue.move('alice', 1, 'skip', spend) is None
+    assert db_order(raw) == ['alice', 'bob']
+    assert raw.execute("SELECT passes FROM queue_passes WHERE username = 'alice'").fetchone() == (0,)
+
+
+def test_add_with_a_required_statement_is_all_or_nothing(db_path, raw):
+    queue = QueueIndex(db_path)
+    queue.add('bob', '1')
+    spend = [Repository.spend_queue_pass_statement('alice')]
+    assert not queue.add('alice', '2', front=True, statements=spend)
+    assert queue.position('alice') is None
+    assert db_order(raw) == ['bob']
+    raw.execute("INSERT INTO queue_passes (username, passes) VALUES ('alice', 1)")
+    raw.commit()
+    assert queue.add('alice', '2', front=True, statements=spend)
+    assert db_order(raw) == ['alice', 'bob']
+    assert queue.position('alice') == 1
+
+
+def test_renumber_when_neighbours_run_out_of_room(db_path, raw, monkeypatch):
+    queue = QueueIndex(db_path)
+    renumbered = []
+    renumber = queue._renumber
+    monkeypatch.setattr(queue, '_renumber', lambda cursor: renumbered.append(1) or renumber(cursor))
+    for name in 'abcd':
+        queue.add(name, '1')
+    # Каждый перенос на 2-е место делит один и тот же промежуток пополам
+    for i in range(80):
+        assert queue.move('d' if i % 2 else 'c', 2) == 2
+    assert renumbered
+    ranks = [row[0] for row in raw.execute('SELECT rank FROM queue ORDER BY rank')]
+    assert len(set(ranks)) == 4
+    assert db_order(raw) == [entry['username'] for entry in queue.entries()]
+    reloaded = QueueIndex(db_path)
+    assert reloaded.entries() == queue.entries()
+
+
+def test_rolled_back_renumber_keeps_the_index(db_path, raw):
+    raw.executemany('INSERT INTO queue (username, number, rank) VALUES (?, ?, ?)',
+                    [('a', '1', 1.0), ('b', '1', math.nextafter(1.0, 2.0)), ('c', '1', 2.0)])
+    raw.commit()
+    queue = QueueIndex(db_path)
+    spend = [Repository.spend_queue_pass_statement('c')]
+    assert queue.move('c', 2, statements=spend) is None
+    # Индекс не перечитывается: новые ранги в него просто не попали
+    assert queue._loaded
+    assert [entry['username'] for entry in queue.entries()] == ['a', 'b', 'c']
+    assert [key[0] for key in queue._keys.values()] == [row[0] for row in raw.execute('SELECT rank FROM queue ORDER BY id')]
+    assert queue.move('c', 2) == 2
+    assert db_order(raw) == ['a', 'c', 'b']
+
+
+def test_dequeue_many_removes_rows_and_stamps_last_played(db_path, raw):
+    raw.executemany('INSERT INTO players (username) VALUES (?)', [('c',), ('d',)])
+    raw.commit()
+    queue = QueueIndex(db_path)
+    for name in ['alice', 'bob', 'c', 'd']:
+        queue.add(name, '7')
+    picked = queue.dequeue_many(count=2)
+    assert [entry['username'] for entry in picked] == ['alice', 'bob']
+    picked = queue.dequeue_many(['D', 'nobody', 'd'], last_played='2026-01-01T00:00:00')
+    assert [entry['username'] for entry in picked] == ['d']
+    assert db_order(raw) == ['c']
+    assert len(queue) == 1
+    last_played = dict(raw.execute('SELECT username, last_played FROM players WHERE last_played IS NOT NULL'))
+    assert set(last_played) == {'alice', 'bob', 'd'}
+    assert last_played['d'] == '2026-01-01T00:00:00'
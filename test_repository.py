@@ -0,0 +1,152 @@
+from repository import Repository
+
+
+def balances(raw):
+    return dict(raw.execute('SELECT username, balance FROM players'))
+
+
+def test_purchase_rolls_back_when_funds_are_short(db_path, raw):
+    repo = Repository(db_path)
+    statement = repo.queue_pass_statement('bob', 1)
+    assert repo.purchase('bob', 60, [statement]) is None
+    assert repo.get_queue_passes('bob') == 0
+    assert repo.purchase('bob', 50, [statement]) == 0
+    assert repo.get_queue_passes('bob') == 1
+    assert balances(raw)['bob'] == 0
+
+
+def test_purchase_rolls_back_when_required_statement_misses(db_path, raw):
+    repo = Repository(db_path)
+    raw.execute('UPDATE items SET is_caught = 1 WHERE id = 1')
+    raw.commit()
+    assert repo.purchase('alice', 10, [repo.claim_unique_fish_statement(1)]) is None
+    assert balances(raw)['alice'] == 100
+
+
+def test_transfer_is_conditional(db_path, raw):
+    repo = Repository(db_path)
+    assert repo.transfer('bob', 'alice', 51) is None
+    assert repo.transfer('bob', 'alice', 50) == (0, 150)
+    assert balances(raw) == {'alice': 150, 'bob': 0}
+    assert repo.get_balance('alice') == 150
+
+
+def test_sell_items_credits_only_items_still_owned(db_path, raw):
+    repo = Repository(db_path)
+    own = repo.add_inventory_item('alice', 'fish', 1, 'Карась', 'common', 10)
+    other = repo.add_inventory_item('bob', 'fish', 1, 'Карась', 'common', 30)
+    assert repo.sell_items('alice', [own, other], bonus_permille=100) == (1, 11, 111)
+    assert repo.sell_items('alice', [own]) is None
+    assert balances(raw)['alice'] == 111
+    assert raw.execute('SELECT username FROM inventory').fetchall() == [('bob',)]
+
+
+def test_accept_trade_rolls_back_when_a_debit_fails(db_path, raw):
+    repo = Repository(db_path)
+    fish = repo.add_inventory_item('alice', 'fish', 1, 'Карась', 'common', 10)
+    trade_id = repo.create_trade('alice', fish, 0, None, 60)
+    status, _ = repo.accept_trade(trade_id, 'bob')
+    assert status == 'responder_funds'
+    assert raw.execute('SELECT username FROM inventory WHERE id = ?', (fish,)).fetchone() == ('alice',)
+    assert repo.get_trade(trade_id)['status'] == 'active'
+    raw.execute("UPDATE trades SET requested_coins = 50 WHERE id = ?", (trade_id,))
+    raw.commit()
+    assert repo.accept_trade(trade_id, 'bob')[0] == 'ok'
+    assert balances(raw) == {'alice': 150, 'bob': 0}
+    assert raw.execute('SELECT username FROM inventory WHERE id = ?', (fish,)).fetchone() == ('bob',)
+    assert repo.accept_trade(trade_id, 'bob')[0] == 'not_found'
+
+
+def test_reads_keep_the_callers_transaction(db_path, raw):
+    repo = Repository(db_path)
+    conn = repo.connection()
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute("UPDATE players SET balance = 1 WHERE username = 'alice'")
+    repo.get_queue_passes('alice')
+    repo.catalog.snapshot()
+    assert conn.in_transaction
+    conn.commit()
+    assert balances(raw)['alice'] == 1
+
+
+def test_write_behind_reads_see_pending_writes(db_path):
+    repo = Repository(db_path)
+    repo.writes.flush()
+    repo.queue_inventory_item('alice', 'fish', 1, 'Карась', 'common', 10)
+    repo.queue_cooldown('alice', 12345)
+    assert [row['item_name'] for row in repo.get_inventory('alice', 'fish')] == ['Карась']
+    assert repo.get_fishing_cooldown('alice')[0] == 12345
+
+
+def test_take_coins_clamps_at_zero(db_path, raw):
+    repo = Repository(db_path)
+    assert repo.take_coins('bob', 30) == (30, 20)
+    assert repo.take_coins('bob', 30) == (20, 0)
+    assert repo.take_coins('nobody', 5) is None
+    assert balances(raw)['bob'] == 0
+    assert raw.execute("SELECT SUM(delta) FROM ledger WHERE username = 'bob'").fetchone() == (0,)
+
+
+def test_transfer_passes_never_goes_negative(db_path, raw):
+    repo = Repository(db_path)
+    repo.add_queue_pass('alice', 2)
+    assert repo.transfer_passes('alice', 'bob', 3) is None
+    assert repo.transfer_passes('alice', 'bob', 2) == (0, 2)
+    assert repo.transfer_passes('alice', 'bob', 1) is None
+    assert dict(raw.execute('SELECT username, passes FROM queue_passes')) == {'alice': 0, 'bob': 2}
+
+
+def test_sell_items_of_any_type_releases_unique_fish(db_path, raw):
+    repo = Repository(db_path)
+    raw.execute('UPDATE items SET is_caught = 1 WHERE id = 1')
+    raw.commit()
+    fish = repo.add_inventory_item('alice', 'fish', 1, 'Карась', 'common', 10)
+    item = repo.add_inventory_item('alice', 'item', 2, 'Удочка', 'common', 5)
+    release = [repo.release_unique_fish_statement(1)]
+    assert repo.sell_items('alice', [fish, item], item_type=None, statements=release) == (2, 15, 115)
+    assert raw.execute('SELECT is_caught FROM items WHERE id = 1').fetchone() == (0,)
+    assert raw.execute('SELECT COUNT(*) FROM inventory').fetchone() == (0,)
+
+
+def test_spend_queue_pass_and_add_fish(db_path, raw):
+    repo = Repository(db_path)
+    assert repo.spend_queue_pass('alice') is None
+    repo.add_queue_pass('alice', 1)
+    assert repo.spend_queue_pass('alice') == 0
+    assert repo.spend_queue_pass('alice') is None
+    assert repo.add_fish('Окунь', 3, 'common') == 2
+    assert repo.catalog.get(2).name == 'Окунь'
+
+
+def test_balance_changes_drop_the_cached_row(db_path):
+    repo = Repository(db_path)
+    assert repo.get_balance('alice') == 100
+    generation = repo.players.generation()
+    assert repo.add_coins('alice', 5) == 105
+    assert repo.players.get('alice') is None
+    # Строка, прочитанная до коммита, в кэш уже не попадёт
+    repo.players.put('alice', {'username': 'alice', 'balance': 100}, generation)
+    assert repo.get_balance('alice') == 105
+
+
+def test_add_catches_gives_an_ultimate_fish_once(db_path, raw):
+    repo = Repository(db_path)
+    raw.execute("INSERT INTO items (id, name, type, base_price, rarity, is_unique) VALUES (2, 'Кит', 'fish', 500, 'ultimate', 1)")
+    raw.commit()
+    carp, whale = repo.catalog.get(1), repo.catalog.get(2)
+    added = repo.add_catches([('Alice', [(whale, 500), (carp, 10)]), ('bob', [(whale, 500), (carp, 12)])])
+    assert added == [[(whale, 500), (carp, 10)], [(carp, 12)]]
+    assert raw.execute('SELECT is_caught FROM items WHERE id = 2').fetchone() == (1,)
+    assert raw.execute('SELECT username, item_name FROM inventory ORDER BY id').fetchall() == [
+        ('alice', 'Кит'), ('alice', 'Карась'), ('bob', 'Карась')]
+    assert repo.catalog.get(2).is_caught
+
+
+def test_add_catches_writes_nothing_on_error(db_path, raw):
+    repo = Repository(db_path)
+    raw.execute("INSERT INTO items (id, name, type, base_price, rarity, is_unique) VALUES (2, 'Кит', 'fish', 500, 'ultimate', 1)")
+    raw.execute('ALTER TABLE inventory RENAME TO inventory_old')
+    raw.commit()
+    whale = repo.catalog.get(2)
+    assert repo.add_catches([('alice', [(whale, 500)])]) is None
+    assert raw.execute('SELECT is_caught FROM items WHERE id = 2').fetchone() == (0,)
@@ -6,6 +6,8 @@ from telebot import types
 import threading
 import time
 import random
+import re
+import html
 import json
 from datetime import datetime
 import logging
@@ -20,6 +22,13 @@ from tgw_past_def import *
 # Import upgrade system
 from upgrade_system import UpgradeSystem
 from upgrade_handler import UpgradeHandler
+from migrations import run_migrations
+from repository import Repository
+from write_behind import flush_all_queues
+from db_stats import stats as db_stats, tracked
+from alias_sampler import drop_tables
+from fishing_schedule import get_fishing_schedule
+from fishing_engine import get_fishing_engine, RARITY_NAMES_RU, CURRENCY_NAME
 
 # Configure logging
 logging.basicConfig(
@@ -31,12 +40,18 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Порядок редкостей в списках рыбы
+FISH_RARITY_ORDER = {
+    rarity: position for position, rarity in enumerate(
+        ('common', 'uncommon', 'rare', 'epic', 'legendary', 'immortal', 'mythical', 'arcane', 'ultimate'), 1)
+}
 
 class TelegramBot:
     def __init__(self, token: str, db_path: str = 'bot_database.db'):
         
         self.token = token
         self.db_path = db_path
+        self.repo = Repository(db_path)
         self.bot = telebot.TeleBot(token)
         self.pending_links = {}  # Store pending link requests
         self.user_states = {}    # Store user states (for pagination, etc.)
@@ -57,32 +72,13 @@ class TelegramBot:
         self.create_cooldown_table()
         self.create_settings_table()
         self.create_fishing_notifications_table()
+        run_migrations(self.db_path)
         
-        # Редкость рыбы и их веса для выбора
-        self.FISH_RARITY_WEIGHTS = {
-            "common": 3000,
-            "uncommon": 2500,
-            "rare": 2000,
-            "epic": 1500,
-            "legendary": 800,
-            "immortal": 200,
-            "mythical": 100,
-            "arcane": 50,
-            "ultimate": 10
-        }
-        
-        # Перевод названий редкости на русский язык
-        self.RARITY_NAMES_RU = {
-            "common": "Обычная",
-            "uncommon": "Необычная", 
-            "rare": "Редкая",
-            "epic": "Эпическая",
-            "legendary": "Легендарная",
-            "immortal": "Бессмертная",
-            "mythical": "Мифическая",
-            "arcane": "Волшебная",
-            "ultimate": "Ультимативная"
-        }
+        # Настройки выпадения рыбы и названия редкостей берутся из общего движка рыбалки
+        self.fishing_engine = get_fishing_engine(db_path)
+        fishing_mode = self.fishing_engine.mode("telegram")
+        self.FISH_RARITY_WEIGHTS = fishing_mode.weights
+        self.RARITY_NAMES_RU = RARITY_NAMES_RU
         
         self.buy_fish_price = {
             "common": 100,
@@ -96,10 +92,10 @@ class TelegramBot:
             "ultimate": 10000
         }
         # Кулдаун для рыбалки (в секундах)
-        self.FISHING_COOLDOWN = 3600  # 1 час
+        self.FISHING_COOLDOWN = fishing_mode.cooldown  # 1 час
         
         # Валюта бота
-        self.CURRENCY_NAME = "LC"  # Lonely Coins
+        self.CURRENCY_NAME = CURRENCY_NAME
         
         # Pass data to help_info module
         self.help_info.FISH_RARITY_WEIGHTS = self.FISH_RARITY_WEIGHTS
@@ -111,32 +107,80 @@ class TelegramBot:
         self.mini_collections = self.load_mini_collections()
         
         # Register command handlers
-        self.bot.message_handler(commands=['start'])(self.start_command)
-        self.bot.message_handler(commands=['link'])(self.link_command)
-        self.bot.message_handler(commands=['fish'])(self.fish_command)
-        self.bot.message_handler(commands=['catch'])(self.fish_telegram)  # New fishing command
-        self.bot.message_handler(commands=['duplicates'])(self.duplicates_command)  # New duplicates command
-        self.bot.message_handler(commands=['balance'])(self.balance_command)  # New balance command
-        self.bot.message_handler(commands=['info'])(self.info_command)  # New info command
-        self.bot.message_handler(commands=['help'])(self.help_command)  # Help command
-        self.bot.message_handler(commands=['contact'])(self.contact_lonely)  # Contact Lonely command
-        self.bot.message_handler(commands=['support'])(self.support_lonely)  # Support command
-        self.bot.message_handler(commands=['trade'])(self.trade_command)
-        self.bot.message_handler(commands=['msg'])(self.start_private_chat)  # Private messaging command
-        self.bot.message_handler(commands=['reply_to_last'])(self.reply_to_last_command)  # Reply to last sender
-        self.bot.message_handler(commands=['end_chat'])(self.end_private_chat)  # End private chat command
-        self.bot.message_handler(commands=['pm_menu'])(self.show_pm_menu)  # Show private messaging menu
-        self.bot.message_handler(commands=['reboot'])(self.reboot)
-        self.bot.message_handler(commands=['upgrades'])(self.upgrades_command)  # Upgrades command
-        self.bot.callback_query_handler(func=lambda call: True)(self.handle_callback_query)
-        self.bot.message_handler(func=lambda message: True)(self.handle_message)
+        self.bot.message_handler(commands=['start'])(tracked('tg:/start')(self.start_command))
+        self.bot.message_handler(commands=['link'])(tracked('tg:/link')(self.link_command))
+        self.bot.message_handler(commands=['fish'])(tracked('tg:/fish')(self.fish_command))
+        self.bot.message_handler(commands=['catch'])(tracked('tg:/catch')(self.fish_telegram))  # New fishing command
+        self.bot.message_handler(commands=['duplicates'])(tracked('tg:/duplicates')(self.duplicates_command))  # New duplicates command
+        self.bot.message_handler(commands=['balance'])(tracked('tg:/balance')(self.balance_command))  # New balance command
+        self.bot.message_handler(commands=['info'])(tracked('tg:/info')(self.info_command))  # New info command
+        self.bot.message_handler(commands=['help'])(tracked('tg:/help')(self.help_command))  # Help command
+        self.bot.message_handler(commands=['contact'])(tracked('tg:/contact')(self.contact_lonely))  # Contact Lonely command
+        self.bot.message_handler(commands=['support'])(tracked('tg:/support')(self.support_lonely))  # Support command
+        self.bot.message_handler(commands=['trade'])(tracked('tg:/trade')(self.trade_command))
+        self.bot.message_handler(commands=['msg'])(tracked('tg:/msg')(self.start_private_chat))  # Private messaging command
+        self.bot.message_handler(commands=['reply_to_last'])(tracked('tg:/reply_to_last')(self.reply_to_last_command))  # Reply to last sender
+        self.bot.message_handler(commands=['end_chat'])(tracked('tg:/end_chat')(self.end_private_chat))  # End private chat command
+        self.bot.message_handler(commands=['pm_menu'])(tracked('tg:/pm_menu')(self.show_pm_menu))  # Show private messaging menu
+        self.bot.message_handler(commands=['reboot'])(tracked('tg:/reboot')(self.reboot))
+        self.bot.message_handler(commands=['upgrades'])(tracked('tg:/upgrades')(self.upgrades_command))  # Upgrades command
+        self.bot.message_handler(commands=['dbstats'])(self.db_stats_command)
+        self.bot.message_handler(commands=['windows'])(tracked('tg:/windows')(self.fishing_windows_command))
+        self.bot.callback_query_handler(func=lambda call: True)(tracked(self._callback_stats_name)(self.handle_callback_query))
+        self.bot.message_handler(func=lambda message: True)(tracked('tg:message')(self.handle_message))
         
         logger.info("TelegramBot initialized successfully")
     
     def reboot(self, message):
         logger.info("Перезапуск бота...")
         if self.can_reboot(message.chat.id):
+            flush_all_queues()
             subprocess.Popen(["tw.exe"])
+    
+    @staticmethod
+    def _callback_stats_name(call):
+        """Имя для статистики запросов: callback data без идентификаторов"""
+        return "tg:" + re.sub(r'\d+', '#', call.data or '')
+    
+    def fishing_windows_command(self, message):
+        """Ближайшие окна рыбалки на Twitch"""
+        windows = get_fishing_schedule().upcoming(count=5)
+        if not windows:
+            self.bot.send_message(message.chat.id, "⏳ Ближайших окон рыбалки на Twitch нет")
+            return
+        now = datetime.now()
+        message_text = "🎣 <b>Окна рыбалки на Twitch</b>\n\n"
+        for window in windows:
+            line = f"• {window.start:%d.%m %H:%M} - {window.end:%H:%M}"
+            if window.title:
+                line += f" <b>{html.escape(window.title)}</b>"
+            if window.start <= now:
+                line += " (открыто сейчас)"
+            message_text += line + "\n"
+        self.bot.send_message(message.chat.id, message_text, parse_mode='HTML')
+
+    def db_stats_command(self, message):
+        """Статистика запросов к БД по командам (только для владельцев канала)"""
+        chat_id = message.chat.id
+        if not self.can_reboot(chat_id):
+            return
+        args = message.text.split()
+        if len(args) > 1 and args[1] == "reset":
+            db_stats.reset()
+            self.bot.send_message(chat_id, "🗑 Статистика запросов сброшена")
+            return
+        report = db_stats.report()[:15]
+        if not report:
+            self.bot.send_message(chat_id, "📊 Статистики запросов пока нет")
+            return
+        uptime = int(time.time() - db_stats.started_at) // 60
+        message_text = f"📊 <b>Запросы к БД за {uptime} мин</b>\n\n"
+        message_text += "\n".join(f"• {html.escape(db_stats.format_line(item))}" for item in report)
+        message_text += f"\n\n🎣 {html.escape(drop_tables.format_stats())}"
+        message_text += "\n\n<b>Самые дорогие запросы:</b>\n"
+        for sql, count, total_ms, max_ms in db_stats.top_statements(5):
+            message_text += f"• {count}x, {total_ms:.0f} ms (max {max_ms:.1f}): <code>{html.escape(sql[:100])}</code>\n"
+        self.bot.send_message(chat_id, message_text[:4000], parse_mode='HTML')
     def start_fishing_notification_checker(self):
         """Запустить проверку уведомлений о рыбалке"""
         def check_fishing_notifications():
@@ -205,12 +249,8 @@ class TelegramBot:
     def get_fish_by_id_from_db(self, fish_id):
         """Получение рыбы по ID из базы данных"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM items WHERE id = ?', (fish_id,))
-            fish = cursor.fetchone()
-            conn.close()
-            return fish
+            fish = self.repo.get_item(fish_id)
+            return tuple(fish) if fish else None
         except Exception as e:
             logger.error("Failed to get fish by id %s: %s", fish_id, str(e))
             return None
@@ -222,10 +262,7 @@ class TelegramBot:
     def create_telegram_table(self):
         """Создание таблицы для хранения пользователей Telegram"""
         logger.info("Creating telegram_users table if it doesn't exist")
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        self.repo.create_tables('''
             CREATE TABLE IF NOT EXISTS telegram_users (
                 chat_id INTEGER PRIMARY KEY,
                 link_code TEXT,
@@ -234,36 +271,24 @@ class TelegramBot:
                 FOREIGN KEY(twitch_username) REFERENCES players(username) ON DELETE SET NULL
             )
         ''')
-        
-        conn.commit()
-        conn.close()
         logger.info("telegram_users table created or already exists")
     
     def create_cooldown_table(self):
         """Создание таблицы для хранения времени кулдауна пользователей"""
         logger.info("Creating cooldowns table if it doesn't exist")
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        self.repo.create_tables('''
             CREATE TABLE IF NOT EXISTS cooldowns (
                 username TEXT PRIMARY KEY,
                 last_used INTEGER DEFAULT 0,
                 FOREIGN KEY(username) REFERENCES players(username) ON DELETE CASCADE
             )
         ''')
-        
-        conn.commit()
-        conn.close()
         logger.info("cooldowns table created or already exists")
     
     def create_settings_table(self):
         """Создание таблицы для хранения пользовательских настроек"""
         logger.info("Creating settings table if it doesn't exist")
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        self.repo.create_tables('''
             CREATE TABLE IF NOT EXISTS user_settings (
                 chat_id INTEGER PRIMARY KEY,
                 fishing_notifications INTEGER DEFAULT 1,
@@ -271,363 +296,128 @@ class TelegramBot:
                 FOREIGN KEY(chat_id) REFERENCES telegram_users(chat_id) ON DELETE CASCADE
             )
         ''')
-        
-        conn.commit()
-        conn.close()
         logger.info("settings table created or already exists")
     
     def create_fishing_notifications_table(self):
         """Создание таблицы для отслеживания уведомлений о рыбалке"""
         logger.info("Creating fishing notifications table if it doesn't exist")
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        self.repo.create_tables('''
             CREATE TABLE IF NOT EXISTS fishing_notifications (
                 chat_id INTEGER PRIMARY KEY,
                 last_sent TIMESTAMP DEFAULT NULL,
                 FOREIGN KEY(chat_id) REFERENCES telegram_users(chat_id) ON DELETE CASCADE
             )
         ''')
-        
-        conn.commit()
-        conn.close()
         logger.info("fishing_notifications table created or already exists")
     
     def save_telegram_user(self, chat_id: int, link_code: str = None):
         """Сохранение или обновление пользователя Telegram в базе данных"""
         logger.info("Saving telegram user with chat_id=%s and link_code=%s", chat_id, link_code)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO telegram_users (chat_id, link_code)
-            VALUES (?, ?)
-        ''', (chat_id, link_code))
-        
-        # Initialize user settings if they don't exist
-        cursor.execute('''
-            INSERT OR IGNORE INTO user_settings (chat_id)
-            VALUES (?)
-        ''', (chat_id,))
-        
-        conn.commit()
-        conn.close()
-        logger.info("Telegram user saved successfully")
+        # Пользователь и его настройки по умолчанию одной транзакцией
+        if self.repo.save_telegram_user(chat_id, link_code):
+            logger.info("Telegram user saved successfully")
     
     def get_user_settings(self, chat_id: int):
         """Получение настроек пользователя"""
         logger.info("Getting settings for chat_id=%s", chat_id)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                SELECT fishing_notifications, fishing_sound 
-                FROM user_settings 
-                WHERE chat_id = ?
-            ''', (chat_id,))
-            
-            result = cursor.fetchone()
-            
-            if result:
-                settings = {
-                    'fishing_notifications': bool(result[0]),
-                    'fishing_sound': bool(result[1])
-                }
-                conn.close()
-                logger.info("Retrieved settings for chat_id=%s: %s", chat_id, settings)
-                return settings
-            else:
-                # If user settings don't exist, create them with default values
-                logger.info("No settings found for chat_id=%s, creating new record", chat_id)
-                cursor.execute('''
-                    INSERT OR IGNORE INTO user_settings (chat_id, fishing_notifications, fishing_sound)
-                    VALUES (?, 1, 0)
-                ''', (chat_id,))
-                
-                conn.commit()
-                
-                # Return default settings
-                settings = {
-                    'fishing_notifications': True,
-                    'fishing_sound': False
-                }
-                logger.info("Created default settings for chat_id=%s: %s", chat_id, settings)
-                conn.close()
-                return settings
-        except Exception as e:
-            logger.error("Error getting/creating user settings for chat_id=%s: %s", chat_id, str(e))
-            conn.close()
-            # Return default settings in case of error
-            default_settings = {
-                'fishing_notifications': True,
-                'fishing_sound': False
+        result = self.repo.get_user_settings(chat_id)
+        if result:
+            settings = {
+                'fishing_notifications': bool(result[0]),
+                'fishing_sound': bool(result[1])
             }
-            logger.info("Returning default settings for chat_id=%s due to error: %s", chat_id, default_settings)
-            return default_settings
+            logger.info("Retrieved settings for chat_id=%s: %s", chat_id, settings)
+            return settings
+        # If user settings don't exist, create them with default values
+        logger.info("No settings found for chat_id=%s, creating new record", chat_id)
+        self.repo.ensure_user_settings(chat_id)
+        settings = {
+            'fishing_notifications': True,
+            'fishing_sound': False
+        }
+        logger.info("Returning default settings for chat_id=%s: %s", chat_id, settings)
+        return settings
         
     def ensure_user_settings_exist(self, chat_id: int):
         """Убедиться, что у пользователя есть запись в таблице настроек"""
         logger.info("Ensuring settings record exists for chat_id=%s", chat_id)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            # Проверяем, существует ли запись для данного пользователя
-            cursor.execute('''
-                SELECT COUNT(*) FROM user_settings WHERE chat_id = ?
-            ''', (chat_id,))
-            
-            result = cursor.fetchone()
-            
-            # Если записи нет, создаем её с настройками по умолчанию
-            if result[0] == 0:
-                logger.info("Creating new settings record for chat_id=%s", chat_id)
-                cursor.execute('''
-                    INSERT INTO user_settings (chat_id, fishing_notifications, fishing_sound)
-                    VALUES (?, 1, 0)
-                ''', (chat_id,))
-                conn.commit()
-                logger.info("Settings record created successfully for chat_id=%s", chat_id)
-        except Exception as e:
-            logger.error("Error ensuring/creating settings record for chat_id=%s: %s", chat_id, str(e))
-        finally:
-            conn.close()
+        self.repo.ensure_user_settings(chat_id)
             
     def update_user_setting(self, chat_id: int, setting_name: str, value: bool):
         """Обновление настройки пользователя"""
         logger.info("Updating setting %s for chat_id=%s to %s", setting_name, chat_id, value)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            # Make sure user settings row exists
-            cursor.execute('''
-                INSERT OR IGNORE INTO user_settings (chat_id)
-                VALUES (?)
-            ''', (chat_id,))
-            
-            # Update the specific setting
-            cursor.execute(f'''
-                UPDATE user_settings 
-                SET {setting_name} = ?
-                WHERE chat_id = ?
-            ''', (int(value), chat_id))
-            
-            conn.commit()
-            conn.close()
+        if self.repo.update_user_setting(chat_id, setting_name, value):
             logger.info("Setting updated successfully")
             return True
-        except Exception as e:
-            logger.error("Error updating setting %s for chat_id=%s: %s", setting_name, chat_id, str(e))
-            conn.rollback()
-            conn.close()
-            return False
+        return False
     
     def get_telegram_user(self, chat_id: int):
         """Получение данных пользователя Telegram"""
         logger.info("Getting telegram user with chat_id=%s", chat_id)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM telegram_users WHERE chat_id = ?', (chat_id,))
-        result = cursor.fetchone()
-        
-        conn.close()
+        row = self.repo.get_telegram_user(chat_id)
+        result = tuple(row) if row else None
         logger.info("Retrieved telegram user data: %s", result)
         return result
     
     def is_user_linked(self, chat_id: int):
         """Проверка, привязан ли пользователь к Twitch аккаунту"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT twitch_username FROM telegram_users 
-            WHERE chat_id = ? AND twitch_username IS NOT NULL
-        ''', (chat_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else None
+        return self.repo.get_twitch_username(chat_id)
         
     def link_accounts(self, chat_id: int, twitch_username: str):
         """Привязка аккаунта Telegram к аккаунту Twitch"""
         logger.info("Linking telegram chat_id=%s to twitch_username=%s", chat_id, twitch_username)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Проверка существования пользователя Twitch
-        cursor.execute('SELECT username FROM players WHERE username = ?', (twitch_username.lower(),))
-        user_exists = cursor.fetchone()
-        if not user_exists:
-            conn.close()
+        if not self.repo.link_telegram_account(chat_id, twitch_username):
             logger.warning("Twitch user %s does not exist in players table", twitch_username)
             return False
-        
-        # Привязка аккаунтов
-        cursor.execute('''
-            UPDATE telegram_users 
-            SET twitch_username = ?, link_code = NULL 
-            WHERE chat_id = ?
-        ''', (twitch_username.lower(), chat_id))
-        
-        conn.commit()
-        conn.close()
         logger.info("Accounts linked successfully")
         return True
     
     def get_user_inventory(self, twitch_username: str):
         """Получение инвентаря рыбы пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM inventory 
-            WHERE username = ? AND item_type = 'fish'
-            ORDER BY obtained_at DESC
-        ''', (twitch_username.lower(),))
-        
-        results = cursor.fetchall()
-        conn.close()
-        return results
+        return [tuple(row) for row in self.repo.get_inventory(twitch_username, 'fish')]
     
     def get_fish_by_id(self, fish_id: int):
         """Получение рыбы по ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM inventory 
-            WHERE id = ? AND item_type = 'fish'
-        ''', (fish_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        return result
+        row = self.repo.get_inventory_item(fish_id, item_type='fish')
+        return tuple(row) if row else None
     
     def get_user_cooldown(self, twitch_username: str):
         """Получение времени последней рыбалки пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT last_used FROM cooldowns WHERE username = ?
-        ''', (twitch_username.lower(),))
-        
-        result = cursor.fetchone()
-        conn.close()
-        return int(result[0]) if result and result[0] else 0
+        last_used = self.repo.get_cooldown(twitch_username)
+        return int(last_used) if last_used else 0
 
     def update_user_cooldown(self, twitch_username: str, timestamp: int):
         """Обновление времени последней рыбалки пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO cooldowns (username, last_used)
-            VALUES (?, ?)
-        ''', (twitch_username.lower(), timestamp))
-        
-        conn.commit()
-        conn.close()
+        self.repo.queue_cooldown(twitch_username, timestamp)
 
     def can_fish(self, twitch_username: str):
         """Проверка, может ли пользователь рыбачить (прошел ли кулдаун)"""
         import time
-        last_fish_time = self.get_user_cooldown(twitch_username)
+        last_fish_time, cd = self.repo.get_fishing_cooldown(twitch_username)
         current_time = int(time.time())
-        try:
-            cd_um=self.upgrade_system.get_user_upgrades(twitch_username)
-            cd=cd_um['fishing_cooldown_reduction']
-            cd = int(self.FISHING_COOLDOWN-self.FISHING_COOLDOWN*cd*0.001)
-        except:
-            cd=self.FISHING_COOLDOWN
+        cd = int(self.FISHING_COOLDOWN-self.FISHING_COOLDOWN*cd*0.001)
         # 1 hour cooldown = 3600 seconds
         return (current_time - last_fish_time) >= cd
     
     def record_fishing_notification(self, chat_id: int):
         """Записать время отправки уведомления о рыбалке"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO fishing_notifications (chat_id, last_sent)
-            VALUES (?, datetime('now'))
-        ''', (chat_id,))
-        
-        conn.commit()
-        conn.close()
+        self.repo.queue_fishing_notification(chat_id)
     
     def clear_fishing_notification(self, chat_id: int):
         """Очистить запись об отправке уведомления (когда пользователь порыбачил)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            DELETE FROM fishing_notifications WHERE chat_id = ?
-        ''', (chat_id,))
-        
-        conn.commit()
-        conn.close()
+        self.repo.queue_fishing_notification(chat_id, sent=False)
     
     def was_fishing_notification_sent(self, chat_id: int):
         """Проверить, было ли отправлено уведомление о рыбалке"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT last_sent FROM fishing_notifications WHERE chat_id = ?
-        ''', (chat_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result is not None
+        return self.repo.fishing_notification_sent(chat_id)
     
     def get_users_for_fishing_notification(self):
         """Получить список пользователей, которым нужно отправить уведомление о рыбалке"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT ts.chat_id, ts.twitch_username
-            FROM telegram_users ts
-            JOIN user_settings us ON ts.chat_id = us.chat_id
-            WHERE us.fishing_notifications = 1
-        ''')
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        return results
-    
-    RARITY_NAMES_RU = {
-        'common': 'Обычная',
-        'uncommon': 'Необычная',
-        'rare': 'Редкая',
-        'epic': 'Эпическая',
-        'legendary': 'Легендарная'
-    }
-    
-    FISHING_COOLDOWN = 3600  # 1 hour in seconds
-    CURRENCY_NAME = 'LC'  # Lonely Coins
+        return [tuple(row) for row in self.repo.get_notification_subscribers()]
     
     def get_fish_drop_chances(self):
         """Получить шансы выпадения рыбы по редкости"""
-        rarity_info = self.FISH_RARITY_WEIGHTS
-        total_weight = sum(rarity_info.values())
-        chances = {}
-        
-        for rarity, weight in rarity_info.items():
-            chance = (weight / total_weight) * 100
-            chances[rarity] = {
-                'weight': weight,
-                'chance': chance
-            }
-        
-        return chances
+        return self.fishing_engine.mode("telegram").drop_chances
 
     def info_command(self, message):
         """Обработка команды /info - показ информации о боте"""
@@ -681,503 +471,124 @@ class TelegramBot:
 
     def get_fish_data(self,message):
         """Получение данных о доступной рыбе из таблицы items с учетом редкости"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         chat_id=message.chat.id
         user_data = self.get_telegram_user(chat_id)
         twitch_username = user_data[2]
-        
-        cursor.execute('''
-            SELECT * FROM items 
-            WHERE type = 'fish'
-            ORDER BY id
-        ''')
-        
-        all_fish = cursor.fetchall()
-        conn.close()
-        
-        if not all_fish:
-            return None
-        
-        # Создаем взвешенный список рыбы на основе редкости
-        weighted_fish_pool = []
-        try:
-            fdc =self.upgrade_system.get_user_upgrades(twitch_username)
-            fish_chances = fdc.get("rare_fish_chance")
-        except:
-            fish_chances = 0
-        for fish in all_fish:
-            # fish[4] это редкость (rarity)
-            rarity = fish[4] if fish[4] else "common"
-            weight = self.FISH_RARITY_WEIGHTS.get(rarity, 1)+fish_chances
-            if fish[6] == 1:
-                continue
-            # Добавляем рыбу в пул в соответствии с её весом
-            weighted_fish_pool.extend([fish] * weight)
-        
-        # Если пул пустой, возвращаем случайную рыбу из всех доступных
-        if not weighted_fish_pool:
-            return random.choice(all_fish)
-        
-        # Возвращаем случайную рыбу из взвешенного пула
-        return random.choice(weighted_fish_pool)
+        upgrades = self.repo.get_upgrades(twitch_username)
+        return self.fishing_engine.roll("telegram", upgrades['rare_fish_chance'] or 0 if upgrades else 0)
 
     def get_duplicate_fish(self, twitch_username: str):
         """Получение дубликатов рыбы пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT item_name, COUNT(*) as count, 
-                   GROUP_CONCAT(id) as ids, 
-                   GROUP_CONCAT(rarity) as rarities,
-                   GROUP_CONCAT(value) as fish_values
-            FROM inventory 
-            WHERE username = ? AND item_type = 'fish'
-            GROUP BY item_name
-            HAVING COUNT(*) > 1
-            ORDER BY MAX(value) ASC
-        ''', (twitch_username.lower(),))
-        
-        results = cursor.fetchall()
-        conn.close()
-        return results
+        return [tuple(row) for row in self.repo.get_duplicate_items(twitch_username, 'fish')]
 
     def get_user_balance(self, twitch_username: str):
         """Получение баланса пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT balance FROM players WHERE username = ?
-        ''', (twitch_username.lower(),))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            try:
-                return int(result[0]) if result[0] is not None and result[0] != '' else 0
-            except (ValueError, TypeError):
-                return 0
-        return 0
+        return self.repo.get_balance(twitch_username)
 
     def get_user_queue_passes(self, twitch_username: str):
         """Получение количества пропусков пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT passes FROM queue_passes WHERE username = ?
-        ''', (twitch_username.lower(),))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            try:
-                return int(result[0]) if result[0] is not None and result[0] != '' else 0
-            except (ValueError, TypeError):
-                return 0
-        return 0
+        return self.repo.get_queue_passes(twitch_username)
 
-    def add_coins(self, twitch_username: str, amount: int):
-        """Добавление или вычитание монет у пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            # Получаем текущий баланс
-            cursor.execute('''
-                SELECT balance FROM players WHERE username = ?
-            ''', (twitch_username.lower(),))
-            
-            result = cursor.fetchone()
-            if not result:
-                conn.close()
-                return 0
-            
-            try:
-                current_balance = int(result[0]) if result[0] is not None and result[0] != '' else 0
-            except (ValueError, TypeError):
-                current_balance = 0
-            
-            # Обновляем баланс
-            new_balance = current_balance + amount
-            cursor.execute('''
-                UPDATE players SET balance = ? WHERE username = ?
-            ''', (new_balance, twitch_username.lower()))
-            
-            conn.commit()
-            conn.close()
-            return new_balance
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            return 0
+    def add_coins(self, twitch_username: str, amount: int, reason: str = 'other', ref=None):
+        """Добавление или вычитание монет у пользователя, reason - код причины в ledger"""
+        new_balance = self.repo.add_coins(twitch_username, amount, create=False, reason=reason, ref=ref)
+        return new_balance if new_balance is not None else 0
 
     def add_queue_pass(self, twitch_username: str, amount: int = 1):
         """Добавление пропусков в очередь пользователю"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            # Проверяем, существует ли запись
-            cursor.execute('''
-                SELECT passes FROM queue_passes WHERE username = ?
-            ''', (twitch_username.lower(),))
-            
-            result = cursor.fetchone()
-            if result:
-                # Обновляем существующую запись
-                current_passes = result[0] if result[0] is not None else 0
-                new_passes = current_passes + amount
-                cursor.execute('''
-                    UPDATE queue_passes SET passes = ? WHERE username = ?
-                ''', (new_passes, twitch_username.lower()))
-            else:
-                # Создаем новую запись
-                new_passes = amount
-                cursor.execute('''
-                    INSERT INTO queue_passes (username, passes) VALUES (?, ?)
-                ''', (twitch_username.lower(), new_passes))
-            
-            conn.commit()
-            conn.close()
-            return new_passes
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            return 0
+        new_passes = self.repo.add_queue_pass(twitch_username, amount)
+        return new_passes if new_passes is not None else 0
 
     def add_fish_to_inventory(self, twitch_username: str, fish_data: dict):
         """Добавление рыбы в инвентарь пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT INTO inventory 
-                (username, item_type, item_id, item_name, rarity, value, obtained_at)
-                VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
-            ''', (
-                twitch_username.lower(), 
-                'fish', 
-                fish_data.get('id'), 
-                fish_data.get('name'), 
-                fish_data.get('rarity'), 
-                fish_data.get('base_price'),
-            ))
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            return False
+        return self.repo.add_inventory_item(
+            twitch_username,
+            'fish',
+            fish_data.get('id'),
+            fish_data.get('name'),
+            fish_data.get('rarity'),
+            fish_data.get('base_price')
+        ) is not None
 
     def get_unique_untaken_fish(self):
         """Получение списка уникальной (ultimate) рыбы, которая еще не была поймана"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM items WHERE type = "fish" AND rarity = "ultimate" AND is_caught = 0
-        ''')
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        # Преобразуем результаты в словари
-        fish_list = []
-        for fish in results:
-            fish_dict = {
-                'id': fish[0],
-                'name': fish[1],
-                'type': fish[2],
-                'base_price': fish[3],
-                'rarity': fish[4],
-                'is_unique': fish[5],
-                'is_caught': fish[6],
-            }
-            fish_list.append(fish_dict)
-        
-        return fish_list
+        return [
+            fish._asdict() for fish in self.repo.get_fish_catalog()
+            if fish.rarity == 'ultimate' and fish.is_caught == 0
+        ]
 
     def mark_fish_as_caught(self, fish_id: int):
         """Пометить рыбу как пойманную"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE items SET is_caught = 1 WHERE id = ?
-        ''', (fish_id,))
-        
-        conn.commit()
-        conn.close()
+        self.repo.set_fish_caught(fish_id)
 
     def get_total_fish_count_by_rarity(self):
         """Получение общего количества рыб по каждой редкости"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT rarity, COUNT(*) as total_count
-            FROM items 
-            WHERE type = 'fish'
-            GROUP BY rarity
-        ''')
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        # Преобразуем в словарь
         rarity_counts = {}
-        for row in results:
-            rarity_counts[row[0]] = row[1]
-        
+        for fish in self.repo.get_fish_catalog():
+            rarity_counts[fish.rarity] = rarity_counts.get(fish.rarity, 0) + 1
         return rarity_counts
 
     def get_user_unique_fish_by_rarity(self, twitch_username: str, rarity: str):
         """Получение уникальных рыб пользователя по определенной редкости (без повторов)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT DISTINCT item_name
-            FROM inventory 
-            WHERE username = ? AND item_type = 'fish' AND rarity = ?
-            ORDER BY item_name
-        ''', (twitch_username.lower(), rarity))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        # Возвращаем список названий рыб
-        return [row[0] for row in results]
+        return self.repo.get_item_names_by_rarity(twitch_username, rarity)
 
     def get_user_fish_by_rarity(self, twitch_username: str, rarity: str):
         """Получение списка рыб пользователя по определенной редкости"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT DISTINCT item_name
-            FROM inventory 
-            WHERE username = ? AND item_type = 'fish' AND rarity = ?
-            ORDER BY item_name
-        ''', (twitch_username.lower(), rarity))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        # Возвращаем список названий рыб
-        return [row[0] for row in results]
+        return self.repo.get_item_names_by_rarity(twitch_username, rarity)
 
     def get_all_fish_names_by_rarity(self, rarity: str):
         """Получение списка всех рыб определенной редкости"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT DISTINCT name
-            FROM items 
-            WHERE type = 'fish' AND rarity = ?
-            ORDER BY name
-        ''', (rarity,))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        # Возвращаем список названий рыб
-        return [row[0] for row in results]
+        return sorted({fish.name for fish in self.repo.get_fish_catalog() if fish.rarity == rarity})
 
     def get_all_fish_with_caught_info(self):
         """Получение списка всей рыбы с информацией о том, кто её поймал (для уникальной рыбы)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Получаем все рыбы из таблицы items
-        cursor.execute('''
-            SELECT * FROM items 
-            WHERE type = 'fish'
-            ORDER BY 
-                CASE rarity
-                    WHEN 'common' THEN 1
-                    WHEN 'uncommon' THEN 2
-                    WHEN 'rare' THEN 3
-                    WHEN 'epic' THEN 4
-                    WHEN 'legendary' THEN 5
-                    WHEN 'immortal' THEN 6
-                    WHEN 'mythical' THEN 7
-                    WHEN 'arcane' THEN 8
-                    WHEN 'ultimate' THEN 9
-                END,
-                name
-        ''')
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        # Преобразуем результаты в словари
+        catalog = sorted(
+            self.repo.get_fish_catalog(),
+            key=lambda fish: (FISH_RARITY_ORDER.get(fish.rarity, len(FISH_RARITY_ORDER)), fish.name)
+        )
+        # Владельцы пойманных уникальных рыб одним запросом
+        caught_ids = [fish.id for fish in catalog if fish.rarity == 'ultimate' and fish.is_caught == 1]
+        owners = self.repo.get_fish_owners(caught_ids) if caught_ids else {}
+
         fish_list = []
-        for fish in results:
-            fish_dict = {
-                'id': fish[0],
-                'name': fish[1],
-                'type': fish[2],
-                'base_price': fish[3],
-                'rarity': fish[4],
-                'is_unique': fish[5],
-                'is_caught': fish[6],
-                'caught_by': None  # Будем заполнять позже для уникальных рыб
-            }
-            
-            # Для уникальных (ultimate) рыб проверяем, кто их поймал
-            if fish_dict['rarity'] == 'ultimate' and fish_dict['is_caught'] == 1:
-                # Ищем владельца рыбы в таблице inventory
-                owner_conn = sqlite3.connect(self.db_path)
-                owner_cursor = owner_conn.cursor()
-                owner_cursor.execute('''
-                    SELECT username FROM inventory 
-                    WHERE item_id = ? AND item_type = 'fish'
-                    LIMIT 1
-                ''', (fish_dict['id'],))
-                
-                owner_result = owner_cursor.fetchone()
-                owner_conn.close()
-                
-                if owner_result:
-                    fish_dict['caught_by'] = owner_result[0]
-                else:
+        for fish in catalog:
+            fish_dict = fish._asdict()
+            fish_dict['caught_by'] = None
+            if fish.id in caught_ids:
+                fish_dict['caught_by'] = owners.get(fish.id)
+                if fish_dict['caught_by'] is None:
                     # Если рыба помечена как пойманная, но владельца нет, исправляем это
-                    update_conn = sqlite3.connect(self.db_path)
-                    update_cursor = update_conn.cursor()
-                    update_cursor.execute('''
-                        UPDATE items 
-                        SET is_caught = 0 
-                        WHERE id = ?
-                    ''', (fish_dict['id'],))
-                    update_conn.commit()
-                    update_conn.close()
+                    self.repo.set_fish_caught(fish.id, False)
                     fish_dict['is_caught'] = 0
-            
             fish_list.append(fish_dict)
-        
+
         return fish_list
 
     def get_user_fish_collection(self, twitch_username: str):
         """Получение коллекции рыбы пользователя, сгруппированной по редкости"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT rarity, COUNT(*) as count, 
-                   COUNT(DISTINCT item_name) as unique_count
-            FROM inventory 
-            WHERE username = ? AND item_type = 'fish'
-            GROUP BY rarity
-            ORDER BY 
-                CASE rarity
-                    WHEN 'ultimate' THEN 1
-                    WHEN 'arcane' THEN 2
-                    WHEN 'mythical' THEN 3
-                    WHEN 'immortal' THEN 4
-                    WHEN 'legendary' THEN 5
-                    WHEN 'epic' THEN 6
-                    WHEN 'rare' THEN 7
-                    WHEN 'uncommon' THEN 8
-                    WHEN 'common' THEN 9
-                END
-        ''', (twitch_username.lower(),))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        # Преобразуем результаты в словари
-        collection = []
-        for row in results:
-            collection.append({
-                'rarity': row[0],
-                'total_count': row[1],
-                'unique_count': row[2]
-            })
-        
-        return collection
+        return [
+            {'rarity': row[0], 'total_count': row[1], 'unique_count': row[2]}
+            for row in self.repo.get_collection_summary(twitch_username)
+        ]
 
 
+    def get_sale_bonus(self, twitch_username: str) -> int:
+        """Надбавка к цене продажи из прокачки, в промилле"""
+        upgrades = self.upgrade_system.get_user_upgrades(twitch_username)
+        return int(upgrades.get('sale_price_increase') or 0) if upgrades else 0
+
     def sell_fish(self, fish_id: int):
         """Продажа рыбы и увеличение баланса пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            # Получаем информацию о рыбе
-            cursor.execute('''
-                SELECT * FROM inventory 
-                WHERE id = ? AND item_type = 'fish'
-            ''', (fish_id,))
-            
-            fish = cursor.fetchone()
-            if not fish:
-                conn.close()
-                return False, "Рыба не найдена"
-            
-            twitch_username = fish[1]  # имя пользователя
-            
-            # Проверяем и конвертируем стоимость рыбы
-            try:
-                fish_value = int(fish[6]) if fish[6] is not None and fish[6] != '' else 0
-            except (ValueError, TypeError):
-                fish_value = 0
-            try:
-                fish_modi=self.upgrade_system.get_user_upgrades(twitch_username)
-                fish_price += int(fish_value *fish_modi.get("sale_price_increase")*0.001)
-            except :
-                pass
-            # Получаем текущий баланс пользователя из таблицы players
-            cursor.execute('''
-                SELECT balance FROM players WHERE username = ?
-            ''', (twitch_username,))
-            
-            balance_row = cursor.fetchone()
-            if not balance_row:
-                conn.close()
-                return False, "Пользователь не найден"
-            
-            # Проверяем и конвертируем текущий баланс
-            try:
-                current_balance = int(balance_row[0]) if balance_row[0] is not None and balance_row[0] != '' else 0
-            except (ValueError, TypeError):
-                current_balance = 0
-            
-            # Удаляем рыбу из инвентаря
-            cursor.execute('''
-                DELETE FROM inventory 
-                WHERE id = ? AND item_type = 'fish'
-            ''', (fish_id,))
-            
-            if cursor.rowcount == 0:
-                conn.close()
-                return False, "Рыба не найдена"
-            
-            # Увеличиваем баланс пользователя
-            new_balance = current_balance + fish_value
-            cursor.execute('''
-                UPDATE players 
-                SET balance = ? 
-                WHERE username = ?
-            ''', (new_balance, twitch_username))
-            
-            conn.commit()
-            conn.close()
-            return True, f"Рыба продана за {fish_value} LC. Ваш баланс: {new_balance} LC"
-            
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            return False, f"Ошибка при продаже рыбы: {str(e)}"
+        fish = self.repo.get_inventory_item(fish_id, item_type='fish')
+        if not fish:
+            return False, "Рыба не найдена"
+        twitch_username = fish['username']
+        # Удаление рыбы и зачисление одной транзакцией
+        result = self.repo.sell_items(twitch_username, [fish_id], self.get_sale_bonus(twitch_username), ref=fish_id)
+        if result is None:
+            return False, "Рыба не найдена"
+        _, income, new_balance = result
+        return True, f"Рыба продана за {income} LC. Ваш баланс: {new_balance} LC"
     
     def buy_fish_item(self, chat_id, fish_id):
         """Покупка рыбы"""
@@ -1202,11 +613,7 @@ class TelegramBot:
         twitch_username = user_data[2]
         
         # Получаем информацию о рыбе
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM items WHERE id = ?', (fish_id,))
-        fish_data = cursor.fetchone()
-        conn.close()
+        fish_data = self.repo.catalog.get(fish_id)
         
         if not fish_data:
             try:
@@ -1355,11 +762,7 @@ class TelegramBot:
         twitch_username = user_data[2]
         
         # Получаем информацию о рыбе
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM items WHERE id = ?', (fish_id,))
-        fish_data = cursor.fetchone()
-        conn.close()
+        fish_data = self.repo.catalog.get(fish_id)
         
         if not fish_data:
             try:
@@ -1440,12 +843,19 @@ class TelegramBot:
                 self.user_messages[chat_id] = sent_message.message_id
             return
         
-        # Получаем баланс пользователя
-        balance = self.get_user_balance(twitch_username)
-        
-        # Проверяем, достаточно ли средств
-        if balance < fish_price:
-            message_text = f"❌ Недостаточно LC. Нужно {fish_price} LC, у вас {balance} LC"
+        # Списываем деньги, помечаем уникальную рыбу и добавляем её в инвентарь одной транзакцией
+        statements = [self.repo.inventory_item_statement(twitch_username, 'fish', fish_id, fish_name, fish_rarity, 0)]
+        if is_unique:
+            statements.insert(0, self.repo.claim_unique_fish_statement(fish_id))
+        new_balance = self.repo.purchase(twitch_username, fish_price, statements, reason='fish_purchase', ref=fish_id)
+        
+        # Покупка не прошла: не хватило средств или уникальную рыбу успели поймать
+        if new_balance is None:
+            balance = self.get_user_balance(twitch_username)
+            if is_unique and balance >= fish_price:
+                message_text = f"❌ Уникальная рыба <b>{fish_name}</b> уже кем-то поймана и не может быть куплена."
+            else:
+                message_text = f"❌ Недостаточно LC. Нужно {fish_price} LC, у вас {balance} LC"
             
             # Создаем клавиатуру
             keyboard = types.InlineKeyboardMarkup()
@@ -1487,17 +897,6 @@ class TelegramBot:
         
         # Покупка рыбы
         try:
-            # Списываем деньги
-            new_balance = self.add_coins(twitch_username, -fish_price)
-            
-            # Если рыба уникальная, помечаем как пойманную
-            if is_unique:
-                self.mark_fish_as_caught(fish_id)
-            user_data = self.get_telegram_user(chat_id)
-            twitch_username = user_data[2]
-            # Добавляем рыбу в инвентарь пользователя
-            self.add_fish_to_inventory(twitch_username, fish_dict)
-            
             # Формируем сообщение об успешной покупке
             message_text = f"🎉 Вы успешно купили рыбу: <b>{fish_name}</b>!\n"
             message_text += f"💰 Стоимость: {fish_price} LC\n"
@@ -1947,22 +1346,7 @@ class TelegramBot:
 
     def get_user_passes(self, twitch_username: str):
         """Получение количества пропусков пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT passes FROM queue_passes WHERE username = ?
-        ''', (twitch_username.lower(),))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            try:
-                return int(result[0]) if result[0] is not None and result[0] != '' else 0
-            except (ValueError, TypeError):
-                return 0
-        return 0
+        return self.repo.get_queue_passes(twitch_username)
 
     def change_setting(self, chat_id, setting_name, call_id=None):
         """Изменить конкретную настройку пользователя"""
@@ -2148,28 +1532,19 @@ class TelegramBot:
                 self.user_messages[chat_id] = sent_message.message_id
             return
         
-        # Продаем пропуск
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Продаем пропуск: списание пропуска и зачисление LC одной транзакцией
+        reward = 2250
+        try:
+            fish_modi=self.upgrade_system.get_user_upgrades(twitch_username)
+            reward += int(reward *fish_modi.get("sale_price_increase")*0.001)
+        except :
+            pass
         
         try:
-            # Уменьшаем количество пропусков на 1
-            new_passes = passes - 1
-            cursor.execute('''
-                INSERT OR REPLACE INTO queue_passes (username, passes)
-                VALUES (?, ?)
-            ''', (twitch_username.lower(), new_passes))
-            
-            # Добавляем 2250 LC на баланс
-            conn.commit()
-            conn.close()
-            reward = 2250
-            try:
-                fish_modi=self.upgrade_system.get_user_upgrades(twitch_username)
-                reward += int(reward *fish_modi.get("sale_price_increase")*0.001)
-            except :
-                pass
-            new_balance = self.add_coins(twitch_username, reward)
+            result = self.repo.sell_queue_pass(twitch_username, reward)
+            if result is None:
+                raise ValueError("пропуск уже продан")
+            new_passes, new_balance = result
                         
             # Формируем сообщение об успешной продаже
             message_text = f"✅ Вы успешно продали 1 пропуск за {reward} LC!\n"
@@ -2202,7 +1577,6 @@ class TelegramBot:
                 self.user_messages[chat_id] = sent_message.message_id
                 
         except Exception as e:
-            conn.rollback()
             message_text = f"❌ Ошибка при продаже пропуска: {str(e)}"
             keyboard = types.InlineKeyboardMarkup()
             back_button = types.InlineKeyboardButton(
@@ -2217,7 +1591,6 @@ class TelegramBot:
             except:
                 pass
         finally:
-            conn.close()
             # Кнопка возврата в меню
             menu_button = types.InlineKeyboardButton(
                 text="🏠 В меню",
@@ -2513,15 +1886,10 @@ class TelegramBot:
         
         twitch_username = user_data[2]
         
-        # Проверяем кулдаун
-        last_fish_time = self.get_user_cooldown(twitch_username)
-        if not self.can_fish(twitch_username) and twitch_username !="lonely_fr":
-            try:
-                cd_um=self.upgrade_system.get_user_upgrades(twitch_username)
-                cd=cd_um.get('fishing_cooldown_reduction', 0)
-                cd = self.FISHING_COOLDOWN-self.FISHING_COOLDOWN*cd*0.001
-            except:
-                cd=self.FISHING_COOLDOWN
+        # Проверяем кулдаун (время последней рыбалки и прокачка одним запросом)
+        last_fish_time, cd = self.repo.get_fishing_cooldown(twitch_username)
+        cd = self.FISHING_COOLDOWN-self.FISHING_COOLDOWN*cd*0.001
+        if int(time.time()) - last_fish_time < int(cd) and twitch_username !="lonely_fr":
             remaining_time = self.calculate_remaining_cooldown(last_fish_time, cd)
             hours = remaining_time // 3600
             minutes = (remaining_time % 3600) // 60
@@ -2538,20 +1906,9 @@ class TelegramBot:
                 pass
             return
         try:
-            self.add_fish_to_user(message)
-            try:
-                fish_multiply=self.upgrade_system.get_user_upgrades(twitch_username)
-                fishi_fishi = fish_multiply.get("double_catch_chance")
-                for i in range(4):
-                    if random.random() < fishi_fishi*0.001:
-                        self.add_fish_to_user(message)
-                    fishi_fishi-=1
-                    if fishi_fishi<=0:
-                        break
-            except:
-                pass
-        except:
-            pass
+            self.add_fish_to_user(message, twitch_username)
+        except Exception as e:
+            logger.error("Failed to catch fish for chat_id=%s: %s", chat_id, str(e))
         try:
             # Обновляем кулдаун пользователя
             self.update_user_cooldown(twitch_username, int(time.time()))
@@ -2570,7 +1927,8 @@ class TelegramBot:
                 pass
             logger.error(f"Database error in fish_telegram: {e}")
 
-    def add_fish_to_user(self, message):
+    def add_fish_to_user(self, message, twitch_username: str = None):
+        """Заброс: вся добыча пишется одной транзакцией и приходит одним сообщением"""
         keyboard = types.InlineKeyboardMarkup()
         # Кнопка возврата в меню
         menu_button = types.InlineKeyboardButton(
@@ -2579,11 +1937,22 @@ class TelegramBot:
         )
         keyboard.add(menu_button)
         chat_id=message.chat.id
-        user_data = self.get_telegram_user(chat_id)
-        twitch_username = user_data[2]
+        if twitch_username is None:
+            user_data = self.get_telegram_user(chat_id)
+            twitch_username = user_data[2]
         
-        fish_data = self.get_fish_data(message)
-        if not fish_data:
+        # Вся добыча заброса, уникальная рыба помечается пойманной в той же транзакции
+        result = self.fishing_engine.cast(twitch_username, "telegram")
+        if result is None:
+            logger.error("Database error while catching fish for chat_id=%s", chat_id)
+            try:
+                sent_message = self.bot.send_message(message.chat.id, "❌ Произошла ошибка при добавлении рыбы в инвентарь.", reply_markup=keyboard)
+                self.user_messages[chat_id] = sent_message.message_id
+                logger.info("Sent database error message to chat_id=%s", chat_id)
+            except Exception as e:
+                logger.error("Failed to send database error message to chat_id=%s: %s", chat_id, str(e))
+            return
+        if not result.rolled:
             logger.warning("No fish data available for chat_id=%s", chat_id)
             try:
                 sent_message = self.bot.send_message(message.chat.id, "❌ Больше нет доступной рыбы для ловли.", reply_markup=keyboard)
@@ -2593,55 +1962,34 @@ class TelegramBot:
                 logger.error("Failed to send no fish available message to chat_id=%s: %s", chat_id, str(e))
                 pass
             return
-        # Добавляем рыбу в инвентарь
-        # fish_data contains: id, name, type, base_price, rarity, is_unique, is_caught, description
-        fish_id = fish_data[0]
-        fish_name = fish_data[1] 
-        fish_type = fish_data[2]
-        fish_price = fish_data[3]
-        fish_rarity = fish_data[4]
-        is_unique = fish_data[5]
-        is_caught = fish_data[6] 
-        logger.info("User %s caught fish: %s (rarity: %s, price: %s)", twitch_username, fish_name, fish_rarity, fish_price)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            # Добавляем рыбу в инвентарь пользователя
-            cursor.execute('''
-                INSERT INTO inventory 
-                (username, item_type, item_id, item_name, rarity, value, obtained_at)
-                VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
-            ''', (twitch_username, 'fish', fish_id, fish_name, fish_rarity, fish_price))
-            
-            conn.commit()
-            if is_caught==1:
-                self.mark_fish_as_caught(fish_id)
-            catch_message = f"🎉 Вы поймали рыбу: <b>{fish_name}</b> ({self.RARITY_NAMES_RU.get(fish_rarity, fish_rarity)})!\n"
-            catch_message += f"💰 Стоимость: {fish_price} LC\n"
-            
-            try:
-                sent_message = self.bot.send_message(message.chat.id, catch_message, parse_mode='HTML', reply_markup=keyboard)
-                self.user_messages[chat_id] = sent_message.message_id
-                logger.info("Sent catch success message to chat_id=%s", chat_id)
-            except Exception as e:
-                logger.error("Failed to send catch success message to chat_id=%s: %s", chat_id, str(e))
-                pass
-        except Exception as e:
-            # Обработка ошибок базы данных
-            logger.error("Database error while catching fish for chat_id=%s: %s", chat_id, str(e))
+        if not result.catches:
+            # Уникальную рыбу успели поймать раньше
+            added_text = "😔 Рыба сорвалась с крючка, попробуйте ещё раз."
             try:
-                sent_message = self.bot.send_message(message.chat.id, "❌ Произошла ошибка при добавлении рыбы в инвентарь.", reply_markup=keyboard)
+                sent_message = self.bot.send_message(message.chat.id, added_text, reply_markup=keyboard)
                 self.user_messages[chat_id] = sent_message.message_id
-                logger.info("Sent database error message to chat_id=%s", chat_id)
             except Exception as e:
-                logger.error("Failed to send database error message to chat_id=%s: %s", chat_id, str(e))
-        finally:
-            conn.close()
-        
+                logger.error("Failed to send catch message to chat_id=%s: %s", chat_id, str(e))
+            return
         
+        for catch in result.catches:
+            logger.info("User %s caught fish: %s (rarity: %s, price: %s)", twitch_username, catch.fish.name, catch.fish.rarity, catch.value)
+        if len(result.catches) == 1:
+            catch = result.catches[0]
+            catch_message = f"🎉 Вы поймали рыбу: <b>{html.escape(catch.fish.name)}</b> ({catch.rarity_name})!\n"
+            catch_message += f"💰 Стоимость: {catch.value} {self.CURRENCY_NAME}\n"
+        else:
+            catch_message = f"🎉 Двойной улов! Вы поймали {len(result.catches)} рыб:\n"
+            for catch in result.catches:
+                catch_message += f"• <b>{html.escape(catch.fish.name)}</b> ({catch.rarity_name}) - {catch.value} {self.CURRENCY_NAME}\n"
+            catch_message += f"💰 Общая стоимость: {result.total_value} {self.CURRENCY_NAME}\n"
         
+        try:
+            sent_message = self.bot.send_message(message.chat.id, catch_message, parse_mode='HTML', reply_markup=keyboard)
+            self.user_messages[chat_id] = sent_message.message_id
+            logger.info("Sent catch success message to chat_id=%s", chat_id)
+        except Exception as e:
+            logger.error("Failed to send catch success message to chat_id=%s: %s", chat_id, str(e))
         
     def show_fish_page(self, chat_id, inventory, page):
         """Отображение страницы с рыбой"""
@@ -3733,55 +3081,22 @@ class TelegramBot:
         fish_pairs.sort(key=lambda x: x[1])  # Сортируем по стоимости (по возрастанию)
         # Оставляем один экземпляр (самый дешевый), остальные добавляем в список для удаления
         ids_to_remove = [str(fish_id) for fish_id, _ in fish_pairs[1:]]  # Все кроме первого (самого дешевого)
-        values_to_sum = [fish_value for _, fish_value in fish_pairs[1:]]  # Значения всех кроме первого (самого дешевого)
         
         if ids_to_remove:
-            deleted_count = self.remove_fish_duplicates(ids_to_remove)
-            
-            # Считаем общую стоимость дубликатов
-            total_value = sum(values_to_sum)
-            try:
-                fish_modi=self.upgrade_system.get_user_upgrades(twitch_username)
-                total_value += int(total_value *fish_modi.get("sale_price_increase")*0.001)
-            except :
-                pass
-            # Обновляем баланс пользователя
             user_data = self.get_telegram_user(chat_id)
             if user_data and user_data[2]:
                 twitch_username = user_data[2]
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                
-                try:
-                    # Получаем текущий баланс
-                    cursor.execute('''
-                        SELECT balance FROM players WHERE username = ?
-                    ''', (twitch_username,))
+                # Удаление дубликатов и зачисление одной транзакцией
+                result = self.repo.sell_items(twitch_username, ids_to_remove, self.get_sale_bonus(twitch_username),
+                                              ref=f"{len(ids_to_remove)} duplicates")
+                if result is not None:
+                    deleted_count, total_value, new_balance = result
+                    logger.info("Sold %s duplicates of user %s for %s LC, balance %s",
+                                deleted_count, twitch_username, total_value, new_balance)
                     
-                    balance_row = cursor.fetchone()
-                    if balance_row:
-                        try:
-                            current_balance = int(balance_row[0]) if balance_row[0] is not None and balance_row[0] != '' else 0
-                        except (ValueError, TypeError):
-                            current_balance = 0
-                        
-                        # Увеличиваем баланс на общую стоимость дубликатов
-                        new_balance = current_balance + total_value
-                        cursor.execute('''
-                            UPDATE players 
-                            SET balance = ? 
-                            WHERE username = ?
-                        ''', (new_balance, twitch_username))
-                        
-                        conn.commit()
-                        logger.info("Updated balance for user %s after selling duplicates: %s -> %s", twitch_username, current_balance, new_balance)
-                        
-                        message_text = f"✅ Успешно удалено {deleted_count} дубликатов.\n"
-                        message_text += f"💰 Вы получили {total_value} LC за продажу дубликатов.\n"
-                        message_text += f"💳 Ваш баланс: {new_balance} LC"
-                    else:
-                        message_text = f"✅ Успешно удалено {deleted_count} дубликатов.\n"
-                        message_text += f"💰 Вы получили {total_value} LC за продажу дубликатов."
+                    message_text = f"✅ Успешно удалено {deleted_count} дубликатов.\n"
+                    message_text += f"💰 Вы получили {total_value} LC за продажу дубликатов.\n"
+                    message_text += f"💳 Ваш баланс: {new_balance} LC"
                     
                     try:
                         self.bot.edit_message_text(
@@ -3828,9 +3143,8 @@ class TelegramBot:
                         except Exception as e:
                             logger.error("Failed to send no more duplicates message to chat_id=%s: %s", chat_id, str(e))
                             pass
-                except Exception as e:
-                    conn.rollback()
-                    logger.error("Database error while selling duplicates for chat_id=%s: %s", chat_id, str(e))
+                else:
+                    logger.error("Failed to sell duplicates for chat_id=%s", chat_id)
                     message_text = f"❌ Ошибка при продаже дубликатов. Попробуйте ещё раз."
                     try:
                         self.bot.edit_message_text(
@@ -3848,8 +3162,6 @@ class TelegramBot:
                         except Exception as e:
                             logger.error("Failed to send duplicate sale error message to chat_id=%s: %s", chat_id, str(e))
                             pass
-                finally:
-                    conn.close()
         return
     def send_fish_list(self, chat_id):
         """Отправка списка рыб (обновление)"""
@@ -4053,21 +3365,11 @@ class TelegramBot:
         
         try:
             # Получаем информацию о Лонли (lonely_fr)
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT chat_id FROM telegram_users 
-                WHERE twitch_username = ?
-            ''', ("lonely_fr",))
+            dev_chat_id = self.repo.get_chat_id("lonely_fr")
             
-            dev_result = cursor.fetchone()
-            conn.close()
-            
-            if not dev_result:
+            if not dev_chat_id:
                 self.bot.send_message(message.chat.id, "❌ Не удалось найти Лонли для отправки сообщения.")
                 return
-                
-            dev_chat_id = dev_result[0]
             
             # Формируем сообщение для Лонли
             feedback_text = "✉️ <b>Новое сообщение от пользователя</b>\n\n"
@@ -4098,27 +3400,6 @@ class TelegramBot:
             time.sleep(3)
             self.run()
 
-    def remove_fish_duplicates(self, fish_ids_to_remove: list):
-        """Удаление дубликатов рыбы, оставляя только по одному экземпляру"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Convert to integers for safety
-        fish_ids_to_remove = [int(id) for id in fish_ids_to_remove]
-        
-        # Create placeholders for the query
-        placeholders = ','.join('?' * len(fish_ids_to_remove))
-        
-        cursor.execute(f'''
-            DELETE FROM inventory 
-            WHERE id IN ({placeholders})
-        ''', fish_ids_to_remove)
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return deleted_count
-
     def duplicates_command(self, message):
         """Обработка команды /duplicates"""
         chat_id = message.chat.id
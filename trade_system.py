@@ -1,21 +1,28 @@
-import sqlite3
 import logging
 from telebot import types
 from datetime import datetime
+from migrations import run_migrations
+from repository import Repository
 
 logger = logging.getLogger(__name__)
 
+# Причины, по которым Repository.accept_trade не провёл обмен
+TRADE_ERRORS = {
+    'not_found': "❌ Обмен не найден или уже завершен.",
+    'no_requested_fish': "❌ У вас нет рыбы, которую запрашивает создатель обмена.",
+    'no_offered_fish': "❌ У создателя обмена больше нет рыбы, которую он предлагает.",
+    'creator_funds': "❌ У создателя обмена недостаточно LC.",
+}
+
 class TradeSystem:
     def __init__(self, db_path: str = 'bot_database.db'):
         self.db_path = db_path
+        self.repo = Repository(db_path)
         self.create_trades_table()
     
     def create_trades_table(self):
         """Создание таблицы для обмена"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        self.repo.create_tables('''
             CREATE TABLE IF NOT EXISTS trades (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 creator_username TEXT NOT NULL,
@@ -29,9 +36,7 @@ class TradeSystem:
                 responder_username TEXT NULL
             )
         ''')
-        
-        conn.commit()
-        conn.close()
+        run_migrations(self.db_path)
         logger.info("Trades table created or verified successfully")
     
     def add_trade_methods(self, bot_class):
@@ -332,11 +337,7 @@ class TradeSystem:
             # We'll show a selection of available fish
             
             # For now, let's get some fish from the items table
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, name FROM items WHERE type = "fish"')
-            fish_items = cursor.fetchall()
-            conn.close()
+            fish_items = [(fish.id, fish.name) for fish in self.repo.get_fish_catalog()]
             
             # Pagination variables
             items_per_page = 10
@@ -540,19 +541,12 @@ class TradeSystem:
                 return
             
             # Save trade to database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            trade_id = self.repo.create_trade(twitch_username, offered_fish, offered_coins,
+                                              requested_fish, requested_coins)
             
-            try:
-                cursor.execute('''
-                    INSERT INTO trades 
-                    (creator_username, offered_fish_id, offered_coins, requested_fish_id, requested_coins)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (twitch_username, offered_fish, offered_coins, requested_fish, requested_coins))
-                
-                conn.commit()
-                trade_id = cursor.lastrowid
-                
+            if trade_id is None:
+                message_text = "❌ Ошибка при создании обмена."
+            else:
                 # Success message
                 message_text = "✅ Предложение обмена успешно создано!\n\n"
                 message_text += f"ID обмена: {trade_id}\n"
@@ -560,13 +554,9 @@ class TradeSystem:
                 # Add details of what's being offered
                 if offered_fish:
                     # Get fish details from inventory
-                    cursor.execute('''
-                        SELECT i.item_name FROM inventory i 
-                        WHERE i.id = ?
-                    ''', (offered_fish,))
-                    fish_result = cursor.fetchone()
-                    if fish_result:
-                        message_text += f"Предложено: 🐟 {fish_result[0]}\n"
+                    fish_name = self.repo.get_inventory_item_name(offered_fish)
+                    if fish_name:
+                        message_text += f"Предложено: 🐟 {fish_name}\n"
                 
                 if offered_coins > 0:
                     message_text += f"Предложено: 💰 {offered_coins} LC\n"
@@ -574,22 +564,12 @@ class TradeSystem:
                 # Add details of what's being requested
                 if requested_fish:
                     # Get fish details from items
-                    cursor.execute('''
-                        SELECT i.name FROM items i 
-                        WHERE i.id = ?
-                    ''', (requested_fish,))
-                    fish_result = cursor.fetchone()
-                    if fish_result:
-                        message_text += f"Запрошено: 🐟 {fish_result[0]}\n"
+                    fish_name = self.repo.get_item_name(requested_fish)
+                    if fish_name:
+                        message_text += f"Запрошено: 🐟 {fish_name}\n"
                 
                 if requested_coins > 0:
                     message_text += f"Запрошено: 💰 {requested_coins} LC\n"
-                    
-            except sqlite3.Error as e:
-                message_text = f"❌ Ошибка при создании обмена: {str(e)}"
-                logger.error(f"Database error creating trade: {e}")
-            finally:
-                conn.close()
             
             # Show success message with back button
             keyboard = types.InlineKeyboardMarkup()
@@ -624,26 +604,12 @@ class TradeSystem:
             """Show active trades to the user with pagination"""
             ITEMS_PER_PAGE = 10
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # Get user's username
             user_data = self.get_telegram_user(chat_id)
             twitch_username = user_data[2] if user_data else None
             
             # Get total count of active trades (excluding user's own)
-            if twitch_username:
-                cursor.execute('''
-                    SELECT COUNT(*) FROM trades t
-                    WHERE t.status = 'active' AND t.creator_username != ?
-                ''', (twitch_username,))
-            else:
-                cursor.execute('''
-                    SELECT COUNT(*) FROM trades t
-                    WHERE t.status = 'active'
-                ''')
-                
-            total_trades = cursor.fetchone()[0]
+            total_trades = self.repo.count_active_trades(exclude=twitch_username)
             total_pages = (total_trades + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
             
             if page < 0:
@@ -654,27 +620,7 @@ class TradeSystem:
             offset = page * ITEMS_PER_PAGE
             
             # Get active trades (limit to 10 per page, excluding user's own)
-            if twitch_username:
-                cursor.execute('''
-                    SELECT t.id, t.creator_username, t.offered_fish_id, t.offered_coins, 
-                           t.requested_fish_id, t.requested_coins, t.created_at
-                    FROM trades t
-                    WHERE t.status = 'active' AND t.creator_username != ?
-                    ORDER BY t.created_at DESC
-                    LIMIT ? OFFSET ?
-                ''', (twitch_username, ITEMS_PER_PAGE, offset))
-            else:
-                cursor.execute('''
-                    SELECT t.id, t.creator_username, t.offered_fish_id, t.offered_coins, 
-                           t.requested_fish_id, t.requested_coins, t.created_at
-                    FROM trades t
-                    WHERE t.status = 'active'
-                    ORDER BY t.created_at DESC
-                    LIMIT ? OFFSET ?
-                ''', (ITEMS_PER_PAGE, offset))
-                
-            trades = cursor.fetchall()
-            conn.close()
+            trades = self.repo.get_active_trades(ITEMS_PER_PAGE, offset, exclude=twitch_username)
             
             if not trades:
                 message_text = "📭 Нет активных предложений обмена."
@@ -710,16 +656,9 @@ class TradeSystem:
                     trade_text += "Отдает: "
                     if offered_fish_id:
                         # Get fish name from inventory
-                        conn = sqlite3.connect(self.db_path)
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            SELECT i.item_name FROM inventory i 
-                            WHERE i.id = ?
-                        ''', (offered_fish_id,))
-                        fish_result = cursor.fetchone()
-                        conn.close()
-                        if fish_result:
-                            trade_text += f"🐟 {fish_result[0]} "
+                        fish_name = self.repo.get_inventory_item_name(offered_fish_id)
+                        if fish_name:
+                            trade_text += f"🐟 {fish_name} "
                     
                     if offered_coins > 0:
                         trade_text += f"💰 {offered_coins} LC "
@@ -730,16 +669,9 @@ class TradeSystem:
                     trade_text += "Просит: "
                     if requested_fish_id:
                         # Get fish name from items
-                        conn = sqlite3.connect(self.db_path)
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            SELECT i.name FROM items i 
-                            WHERE i.id = ?
-                        ''', (requested_fish_id,))
-                        fish_result = cursor.fetchone()
-                        conn.close()
-                        if fish_result:
-                            trade_text += f"🐟 {fish_result[0]} "
+                        fish_name = self.repo.get_item_name(requested_fish_id)
+                        if fish_name:
+                            trade_text += f"🐟 {fish_name} "
                     
                     if requested_coins > 0:
                         trade_text += f"💰 {requested_coins} LC "
@@ -813,16 +745,8 @@ class TradeSystem:
             
             ITEMS_PER_PAGE = 10
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # Get total count of user's trades
-            cursor.execute('''
-                SELECT COUNT(*) FROM trades t
-                WHERE t.creator_username = ?
-            ''', (twitch_username,))
-                
-            total_trades = cursor.fetchone()[0]
+            total_trades = self.repo.count_user_trades(twitch_username)
             total_pages = (total_trades + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
             
             if page < 0:
@@ -833,17 +757,7 @@ class TradeSystem:
             offset = page * ITEMS_PER_PAGE
             
             # Get user's trades (limit to 10 per page)
-            cursor.execute('''
-                SELECT t.id, t.offered_fish_id, t.offered_coins, 
-                       t.requested_fish_id, t.requested_coins, t.status, t.created_at
-                FROM trades t
-                WHERE t.creator_username = ?
-                ORDER BY t.created_at DESC
-                LIMIT ? OFFSET ?
-            ''', (twitch_username, ITEMS_PER_PAGE, offset))
-            
-            trades = cursor.fetchall()
-            conn.close()
+            trades = self.repo.get_user_trades(twitch_username, ITEMS_PER_PAGE, offset)
             
             if not trades:
                 message_text = "📭 У вас нет активных предложений обмена."
@@ -885,16 +799,9 @@ class TradeSystem:
                     trade_text += "Вы отдаете: "
                     if offered_fish_id:
                         # Get fish name from inventory
-                        conn = sqlite3.connect(self.db_path)
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            SELECT i.item_name FROM inventory i 
-                            WHERE i.id = ?
-                        ''', (offered_fish_id,))
-                        fish_result = cursor.fetchone()
-                        conn.close()
-                        if fish_result:
-                            trade_text += f"🐟 {fish_result[0]} "
+                        fish_name = self.repo.get_inventory_item_name(offered_fish_id)
+                        if fish_name:
+                            trade_text += f"🐟 {fish_name} "
                     
                     if offered_coins > 0:
                         trade_text += f"💰 {offered_coins} LC "
@@ -905,16 +812,9 @@ class TradeSystem:
                     trade_text += "Вы просите: "
                     if requested_fish_id:
                         # Get fish name from items
-                        conn = sqlite3.connect(self.db_path)
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            SELECT i.name FROM items i 
-                            WHERE i.id = ?
-                        ''', (requested_fish_id,))
-                        fish_result = cursor.fetchone()
-                        conn.close()
-                        if fish_result:
-                            trade_text += f"🐟 {fish_result[0]} "
+                        fish_name = self.repo.get_item_name(requested_fish_id)
+                        if fish_name:
+                            trade_text += f"🐟 {fish_name} "
                     
                     if requested_coins > 0:
                         trade_text += f"💰 {requested_coins} LC "
@@ -988,18 +888,8 @@ class TradeSystem:
         
         def show_respond_to_trade(self, chat_id, trade_id):
             """Show details for responding to a trade"""
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # Get trade details
-            cursor.execute('''
-                SELECT t.id, t.creator_username, t.offered_fish_id, t.offered_coins, 
-                       t.requested_fish_id, t.requested_coins, t.created_at
-                FROM trades t
-                WHERE t.id = ? AND t.status = 'active'
-            ''', (trade_id,))
-            trade = cursor.fetchone()
-            conn.close()
+            trade = self.repo.get_trade(trade_id, active_only=True)
             
             if not trade:
                 message_text = "❌ Обмен не найден или уже завершен."
@@ -1032,16 +922,9 @@ class TradeSystem:
             message_text += "Вы можете получить:\n"
             if offered_fish_id:
                 # Get fish name from inventory
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT i.item_name FROM inventory i 
-                    WHERE i.id = ?
-                ''', (offered_fish_id,))
-                fish_result = cursor.fetchone()
-                conn.close()
-                if fish_result:
-                    message_text += f"🐟 {fish_result[0]}\n"
+                fish_name = self.repo.get_inventory_item_name(offered_fish_id)
+                if fish_name:
+                    message_text += f"🐟 {fish_name}\n"
             
             if offered_coins > 0:
                 message_text += f"💰 {offered_coins} LC\n"
@@ -1049,16 +932,9 @@ class TradeSystem:
             message_text += "\nВ обмен вы должны предоставить:\n"
             if requested_fish_id:
                 # Get fish name from items
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT i.name FROM items i 
-                    WHERE i.id = ?
-                ''', (requested_fish_id,))
-                fish_result = cursor.fetchone()
-                conn.close()
-                if fish_result:
-                    message_text += f"🐟 {fish_result[0]}\n"
+                fish_name = self.repo.get_item_name(requested_fish_id)
+                if fish_name:
+                    message_text += f"🐟 {fish_name}\n"
             
             if requested_coins > 0:
                 message_text += f"💰 {requested_coins} LC\n"
@@ -1113,241 +989,14 @@ class TradeSystem:
             if not responder_username:
                 return
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            # Проверки и перенос рыбы и LC одной транзакцией, с условными списаниями
+            status, trade = self.repo.accept_trade(trade_id, responder_username, datetime.now().isoformat(' '))
             
-            try:
-                # Get trade details
-                cursor.execute('''
-                    SELECT creator_username, offered_fish_id, offered_coins, 
-                           requested_fish_id, requested_coins
-                    FROM trades 
-                    WHERE id = ? AND status = 'active'
-                ''', (trade_id,))
-                trade = cursor.fetchone()
-                
-                if not trade:
-                    message_text = "❌ Обмен не найден или уже завершен."
-                    keyboard = types.InlineKeyboardMarkup()
-                    back_button = types.InlineKeyboardButton(
-                        text="🔙 Назад к обменам",
-                        callback_data="trade_view_active"
-                    )
-                    keyboard.add(back_button)
-                    
-                    try:
-                        sent_message = self.bot.send_message(chat_id, message_text, reply_markup=keyboard)
-                        self.user_messages[chat_id] = sent_message.message_id
-                    except:
-                        pass
-                    conn.close()
-                    return
-                
-                creator_username = trade[0]
-                offered_fish_id = trade[1]  # ID из таблицы inventory
-                offered_coins = trade[2]
-                requested_fish_id = trade[3]  # ID из таблицы items
-                requested_coins = trade[4]
-                
-                # Check if responder has what's requested (рыба из таблицы items)
-                if requested_fish_id:
-                    # Для проверки нужно найти такую же рыбу в инвентаре пользователя
-                    cursor.execute('''
-                        SELECT i.id FROM inventory i
-                        JOIN items it ON i.item_id = it.id
-                        WHERE i.username = ? AND it.id = ?
-                        LIMIT 1
-                    ''', (responder_username, requested_fish_id))
-                    if not cursor.fetchone():
-                        message_text = "❌ У вас нет рыбы, которую запрашивает создатель обмена."
-                        keyboard = types.InlineKeyboardMarkup()
-                        back_button = types.InlineKeyboardButton(
-                            text="🔙 Назад к обменам",
-                            callback_data="trade_view_active"
-                        )
-                        keyboard.add(back_button)
-                        
-                        try:
-                            sent_message = self.bot.send_message(chat_id, message_text, reply_markup=keyboard)
-                            self.user_messages[chat_id] = sent_message.message_id
-                        except:
-                            pass
-                        conn.close()
-                        return
-                
-                if requested_coins > 0:
-                    cursor.execute('''
-                        SELECT balance FROM players WHERE username = ?
-                    ''', (responder_username,))
-                    balance_result = cursor.fetchone()
-                    if not balance_result or balance_result[0] < requested_coins:
-                        message_text = f"❌ У вас недостаточно LC. Требуется {requested_coins} LC."
-                        keyboard = types.InlineKeyboardMarkup()
-                        back_button = types.InlineKeyboardButton(
-                            text="🔙 Назад к обменам",
-                            callback_data="trade_view_active"
-                        )
-                        keyboard.add(back_button)
-                        
-                        try:
-                            sent_message = self.bot.send_message(chat_id, message_text, reply_markup=keyboard)
-                            self.user_messages[chat_id] = sent_message.message_id
-                        except:
-                            pass
-                        conn.close()
-                        return
-                
-                # Check if creator still has what they're offering (рыба из таблицы inventory)
-                if offered_fish_id:
-                    cursor.execute('''
-                        SELECT COUNT(*) FROM inventory 
-                        WHERE id = ? AND username = ?
-                    ''', (offered_fish_id, creator_username))
-                    if cursor.fetchone()[0] == 0:
-                        message_text = "❌ У создателя обмена больше нет рыбы, которую он предлагает."
-                        keyboard = types.InlineKeyboardMarkup()
-                        back_button = types.InlineKeyboardButton(
-                            text="🔙 Назад к обменам",
-                            callback_data="trade_view_active"
-                        )
-                        keyboard.add(back_button)
-                        
-                        try:
-                            sent_message = self.bot.send_message(chat_id, message_text, reply_markup=keyboard)
-                            self.user_messages[chat_id] = sent_message.message_id
-                        except:
-                            pass
-                        conn.close()
-                        return
-                
-                if offered_coins > 0:
-                    cursor.execute('''
-                        SELECT balance FROM players WHERE username = ?
-                    ''', (creator_username,))
-                    balance_result = cursor.fetchone()
-                    if not balance_result or balance_result[0] < offered_coins:
-                        message_text = "❌ У создателя обмена недостаточно LC."
-                        keyboard = types.InlineKeyboardMarkup()
-                        back_button = types.InlineKeyboardButton(
-                            text="🔙 Назад к обменам",
-                            callback_data="trade_view_active"
-                        )
-                        keyboard.add(back_button)
-                        
-                        try:
-                            sent_message = self.bot.send_message(chat_id, message_text, reply_markup=keyboard)
-                            self.user_messages[chat_id] = sent_message.message_id
-                        except:
-                            pass
-                        conn.close()
-                        return
-                
-                # Perform the trade
-                # 1. Transfer offered fish to responder (из inventory creator'а в inventory responder'а)
-                if offered_fish_id:
-                    cursor.execute('''
-                        UPDATE inventory 
-                        SET username = ? 
-                        WHERE id = ?
-                    ''', (responder_username, offered_fish_id))
-                
-                # 2. Transfer requested fish to creator (из inventory responder'а в inventory creator'а)
-                if requested_fish_id:
-                    # Нужно найти конкретную рыбу в инвентаре пользователя
-                    cursor.execute('''
-                        SELECT i.id FROM inventory i
-                        JOIN items it ON i.item_id = it.id
-                        WHERE i.username = ? AND it.id = ?
-                        LIMIT 1
-                    ''', (responder_username, requested_fish_id))
-                    requested_fish_inventory_id = cursor.fetchone()
-                    if requested_fish_inventory_id:
-                        cursor.execute('''
-                            UPDATE inventory 
-                            SET username = ? 
-                            WHERE id = ?
-                        ''', (creator_username, requested_fish_inventory_id[0]))
-                
-                # 3. Transfer coins
-                if offered_coins > 0:
-                    cursor.execute('''
-                        UPDATE players 
-                        SET balance = balance - ? 
-                        WHERE username = ?
-                    ''', (offered_coins, creator_username))
-                    
-                    cursor.execute('''
-                        UPDATE players 
-                        SET balance = balance + ? 
-                        WHERE username = ?
-                    ''', (offered_coins, responder_username))
-                
-                if requested_coins > 0:
-                    cursor.execute('''
-                        UPDATE players 
-                        SET balance = balance - ? 
-                        WHERE username = ?
-                    ''', (requested_coins, responder_username))
-                    
-                    cursor.execute('''
-                        UPDATE players 
-                        SET balance = balance + ? 
-                        WHERE username = ?
-                    ''', (requested_coins, creator_username))
-                
-                # 4. Mark trade as completed
-                cursor.execute('''
-                    UPDATE trades 
-                    SET status = 'completed', responder_username = ?, completed_at = ?
-                    WHERE id = ?
-                ''', (responder_username, datetime.now(), trade_id))
-                
-                conn.commit()
-                
-                # Send success messages
-                message_text = "✅ Обмен успешно завершен!\n\n"
-                message_text += f"Обмен #{trade_id} между {creator_username} и {responder_username} завершен."
-                
-                keyboard = types.InlineKeyboardMarkup()
-                back_button = types.InlineKeyboardButton(
-                    text="🔙 Назад к обменам",
-                    callback_data="trade_view_active"
-                )
-                keyboard.add(back_button)
-                
-                try:
-                    sent_message = self.bot.send_message(chat_id, message_text, reply_markup=keyboard)
-                    self.user_messages[chat_id] = sent_message.message_id
-                except:
-                    pass
-                
-                # Try to notify the creator
-                try:
-                    creator_chat_id = None
-                    cursor.execute('''
-                        SELECT chat_id FROM telegram_users WHERE twitch_username = ?
-                    ''', (creator_username,))
-                    creator_result = cursor.fetchone()
-                    if creator_result:
-                        creator_chat_id = creator_result[0]
-                        if creator_chat_id in self.user_messages:
-                            self.bot.edit_message_text(
-                                chat_id=creator_chat_id,
-                                message_id=self.user_messages[creator_chat_id],
-                                text=f"✅ Ваш обмен #{trade_id} был принят пользователем {responder_username}!"
-                            )
-                        else:
-                            self.bot.send_message(
-                                creator_chat_id,
-                                f"✅ Ваш обмен #{trade_id} был принят пользователем {responder_username}!"
-                            )
-                except Exception as e:
-                    logger.error(f"Failed to notify trade creator: {e}")
-                    
-            except sqlite3.Error as e:
-                message_text = f"❌ Ошибка при выполнении обмена: {str(e)}"
-                logger.error(f"Database error accepting trade: {e}")
-                
+            if status != 'ok':
+                if status == 'responder_funds':
+                    message_text = f"❌ У вас недостаточно LC. Требуется {trade['requested_coins']} LC."
+                else:
+                    message_text = TRADE_ERRORS.get(status, "❌ Ошибка при выполнении обмена.")
                 keyboard = types.InlineKeyboardMarkup()
                 back_button = types.InlineKeyboardButton(
                     text="🔙 Назад к обменам",
@@ -1360,8 +1009,44 @@ class TradeSystem:
                     self.user_messages[chat_id] = sent_message.message_id
                 except:
                     pass
-            finally:
-                conn.close()
+                return
+            
+            creator_username = trade['creator_username']
+            
+            # Send success messages
+            message_text = "✅ Обмен успешно завершен!\n\n"
+            message_text += f"Обмен #{trade_id} между {creator_username} и {responder_username} завершен."
+            
+            keyboard = types.InlineKeyboardMarkup()
+            back_button = types.InlineKeyboardButton(
+                text="🔙 Назад к обменам",
+                callback_data="trade_view_active"
+            )
+            keyboard.add(back_button)
+            
+            try:
+                sent_message = self.bot.send_message(chat_id, message_text, reply_markup=keyboard)
+                self.user_messages[chat_id] = sent_message.message_id
+            except:
+                pass
+            
+            # Try to notify the creator
+            try:
+                creator_chat_id = self.repo.get_chat_id(creator_username)
+                if creator_chat_id:
+                    if creator_chat_id in self.user_messages:
+                        self.bot.edit_message_text(
+                            chat_id=creator_chat_id,
+                            message_id=self.user_messages[creator_chat_id],
+                            text=f"✅ Ваш обмен #{trade_id} был принят пользователем {responder_username}!"
+                        )
+                    else:
+                        self.bot.send_message(
+                            creator_chat_id,
+                            f"✅ Ваш обмен #{trade_id} был принят пользователем {responder_username}!"
+                        )
+            except Exception as e:
+                logger.error(f"Failed to notify trade creator: {e}")
         
         def cancel_trade(self, chat_id, trade_id):
             """Cancel a trade offer"""
@@ -1371,34 +1056,14 @@ class TradeSystem:
             if not username:
                 return
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            try:
-                # Check if trade exists and belongs to user
-                cursor.execute('''
-                    SELECT COUNT(*) FROM trades 
-                    WHERE id = ? AND creator_username = ? AND status = 'active'
-                ''', (trade_id, username))
-                
-                if cursor.fetchone()[0] == 0:
-                    message_text = "❌ Обмен не найден или не принадлежит вам."
-                else:
-                    # Cancel the trade
-                    cursor.execute('''
-                        UPDATE trades 
-                        SET status = 'cancelled', completed_at = ?
-                        WHERE id = ?
-                    ''', (datetime.now(), trade_id))
-                    
-                    conn.commit()
-                    message_text = f"✅ Обмен #{trade_id} успешно отменен."
-                    
-            except sqlite3.Error as e:
-                message_text = f"❌ Ошибка при отмене обмена: {str(e)}"
-                logger.error(f"Database error cancelling trade: {e}")
-            finally:
-                conn.close()
+            # Отмена только своего активного обмена, одним условным UPDATE
+            cancelled = self.repo.cancel_trade(trade_id, username, datetime.now().isoformat(' '))
+            if cancelled is None:
+                message_text = "❌ Ошибка при отмене обмена."
+            elif not cancelled:
+                message_text = "❌ Обмен не найден или не принадлежит вам."
+            else:
+                message_text = f"✅ Обмен #{trade_id} успешно отменен."
             
             keyboard = types.InlineKeyboardMarkup()
             back_button = types.InlineKeyboardButton(
@@ -1415,19 +1080,8 @@ class TradeSystem:
         
         def show_trade_details(self, chat_id, trade_id):
             """Show detailed information about a trade"""
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # Get trade details
-            cursor.execute('''
-                SELECT t.id, t.creator_username, t.offered_fish_id, t.offered_coins, 
-                       t.requested_fish_id, t.requested_coins, t.status, t.created_at, 
-                       t.completed_at, t.responder_username
-                FROM trades t
-                WHERE t.id = ?
-            ''', (trade_id,))
-            trade = cursor.fetchone()
-            conn.close()
+            trade = self.repo.get_trade(trade_id)
             
             if not trade:
                 message_text = "❌ Обмен не найден."
@@ -1477,16 +1131,9 @@ class TradeSystem:
             message_text += "Предлагается:\n"
             if offered_fish_id:
                 # Get fish name from inventory
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT i.item_name FROM inventory i 
-                    WHERE i.id = ?
-                ''', (offered_fish_id,))
-                fish_result = cursor.fetchone()
-                conn.close()
-                if fish_result:
-                    message_text += f"🐟 {fish_result[0]}\n"
+                fish_name = self.repo.get_inventory_item_name(offered_fish_id)
+                if fish_name:
+                    message_text += f"🐟 {fish_name}\n"
             
             if offered_coins > 0:
                 message_text += f"💰 {offered_coins} LC\n"
@@ -1494,16 +1141,9 @@ class TradeSystem:
             message_text += "\nЗапрашивается:\n"
             if requested_fish_id:
                 # Get fish name from items
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT i.name FROM items i 
-                    WHERE i.id = ?
-                ''', (requested_fish_id,))
-                fish_result = cursor.fetchone()
-                conn.close()
-                if fish_result:
-                    message_text += f"🐟 {fish_result[0]}\n"
+                fish_name = self.repo.get_item_name(requested_fish_id)
+                if fish_name:
+                    message_text += f"🐟 {fish_name}\n"
             
             if requested_coins > 0:
                 message_text += f"💰 {requested_coins} LC\n"
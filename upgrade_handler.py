@@ -1,6 +1,5 @@
 import telebot
 from telebot import types
-import sqlite3
 from upgrade_system import UpgradeSystem
 
 class UpgradeHandler:
@@ -262,14 +261,4 @@ class UpgradeHandler:
     
     def get_telegram_user(self, chat_id):
         """Get Telegram user data"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            print("Connected to the database")
-            print(chat_id)
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM telegram_users WHERE chat_id = ?', (chat_id,))
-            user_data = cursor.fetchone()
-            conn.close()
-            return user_data
-        except sqlite3.Error:
-            return None
\ No newline at end of file
+        return self.upgrade_system.main_repo.get_telegram_user(chat_id)
\ No newline at end of file
@@ -2,13 +2,17 @@ import sqlite3
 import os
 import logging
 from typing import Optional, Dict, Tuple
+from repository import Repository
+from migrations import run_migrations
 
 logger = logging.getLogger(__name__)
 
 class UpgradeSystem:
-    def __init__(self, db_path: str = "upgrades.db", main_db_path: str = "bot_database.db"):
-        self.db_path = db_path
+    def __init__(self, main_db_path: str = "bot_database.db"):
+        # Upgrades live in the main database, the old upgrades.db is imported by migration 5
+        self.db_path = main_db_path
         self.main_db_path = main_db_path
+        self.main_repo = Repository(main_db_path)
         self.create_upgrades_table()
         
         # Upgrade costs configuration
@@ -52,11 +56,8 @@ class UpgradeSystem:
         }
     
     def create_upgrades_table(self):
-        """Create the upgrades table if it doesn't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        """Create the upgrades table in the main database if it doesn't exist"""
+        self.main_repo.create_tables('''
             CREATE TABLE IF NOT EXISTS upgrades (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 twitch_username TEXT UNIQUE NOT NULL,
@@ -68,9 +69,8 @@ class UpgradeSystem:
                 points_balance INTEGER DEFAULT 0
             )
         ''')
-        
-        conn.commit()
-        conn.close()
+        # Imports the old upgrades.db once
+        run_migrations(self.db_path)
         logger.info("Upgrades table initialized")
     
     def get_upgrade_cost(self, upgrade_type: str, current_level: int) -> int:
@@ -93,93 +93,30 @@ class UpgradeSystem:
     
     def get_user_upgrades(self, twitch_username: str) -> Optional[Dict]:
         """Get all upgrades for a specific user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT double_catch_chance, rare_fish_chance, fishing_cooldown_reduction,
-                   shop_discount, sale_price_increase, points_balance
-            FROM upgrades WHERE twitch_username = ?
-        ''', (twitch_username,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return {
-                'double_catch_chance': result[0],
-                'rare_fish_chance': result[1],
-                'fishing_cooldown_reduction': result[2],
-                'shop_discount': result[3],
-                'sale_price_increase': result[4],
-                'points_balance': result[5]
-            }
-        return None
+        result = self.main_repo.get_upgrades(twitch_username)
+        return dict(result) if result else None
     
     def initialize_user_upgrades(self, twitch_username: str):
         """Initialize upgrades for a new user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT OR IGNORE INTO upgrades 
-                (twitch_username, double_catch_chance, rare_fish_chance, 
-                 fishing_cooldown_reduction, shop_discount, sale_price_increase, points_balance)
-                VALUES (?, 0, 0, 0, 0, 0, 0)
-            ''', (twitch_username,))
-            
-            conn.commit()
-        except sqlite3.Error as e:
-            logger.error(f"Error initializing user upgrades for {twitch_username}: {e}")
-        finally:
-            conn.close()
+        if not self.main_repo.init_upgrades(twitch_username):
+            logger.error(f"Error initializing user upgrades for {twitch_username}")
     
     def purchase_upgrade_points(self, twitch_username: str, points_amount: int, lc_cost: int) -> Tuple[bool, str]:
         """
-        Purchase upgrade points with LC from main database
+        Purchase upgrade points with LC
         Returns (success, message)
         """
-        # First, check if user has enough LC in main database
-        try:
-            main_conn = sqlite3.connect(self.main_db_path)
-            main_cursor = main_conn.cursor()
-            
-            main_cursor.execute('SELECT balance FROM players WHERE username = ?', (twitch_username,))
-            result = main_cursor.fetchone()
-            
-            if not result or result[0] < lc_cost:
-                main_conn.close()
-                return False, "Недостаточно LC для покупки очков прокачки"
-            
-            # Deduct LC from main database
-            main_cursor.execute('UPDATE players SET balance = balance - ? WHERE username = ?', 
-                              (lc_cost, twitch_username))
-            main_conn.commit()
-            main_conn.close()
-        except sqlite3.Error as e:
-            logger.error(f"Error deducting LC for {twitch_username}: {e}")
-            return False, "Ошибка при списании LC"
+        # LC debit and points credit in one transaction
+        balance = self.main_repo.purchase(
+            twitch_username, lc_cost,
+            [self.main_repo.upgrade_points_statement(twitch_username, points_amount)],
+            reason='upgrade_points', ref=points_amount
+        )
+        if balance is None:
+            return False, "Недостаточно LC для покупки очков прокачки"
         
-        # Add points to upgrades database
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Initialize user if not exists
-            self.initialize_user_upgrades(twitch_username)
-            
-            cursor.execute('UPDATE upgrades SET points_balance = points_balance + ? WHERE twitch_username = ?',
-                          (points_amount, twitch_username))
-            
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"User {twitch_username} purchased {points_amount} upgrade points for {lc_cost} LC")
-            return True, f"Успешно куплено {points_amount} очков прокачки за {lc_cost} LC"
-        except sqlite3.Error as e:
-            logger.error(f"Error adding upgrade points for {twitch_username}: {e}")
-            return False, "Ошибка при добавлении очков прокачки"
+        logger.info(f"User {twitch_username} purchased {points_amount} upgrade points for {lc_cost} LC")
+        return True, f"Успешно куплено {points_amount} очков прокачки за {lc_cost} LC"
     
     def upgrade_skill(self, twitch_username: str, upgrade_type: str) -> Tuple[bool, str]:
         """
@@ -209,28 +146,14 @@ class UpgradeSystem:
         if user_upgrades['points_balance'] < cost:
             return False, f"Недостаточно очков прокачки. Нужно {cost} очков, у вас {user_upgrades['points_balance']}"
         
-        # Perform upgrade
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Deduct points
-            cursor.execute('UPDATE upgrades SET points_balance = points_balance - ? WHERE twitch_username = ?',
-                          (cost, twitch_username))
-            
-            # Increase upgrade level
-            cursor.execute(f'UPDATE upgrades SET {upgrade_type} = {upgrade_type} + 1 WHERE twitch_username = ?',
-                          (twitch_username,))
-            
-            conn.commit()
-            conn.close()
-            
-            new_level = current_level + 1
-            logger.info(f"User {twitch_username} upgraded {upgrade_type} to level {new_level}")
-            return True, f"Успешно улучшено: {config['name']}. Новый уровень: {new_level}"
-        except sqlite3.Error as e:
-            logger.error(f"Error upgrading skill for {twitch_username}: {e}")
+        # Deduct points and increase level with one conditional update
+        if not self.main_repo.level_up(twitch_username, upgrade_type, current_level, cost):
+            logger.error(f"Error upgrading skill {upgrade_type} for {twitch_username}")
             return False, "Ошибка при улучшении навыка"
+        
+        new_level = current_level + 1
+        logger.info(f"User {twitch_username} upgraded {upgrade_type} to level {new_level}")
+        return True, f"Успешно улучшено: {config['name']}. Новый уровень: {new_level}"
     
     def get_upgrade_info(self, upgrade_type: str) -> Optional[Dict]:
         """Get information about a specific upgrade type"""
@@ -0,0 +1,161 @@
+import atexit
+import sqlite3
+import logging
+import threading
+import time
+from collections import deque
+from db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class WriteBehindQueue:
+    """Отложенная запись: копит частые append-записи и коммитит их пачкой.
+
+    Writes are flushed in one transaction every flush_interval seconds or as
+    soon as max_batch rows are waiting. Each write may carry an overlay key and
+    value, which readers can look up until the row is committed, so a user sees
+    their own write right away.
+    """
+
+    def __init__(self, db_path: str = 'bot_database.db', flush_interval: float = 0.02, max_batch: int = 500):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pool = get_pool(db_path)
+        self._pending = deque()
+        self._overlay = {}
+        self._seq = 0
+        self._committed = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, query: str, params: tuple = (), key=None, value=True) -> int:
+        """Queue a write and return its sequence number"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            self._seq += 1
+            self._pending.append((self._seq, query, params, key))
+            if key is not None:
+                self._overlay[key] = (self._seq, value)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            return self._seq
+
+    def lookup(self, key, default=None):
+        """Value of a not yet committed write for key, or default"""
+        with self._cond:
+            entry = self._overlay.get(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def has_pending(self, key) -> bool:
+        with self._cond:
+            return key in self._overlay
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued before the call is committed"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._seq
+            self._cond.notify_all()
+            while self._committed < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Flush pending writes and stop the writer thread"""
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                # Wait a little so that a burst of writes lands in one commit
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch))]
+            self._write(batch)
+            with self._cond:
+                last_seq = batch[-1][0]
+                for seq, _, _, key in batch:
+                    entry = self._overlay.get(key)
+                    if entry is not None and entry[0] <= last_seq:
+                        del self._overlay[key]
+                self._committed = last_seq
+                self._cond.notify_all()
+
+    def _write(self, batch):
+        conn = self.pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            for _, query, params, _ in batch:
+                cursor.execute(query, params)
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Batch write of {len(batch)} rows failed, retrying one by one: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            for _, query, params, _ in batch:
+                try:
+                    conn.execute(query, params)
+                    conn.commit()
+                except sqlite3.Error as row_error:
+                    logger.error(f"Dropped write {query.split()[0:3]} {params}: {row_error}")
+                    if conn.in_transaction:
+                        conn.rollback()
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(db_path: str = 'bot_database.db') -> WriteBehindQueue:
+    """Shared write-behind queue for a database file"""
+    with _queues_lock:
+        queue = _queues.get(db_path)
+        if queue is None:
+            queue = WriteBehindQueue(db_path)
+            _queues[db_path] = queue
+        return queue
+
+
+def flush_all_queues():
+    """Commit everything queued so far, e.g. right before a restart"""
+    with _queues_lock:
+        queues = list(_queues.values())
+    for queue in queues:
+        queue.flush()
+
+
+def close_all_queues():
+    """Durability flush of every queue, called on shutdown"""
+    with _queues_lock:
+        queues = list(_queues.values())
+    for queue in queues:
+        queue.close()
+
+
+atexit.register(close_all_queues)